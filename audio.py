@@ -0,0 +1,120 @@
+import os
+import shutil
+import threading
+import wave
+from collections import namedtuple
+
+# Cue sounds by phase (0-3) and session end (4), as base names under assets/.
+SOUND_NAMES = {
+    0: 'ding_inhale',
+    1: 'ding_hold1',
+    2: 'ding_exhale',
+    3: 'ding_hold2',
+    4: 'ding_end',
+}
+# A compressed copy is preferred when one is shipped next to the WAV.
+SOUND_EXTENSIONS = ('.ogg', '.wav')
+
+# Command-line players for cues outside the app, in order of preference.
+PLAYER_COMMANDS = (('aplay', '-q'), ('paplay',), ('afplay',))
+# Command-line recorders for breath input, in order of preference: each writes
+# raw 16-bit little-endian mono at {rate} to stdout, in small periods.
+RECORDER_COMMANDS = (
+    ('arecord', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', '{rate}', '--period-time=20000'),
+    ('parec', '--raw', '--format=s16le', '--channels=1', '--rate={rate}', '--latency-msec=20'),
+    ('rec', '-q', '-t', 'raw', '-L', '-b', '16', '-e', 'signed-integer', '-c', '1', '-r', '{rate}', '-'),
+)
+
+Pcm = namedtuple('Pcm', 'rate channels sample_width data')
+
+def find_player():
+    for command in PLAYER_COMMANDS:
+        if shutil.which(command[0]):
+            return command
+    return None
+
+def find_recorder(rate):
+    for command in RECORDER_COMMANDS:
+        if shutil.which(command[0]):
+            return [part.format(rate=rate) for part in command]
+    return None
+
+def find_sound_asset(assets_dir, name):
+    for extension in SOUND_EXTENSIONS:
+        path = os.path.join(assets_dir, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_wav(path):
+    with wave.open(path, 'rb') as f:
+        return Pcm(f.getframerate(), f.getnchannels(), f.getsampwidth(), f.readframes(f.getnframes()))
+
+def write_wav(path, pcm):
+    tmp_path = path + '.tmp'
+    with wave.open(tmp_path, 'wb') as f:
+        f.setframerate(pcm.rate)
+        f.setnchannels(pcm.channels)
+        f.setsampwidth(pcm.sample_width)
+        f.writeframes(pcm.data)
+    os.replace(tmp_path, path)
+
+def decode_compressed(path):
+    # Optional: only available where the soundfile package is installed.
+    import soundfile
+    data, rate = soundfile.read(path, dtype='int16', always_2d=True)
+    return Pcm(rate, data.shape[1], 2, data.tobytes())
+
+# ============================================================================
+# PcmCache
+# ----------------------------------------------------------------------------
+# Decoded sample data keyed by (path, mtime), so each asset is decoded once per
+# process. Compressed assets are decoded into WAV files under cache_dir, which
+# later launches (and the audio backend) read instead of decoding again.
+#
+# load() keeps the samples, for callers that mix them (the track export).
+# prepare() only makes sure a WAV is there, for players that read files:
+# Kivy's SoundLoader takes a path, not sample data.
+# ============================================================================
+class PcmCache:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def key(self, path):
+        return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+    def decoded_path(self, path):
+        """ Path of a WAV holding the decoded samples of path (path itself for WAVs) """
+        if path.endswith('.wav') or not self.cache_dir:
+            return path
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f'{name}-{os.stat(path).st_mtime_ns}.wav')
+
+    def prepare(self, path):
+        """ Path of a file with path's samples that a player can read, decoding into cache_dir if need be """
+        decoded_path = self.decoded_path(path)
+        if decoded_path != path and not os.path.exists(decoded_path):
+            pcm = decode_compressed(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_wav(decoded_path, pcm)
+        return decoded_path
+
+    def load(self, path):
+        key = self.key(path)
+        with self.lock:
+            pcm = self.entries.get(key)
+        if pcm is not None:
+            return pcm
+        decoded_path = self.decoded_path(path)
+        if os.path.exists(decoded_path) and decoded_path.endswith('.wav'):
+            pcm = read_wav(decoded_path)
+        else:
+            pcm = decode_compressed(path)
+            if decoded_path != path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                write_wav(decoded_path, pcm)
+        with self.lock:
+            self.entries[key] = pcm
+        return pcm
@@ -0,0 +1,150 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# ============================================================================
+# Breath input check
+# ----------------------------------------------------------------------------
+# Runs the breath input pipeline over synthetic breathers in session time,
+# as fast as it goes: each scenario is a session, a breather (following the
+# session's cues a little late, or keeping a rhythm of its own) and the
+# background noise, with or without ramp adaptation. For each it reports
+#
+#   accuracy   share of blocks where the detected breath is what the breather
+#              did (blocks within EDGE seconds of a change are not counted)
+#   score      the mean adherence score, and the lowest ramp pace reached
+#   latency    how long a change of breath took to show in a reading, from
+#              the change to the end of the first block whose reading has it:
+#              the median and the longest
+#   block      the time to analyse one block
+#
+# and checks them against the scenario's expectations: a breather that
+# follows must score high and never slow the ramp down, one that does not
+# must score low and, with adaptation, hold the ramp, and no change may take
+# longer than the scenario allows to show. A breath rises from silence, so
+# it shows only once it is louder than the noise in its band, and that takes
+# longer the noisier the background.
+#
+#   python benchmarks/breath_check.py
+#   python benchmarks/breath_check.py --only noisy
+#
+# The exit status is 1 if an expectation is not met.
+# ============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from breath_input import BLOCK_SECONDS, SyntheticSource, track  # noqa: E402
+from session import BreathSession  # noqa: E402
+from timeline import BreathTimeline  # noqa: E402
+
+EDGE = 0.25
+MIN_ACCURACY = 0.9
+
+# name: (start cycle, end cycle, duration, follows, noise, adapt,
+#        (lowest mean score, highest mean score), lowest pace allowed or None for "must drop to 0",
+#        longest latency allowed)
+SCENARIOS = {
+    'follow-static': ([4, 7, 8, 0], [4, 7, 8, 0], 300, True, 0.005, False, (0.85, 1.0), 1.0, 0.2),
+    'follow-ramp': ([4, 8, 8, 0], [6, 10, 10, 0], 600, True, 0.005, False, (0.85, 1.0), 1.0, 0.2),
+    'follow-noisy': ([4, 7, 8, 0], [4, 7, 8, 0], 300, True, 0.03, False, (0.8, 1.0), 1.0, 0.4),
+    'follow-ramp-adapt': ([4, 8, 8, 0], [6, 10, 10, 0], 600, True, 0.005, True, (0.85, 1.0), 1.0, 0.2),
+    'own-rhythm': ([4, 8, 8, 0], [8, 12, 12, 0], 600, False, 0.005, False, (0.0, 0.6), 1.0, 0.2),
+    'own-rhythm-adapt': ([4, 8, 8, 0], [8, 12, 12, 0], 600, False, 0.005, True, (0.0, 0.7), None, 0.2),
+}
+
+def change_time(source, after, before):
+    """ When the breather's state changes between session times after and before """
+    state = source.truth(after)
+    while before - after > 1e-4:
+        middle = (after + before) / 2
+        if source.truth(middle) == state:
+            after = middle
+        else:
+            before = middle
+    return before
+
+class Following:
+    """ The session's current timeline, for a breather that follows its cues """
+    def __init__(self, session):
+        self.session = session
+
+    def state(self, t):
+        return self.session.get_timeline().state(t)
+
+def run(name):
+    start, end, duration, follows, noise, adapt = SCENARIOS[name][:6]
+    session = BreathSession(start, end, duration, use_numpy=False)
+    pattern = Following(session) if follows else BreathTimeline(start, start, float('inf'))
+    source = SyntheticSource(pattern, noise=noise)
+    counted = correct = 0
+    scores = []
+    pace = lowest_pace = 1.0
+    latencies = []
+    block_end = change = None
+    blocks = 0
+    started = time.perf_counter()
+    for reading in track(source, session.get_timeline, adapt=adapt):
+        if reading.time >= duration:
+            break
+        blocks += 1
+        # A reading is there once its block has been recorded.
+        previous_end, block_end = block_end, reading.time + BLOCK_SECONDS / 2
+        if previous_end is not None and source.truth(block_end) != source.truth(previous_end):
+            # A change missed until the next one counts up to that one.
+            if change is not None:
+                latencies.append(block_end - change[0])
+            change = change_time(source, previous_end, block_end), source.truth(block_end)
+        if change is not None and reading.state == change[1]:
+            latencies.append(block_end - change[0])
+            change = None
+        if reading.pace != pace:
+            pace = reading.pace
+            lowest_pace = min(lowest_pace, pace)
+            session.set_ramp_pace(pace, reading.time)
+        truth = source.truth(reading.time)
+        if source.truth(reading.time - EDGE) == truth == source.truth(reading.time + EDGE):
+            counted += 1
+            correct += reading.state == truth
+        if reading.score is not None:
+            scores.append(reading.score)
+    seconds = time.perf_counter() - started
+    return {
+        'accuracy': correct / counted,
+        'score': sum(scores) / len(scores),
+        'pace': lowest_pace,
+        'latency': statistics.median(latencies),
+        'max_latency': max(latencies),
+        'block_us': seconds / blocks * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Check breath detection and adherence on synthetic breathing.')
+    parser.add_argument('--only', action='append', help='run scenarios whose name contains this (repeatable)')
+    args = parser.parse_args()
+
+    failed = False
+    for name, scenario in SCENARIOS.items():
+        if args.only and not any(part in name for part in args.only):
+            continue
+        (low, high), lowest_pace, max_latency = scenario[6:9]
+        result = run(name)
+        problems = []
+        if result['accuracy'] < MIN_ACCURACY:
+            problems.append('accuracy')
+        if not low <= result['score'] <= high:
+            problems.append('score')
+        if (result['pace'] != 0.0) if lowest_pace is None else (result['pace'] < lowest_pace):
+            problems.append('pace')
+        if result['max_latency'] > max_latency:
+            problems.append('latency')
+        print(f'{name:18} accuracy {result["accuracy"]:5.1%}  score {result["score"]:5.1%}'
+              f'  pace {result["pace"]:4.2f}  latency {result["latency"] * 1000:3.0f}/{result["max_latency"] * 1000:3.0f} ms'
+              f'  block {result["block_us"]:5.0f} us' + ('  ' + ', '.join(problems) if problems else '  ok'))
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
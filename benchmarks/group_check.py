@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# ============================================================================
+# Group session check
+# ----------------------------------------------------------------------------
+# Starts a GroupServer with a running session, connects many clients from
+# several local processes, pauses the session while they are connected, and
+# checks that every client got the pause and computes the server's session
+# time. All processes share the machine's monotonic clock, so the true
+# offset is zero and each client's error can be measured directly.
+#
+#   python benchmarks/group_check.py --processes 8 --clients 50
+#
+# The exit status is 1 if a client is missing, behind, or off by more than
+# --tolerance milliseconds.
+# ============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from group_session import GroupServer, session_time_at  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description='Check group session clients against a server.')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=50, help='clients per process')
+    parser.add_argument('--seconds', type=float, default=3.0, help='how long each client stays connected')
+    parser.add_argument('--tolerance', type=float, default=5.0, help='largest session time error, in ms')
+    args = parser.parse_args()
+
+    server = GroupServer('127.0.0.1', 0)
+    server.start_in_thread()
+    server.start_session([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60)
+    command = [sys.executable, os.path.join(ROOT, 'group_session.py'), 'clients', f'127.0.0.1:{server.port}',
+               '--count', str(args.clients), '--seconds', str(args.seconds)]
+    processes = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for _ in range(args.processes)]
+    # Pause half-way, once everyone should be connected, and resume right away:
+    # the clients must all pick up the new anchor.
+    time.sleep(args.seconds / 2)
+    server.pause()
+    time.sleep(0.1)
+    server.resume()
+    reports = [json.loads(process.communicate()[0]) for process in processes]
+    final = server.state
+    server.stop()
+
+    total = args.processes * args.clients
+    connected = sum(report['connected'] for report in reports)
+    errors = []
+    behind = 0
+    round_trips = []
+    for report in reports:
+        expected = session_time_at(final, report['at'])
+        for version, t, rtt in zip(report['versions'], report['session_times'], report['round_trips']):
+            if version != [final.session, final.version] or t is None:
+                behind += 1
+                continue
+            errors.append(abs(t - expected) * 1000)
+            round_trips.append(rtt * 1000)
+    errors.sort()
+    round_trips.sort()
+    print(f'{connected}/{total} clients connected, {behind} without the latest state')
+    if errors:
+        print(f'session time error: median {errors[len(errors) // 2]:.3f} ms, max {errors[-1]:.3f} ms')
+        print(f'best round trip: median {round_trips[len(round_trips) // 2]:.3f} ms, max {round_trips[-1]:.3f} ms')
+    failed = connected < total or behind or not errors or errors[-1] > args.tolerance
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
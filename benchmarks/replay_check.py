@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# ============================================================================
+# Session replay check
+# ----------------------------------------------------------------------------
+# Replays whole sessions through the session core in simulated time: a
+# BreathSession advanced frame by frame as AnimatedCircle advances it, the
+# cue scheduler's decisions (CueScheduler.next_cue) made against the same
+# CueClock, and low-power stretches caught up the same way, all driven by a
+# SimulatedClock instead of Kivy's. A 30-minute session takes well under a
+# second.
+#
+# A scenario is a session and a frame timing profile:
+#
+#   steady   frames at 60 Hz
+#   jitter   frames 8-25 ms apart, with the odd dropped frame
+#   stalls   60 Hz with frame hitches of up to 3 s
+#   pauses   60 Hz with stretches in low-power mode (app paused, eyes closed)
+#
+# and yields a compact trace: each phase transition (clock and session time,
+# countdown, breaths, ring radii), each cue (when it started and when it was
+# due), every skip of the countdown by more than a second, and the end. The
+# traces are compared with the golden ones in benchmarks/golden/. Besides,
+# every cue must be heard within CUE_TOLERANCE of its boundary and, at every
+# frame, the session time may not drift from the clock by more than
+# DRIFT_TOLERANCE.
+#
+#   python benchmarks/replay_check.py                compare with the golden traces
+#   python benchmarks/replay_check.py --only pauses  the matching scenarios
+#   python benchmarks/replay_check.py --update       store the traces as golden
+#
+# The exit status is 1 on a mismatch or a tolerance exceeded.
+# ============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+sys.path.insert(0, ROOT)
+
+from cues import END_CUE, MAX_WAIT, CueScheduler  # noqa: E402
+from session import BreathSession, CueClock  # noqa: E402
+
+FRAME = 1 / 60
+# Smallest step of the simulated scheduler's clock, so that it cannot stall
+# on a wait shorter than the clock's resolution.
+MIN_WAIT = 1e-6
+CUE_TOLERANCE = 0.001
+DRIFT_TOLERANCE = 0.001
+# Traces store times to 0.1 ms and radii to 0.001; values within twice that
+# of the golden ones match.
+TIME_DIGITS = 4
+RADIUS_DIGITS = 3
+MATCH_TOLERANCE = 2e-4
+
+# ============================================================================
+# Frame timing profiles
+# ----------------------------------------------------------------------------
+# Each yields (seconds, low_power) pairs for ever: the time until the next
+# frame, or, with low_power, a stretch without frames.
+# ============================================================================
+def steady(rng):
+    while True:
+        yield FRAME, False
+
+def jitter(rng):
+    while True:
+        dt = rng.uniform(0.008, 0.025)
+        if rng.random() < 0.01:
+            dt += FRAME * rng.randint(1, 3)
+        yield dt, False
+
+def stalls(rng):
+    while True:
+        if rng.random() < 1 / 2000:
+            yield rng.uniform(0.5, 3.0), False
+        else:
+            yield FRAME, False
+
+def pauses(rng):
+    while True:
+        for _ in range(rng.randint(1000, 4000)):
+            yield FRAME, False
+        yield rng.uniform(5.0, 90.0), True
+
+PROFILES = {'steady': steady, 'jitter': jitter, 'stalls': stalls, 'pauses': pauses}
+
+# name: (start cycle, end cycle, duration, profile, cue latency)
+SCENARIOS = {
+    'ramp-steady': ([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60, 'steady', 0.0),
+    'ramp-jitter': ([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60, 'jitter', 0.0),
+    'ramp-stalls': ([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60, 'stalls', 0.0),
+    'ramp-pauses': ([3, 7, 7, 0], [5, 9, 9, 0], 20 * 60, 'pauses', 0.0),
+    'static-latency': ([4, 7, 8, 0], [4, 7, 8, 0], 5 * 60, 'jitter', 0.08),
+}
+
+class SimulatedClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+# ============================================================================
+# Replay
+# ============================================================================
+class Replay:
+    def __init__(self, start_cycle_time, end_cycle_time, duration, latency=0.0):
+        self.clock = SimulatedClock()
+        self.session = BreathSession(start_cycle_time, end_cycle_time, duration, use_numpy=False)
+        self.local_clock = CueClock(self.session, self.clock)
+        self.latency = latency
+        self.low_power = False
+        self.cued = -1
+        self.wake_at = 0.0
+        self.ended = False
+        self.frames = 0
+        self.shown_duration = None
+        self.max_drift = 0.0
+        self.max_cue_error = 0.0
+        self.trace = {'phases': [], 'cues': [], 'countdown_skips': [], 'end': None}
+
+    def record_phase(self, phase, session_time, radii):
+        session = self.session
+        self.trace['phases'].append([round(self.clock.t, TIME_DIGITS), round(session_time, TIME_DIGITS), phase,
+                                     int(session.duration), session.breaths,
+                                     [round(r, RADIUS_DIGITS) for r in radii]])
+
+    def run_cues(self, until):
+        """ What the scheduler's thread does until the clock reaches until """
+        session = self.session
+        end = session.end()
+        now = self.clock.t
+        while not self.ended and self.wake_at <= until:
+            self.clock.t = max(now, self.wake_at)
+            t = self.local_clock() + self.latency
+            current, due = CueScheduler.next_cue(session.get_timeline(), t, end, self.cued)
+            if current is None:
+                self.wake_at = self.clock.t + max(min(due - t, MAX_WAIT), MIN_WAIT)
+                continue
+            # The session runs 1:1 with the clock from 0, so the clock says
+            # when the boundary really is. A cue due within the latency of the
+            # start cannot start early enough.
+            error = self.clock.t + self.latency - due
+            if due >= self.latency:
+                self.max_cue_error = max(self.max_cue_error, abs(error))
+            self.trace['cues'].append([round(self.clock.t, TIME_DIGITS), current, round(due, TIME_DIGITS),
+                                       round(error * 1000, 3)])
+            if self.local_clock.cue_played(current, self.low_power):
+                self.record_phase(current, due, session.get_timeline().state(due).radii)
+            if current == END_CUE:
+                self.ended = True
+            else:
+                self.cued = current
+
+    def frame(self, dt):
+        """ A frame, through the same CueClock.frame as AnimatedCircle.animate_circle; False once it has ended """
+        session = self.session
+        self.frames += 1
+        last_phase = session.last_phase
+        state = self.local_clock.frame(dt)
+        if session.counts_down():
+            shown_duration = int(session.duration)
+            if self.shown_duration is not None and self.shown_duration - shown_duration > 1:
+                self.trace['countdown_skips'].append([round(self.clock.t, TIME_DIGITS), self.shown_duration,
+                                                      shown_duration])
+            self.shown_duration = shown_duration
+        if state is None:
+            return False
+        t = session.session_time()
+        self.max_drift = max(self.max_drift, abs(t - self.clock.t))
+        if session.last_phase != last_phase:
+            self.record_phase(state.phase, t, state.radii)
+        return True
+
+    def run(self, profile, seed=1):
+        session = self.session
+        session.rewind()
+        self.local_clock.anchor()
+        running = True
+        stretches = 0
+        stale_dt = 0.0
+        for seconds, low_power in profile(random.Random(seed)):
+            until = self.clock.t + seconds
+            self.low_power = low_power
+            self.run_cues(until)
+            self.clock.t = until
+            if low_power:
+                # No frames meanwhile; the session is caught up afterwards.
+                # Whether Kivy's next dt includes the stretch depends on
+                # whether its clock stopped, so alternate (see CueClock).
+                self.low_power = False
+                self.local_clock.catch_up()
+                stretches += 1
+                stale_dt = seconds if stretches % 2 else 0.0
+                continue
+            if running:
+                running = self.frame(seconds + stale_dt)
+                stale_dt = 0.0
+            if not running and self.ended:
+                break
+        self.trace['end'] = {
+            'clock': round(self.clock.t, TIME_DIGITS),
+            'frames': self.frames,
+            'breaths': session.breaths,
+            'elapsed': round(session.elapsed, TIME_DIGITS),
+        }
+        return self.trace
+
+def replay(name):
+    start_cycle_time, end_cycle_time, duration, profile, latency = SCENARIOS[name]
+    scenario = Replay(start_cycle_time, end_cycle_time, duration, latency)
+    started = time.perf_counter()
+    trace = scenario.run(PROFILES[profile])
+    return scenario, trace, time.perf_counter() - started
+
+# ============================================================================
+# Golden traces
+# ============================================================================
+def golden_path(name):
+    return os.path.join(GOLDEN_DIR, f'{name}.json')
+
+def write_trace(path, trace):
+    # One event per line, so that a changed golden trace diffs readably.
+    lines = ['{']
+    for key in ('phases', 'cues', 'countdown_skips'):
+        events = ',\n'.join('  ' + json.dumps(event) for event in trace[key])
+        lines.append(f' "{key}": [\n{events}\n ],' if events else f' "{key}": [],')
+    lines.append(f' "end": {json.dumps(trace["end"])}')
+    lines.append('}')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def differences(trace, golden, path=''):
+    """ Where trace differs from golden, as readable strings """
+    if isinstance(golden, dict) and isinstance(trace, dict):
+        found = []
+        for key in golden.keys() | trace.keys():
+            found += differences(trace.get(key), golden.get(key), f'{path}.{key}')
+        return found
+    if isinstance(golden, list) and isinstance(trace, list):
+        if len(trace) != len(golden):
+            return [f'{path}: {len(trace)} entries, golden {len(golden)}']
+        found = []
+        for i, (a, b) in enumerate(zip(trace, golden)):
+            found += differences(a, b, f'{path}[{i}]')
+            if found:
+                break  # The first difference usually explains the rest
+        return found
+    if isinstance(golden, (int, float)) and isinstance(trace, (int, float)):
+        return [] if abs(trace - golden) <= MATCH_TOLERANCE else [f'{path}: {trace}, golden {golden}']
+    return [] if trace == golden else [f'{path}: {trace}, golden {golden}']
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay sessions in simulated time and compare their traces.')
+    parser.add_argument('--only', action='append', help='run scenarios whose name contains this (repeatable)')
+    parser.add_argument('--update', action='store_true', help='store the traces as the golden ones')
+    args = parser.parse_args()
+
+    failed = False
+    for name in SCENARIOS:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        scenario, trace, seconds = replay(name)
+        line = (f'{name:16} {scenario.frames:7d} frames {len(trace["cues"]):4d} cues in {seconds * 1000:6.0f} ms'
+                f'  cue error {scenario.max_cue_error * 1000:.3f} ms  drift {scenario.max_drift * 1000:.3f} ms')
+        problems = []
+        if scenario.max_cue_error > CUE_TOLERANCE:
+            problems.append('cue error')
+        if scenario.max_drift > DRIFT_TOLERANCE:
+            problems.append('drift')
+        if args.update:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            write_trace(golden_path(name), trace)
+        elif not os.path.exists(golden_path(name)):
+            problems.append('no golden trace')
+        else:
+            with open(golden_path(name), 'r') as f:
+                golden = json.load(f)
+            # Through JSON, so that both sides hold the same types.
+            found = differences(json.loads(json.dumps(trace)), golden)
+            if found:
+                problems.append('differs from golden: ' + '; '.join(found[:3]))
+        print(line + ('  ' + ', '.join(problems) if problems else '  ok'))
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,430 @@
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# ============================================================================
+# Headless benchmarks for the animation and UI hot paths
+# ----------------------------------------------------------------------------
+# Runs without a display: Kivy's mock GL backend behind SDL's offscreen video
+# driver. Each benchmark times one operation over a number of calls, repeated
+# a few times, and reports the median and best per-call time in microseconds
+# (milliseconds for cold start).
+#
+#   python benchmarks/run.py                     run all, compare with baseline
+#   python benchmarks/run.py --only editor       run the matching benchmarks
+#   python benchmarks/run.py --output out.json   also write the results
+#   python benchmarks/run.py --update-baseline   store the results as baseline
+#
+# A benchmark regresses when its best time exceeds the baseline's best time
+# times its threshold (baseline.json "thresholds", by name or "default"); the
+# exit status is then 1. The best of the repeats is compared rather than the
+# median because it is far less sensitive to other load on the machine.
+# Baselines are only comparable on the machine that recorded them, so record
+# one per build machine before relying on the check.
+# ============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 1.5
+DEFAULT_SIZES = (10, 100, 1000)
+REPEATS = 5
+
+HEADLESS_ENV = {
+    'KIVY_GL_BACKEND': 'mock',
+    'SDL_VIDEODRIVER': 'offscreen',
+    'SDL_AUDIODRIVER': 'dummy',
+    'KIVY_NO_ARGS': '1',
+    'KIVY_NO_CONSOLELOG': '1',
+    'KIVY_NO_FILELOG': '1',
+}
+for key, value in HEADLESS_ENV.items():
+    os.environ.setdefault(key, value)
+sys.path.insert(0, ROOT)
+
+from kivy.config import Config  # noqa: E402
+
+# Clock.tick() would otherwise sleep to hold 60 fps.
+Config.set('graphics', 'maxfps', '0')
+
+BENCHMARKS = []
+
+def benchmark(name, sized=False):
+    def register(function):
+        BENCHMARKS.append((name, sized, function))
+        return function
+    return register
+
+def measure(call, calls, repeats=REPEATS, setup=None):
+    """ Per-call times in microseconds, one per repeat """
+    samples = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for i in range(calls):
+            call(i)
+        samples.append((time.perf_counter() - start) / calls * 1e6)
+    return samples
+
+def summary(samples, calls, unit='us'):
+    return {
+        'unit': unit,
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'calls': calls,
+        'repeats': len(samples),
+    }
+
+# ============================================================================
+# Fixtures
+# ============================================================================
+class Fixtures:
+    def __init__(self):
+        from kivy.app import App
+        self.data_dir = tempfile.mkdtemp(prefix='breathe3-bench-')
+        data_dir = self.data_dir
+
+        class BenchmarkApp(App):
+            @property
+            def user_data_dir(self):
+                return data_dir
+        self.app = BenchmarkApp()
+        App._running_app = self.app
+        self.root = None
+
+    def layout(self):
+        """ The main layout with its settings panel built, as after startup """
+        if self.root is None:
+            import main
+            from kivy.core.window import Window
+            self.root = main.MainAppLayout()
+            self.app.root = self.root
+            Window.add_widget(self.root)
+            self.root.size = (720, 1280)
+            self.root.animated_circle.size = (720, 1024)
+            self.root.build_settings()
+            self.tick(5)
+        return self.root
+
+    def preset_store(self, n):
+        from presets_store import PresetStore
+        path = os.path.join(self.data_dir, f'presets-{n}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        store = PresetStore(path)
+        store.save(upserts=[(None, f'Preset {i}', ([4, 8, 8, i % 4], [6, 10, 10, i % 4], 600 + i))
+                            for i in range(n - len(store.page(0, n)))])
+        return store
+
+    @staticmethod
+    def tick(frames=1):
+        from kivy.clock import Clock
+        for _ in range(frames):
+            Clock.tick()
+
+# ============================================================================
+# Benchmarks
+# ============================================================================
+@benchmark('animate_circle')
+def bench_animate_circle(fixtures):
+    circle = fixtures.layout().animated_circle
+    circle.selected_duration = circle.duration = 30 * 60
+    circle.toggle_animation(True)
+    calls = 2000
+    try:
+        return summary(measure(lambda i: circle.animate_circle(1 / 60), calls), calls)
+    finally:
+        circle.toggle_animation(False)
+        circle.duration = circle.selected_duration
+
+@benchmark('animate_circle_instrumented')
+def bench_animate_circle_instrumented(fixtures):
+    from instrumentation import instrumentation
+    instrumentation.set_enabled(True)
+    try:
+        return bench_animate_circle(fixtures)
+    finally:
+        instrumentation.set_enabled(False)
+
+@benchmark('update_canvas')
+def bench_update_canvas(fixtures):
+    from timeline import ring_radii
+    circle = fixtures.layout().animated_circle
+    frames = [ring_radii(phase, x / 100) for phase in range(4) for x in range(100)]
+
+    def call(i):
+        circle.radius_a, circle.radius_b, circle.radius_c, circle.radius_d, circle.radius_e = frames[i % len(frames)]
+        circle.update_canvas()
+    calls = 2000
+    return summary(measure(call, calls), calls)
+
+@benchmark('update_canvas_unchanged')
+def bench_update_canvas_unchanged(fixtures):
+    circle = fixtures.layout().animated_circle
+    circle.update_canvas()
+    calls = 5000
+    return summary(measure(lambda i: circle.update_canvas(), calls), calls)
+
+@benchmark('update_canvas_shader')
+def bench_update_canvas_shader(fixtures):
+    from shader_rings import ShaderRings
+    circle = fixtures.layout().animated_circle
+    # Under the mock GL backend the shader does not compile, but the uniform
+    # updates that make up the per-frame cost still run.
+    circle.ring_renderer = ShaderRings(circle, circle.ring_colors)
+
+    def call(i):
+        circle.session.phase = i % 4
+        circle.session.progress = (i % 100) / 100
+        circle.update_canvas()
+    calls = 2000
+    try:
+        return summary(measure(call, calls), calls)
+    finally:
+        circle.ring_renderer = None
+
+@benchmark('update_canvas_particles')
+def bench_update_canvas_particles(fixtures):
+    from main import PARTICLE_BUDGETS
+    circle = fixtures.layout().animated_circle
+    circle.particle_budget = max(PARTICLE_BUDGETS)
+    circle.use_renderer('particles')
+
+    def call(i):
+        circle.session.phase = i % 4
+        circle.session.progress = (i % 100) / 100
+        circle.session.cycle_progress = (i % 400) / 400
+        circle.update_canvas()
+    calls = 1000
+    try:
+        return summary(measure(call, calls), calls)
+    finally:
+        circle.use_renderer('ellipses')
+        circle.particle_budget = PARTICLE_BUDGETS[0]
+
+@benchmark('cycle_slider_drag')
+def bench_cycle_slider_drag(fixtures):
+    root = fixtures.layout()
+    slider = root.sliders[1]
+    original = slider.value
+    # A drag: small steps that cross a whole second every 20 events.
+    positions = [5 + (i % 200) * 0.05 for i in range(200)]
+    calls = 1000
+    try:
+        return summary(measure(lambda i: setattr(slider, 'value', positions[i % len(positions)]), calls), calls)
+    finally:
+        slider.value = original
+
+@benchmark('duration_slider_drag')
+def bench_duration_slider_drag(fixtures):
+    root = fixtures.layout()
+    slider = root.duration_slider
+    original = slider.value
+    positions = [300 + (i % 400) * 0.5 for i in range(400)]
+    calls = 1000
+    try:
+        return summary(measure(lambda i: setattr(slider, 'value', positions[i % len(positions)]), calls), calls)
+    finally:
+        slider.value = original
+
+@benchmark('circle_drag_frame')
+def bench_circle_drag_frame(fixtures):
+    # One frame of a fast drag around the circle: a burst of move events, then
+    # the single refresh (labels, sliders, save request) the frame ends with.
+    circle = fixtures.layout().animated_circle
+    original = circle.selected_duration
+    events = 20
+    angles = [i * 0.01 for i in range(events + 1)]
+    positions = [(circle.center_x + 100 * math.cos(a), circle.center_y + 100 * math.sin(a)) for a in angles]
+
+    def call(i):
+        # Alternate directions so that the duration stays in range.
+        path = positions if i % 2 else positions[::-1]
+        circle.initial_touch_pos = path[0]
+        for pos in path[1:]:
+            circle.handle_touch_movement(pos)
+            circle.initial_touch_pos = pos
+        circle.model.notify()
+    calls = 200
+    try:
+        return summary(measure(call, calls), calls)
+    finally:
+        circle.model.select_duration(original)
+        circle.model.notify()
+
+@benchmark('editor_open', sized=True)
+def bench_editor_open(fixtures, n):
+    from presets_editor import EditPresetsPopup
+    store = fixtures.preset_store(n)
+
+    def call(i):
+        # Build, lay out and draw the first rows, as when the user taps Edit.
+        popup = EditPresetsPopup(store=store)
+        popup.open(animation=False)
+        fixtures.tick()
+        popup.dismiss(animation=False)
+        fixtures.tick()
+    calls = 10
+    return summary(measure(call, calls), calls)
+
+@benchmark('create_preset_buttons', sized=True)
+def bench_create_preset_buttons(fixtures, n):
+    root = fixtures.layout()
+    store = fixtures.preset_store(n)
+    root.preset_store = store
+    root.preset_bar.show(store)
+    # Nothing changed: the cost of re-reading the shown page and diffing it.
+    calls = 200
+    return summary(measure(lambda i: root.create_preset_buttons(), calls), calls)
+
+@benchmark('preset_bar_open', sized=True)
+def bench_preset_bar_open(fixtures, n):
+    from kivy.core.window import Window
+    from preset_bar import BAR_HEIGHT, PresetBar
+    from preset_thumbnails import PresetThumbnails
+    store = fixtures.preset_store(n)
+    thumbnails = PresetThumbnails(os.path.join(fixtures.data_dir, 'thumbnails'))
+
+    def call(i):
+        # A fresh bar with no previews uploaded, as when the settings open: the
+        # UI thread's share only, the previews come from the worker later.
+        thumbnails.textures.clear()
+        bar = PresetBar(print, print, thumbnails, size_hint=(None, None), size=(720, BAR_HEIGHT))
+        Window.add_widget(bar)
+        bar.show(store)
+        fixtures.tick()
+        Window.remove_widget(bar)
+    calls = 20
+    return summary(measure(call, calls), calls)
+
+@benchmark('render_thumbnail')
+def bench_render_thumbnail(fixtures):
+    from preset_thumbnails import render_thumbnail
+    from timeline import get_numpy
+    np = get_numpy()
+    # The worker thread's cost of a preview that is not cached yet.
+    calls = 200
+    return summary(measure(lambda i: render_thumbnail(np, ([4, 8, 8, i % 4], [6, 10, 10, 0], 1800)), calls), calls)
+
+@benchmark('breath_block')
+def bench_breath_block(fixtures):
+    from breath_input import RATE, BreathTracker, SyntheticSource
+    from timeline import BreathTimeline
+    timeline = BreathTimeline([4, 8, 8, 0], [6, 10, 10, 0], 1800)
+    tracker = BreathTracker(RATE, adapt=True)
+    frames = tracker.analyzer.block_frames
+    source = SyntheticSource(timeline)
+    blocks = [source.read(frames) for _ in range(250)]
+    # The monitor thread's work per block of microphone input.
+    calls = 2000
+    return summary(measure(lambda i: tracker.process(blocks[i % len(blocks)], i * tracker.block_seconds, timeline),
+                           calls), calls)
+
+@benchmark('cold_start')
+def bench_cold_start(fixtures):
+    """ Start main.py in a fresh process until its first frame """
+    samples = []
+    wall_samples = []
+    config_home = tempfile.mkdtemp(prefix='breathe3-bench-home-')
+    env = dict(os.environ, BREATHE3_STARTUP_PROFILE='exit', XDG_CONFIG_HOME=config_home)
+    for repeat in range(REPEATS + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'main.py'], cwd=ROOT, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wall_ms = (time.perf_counter() - start) * 1000
+        reports = glob.glob(os.path.join(config_home, '*', 'startup_report.json'))
+        if not reports:
+            raise RuntimeError('main.py exited without a startup report')
+        with open(reports[0]) as f:
+            total_ms = json.load(f)['total_ms']
+        if repeat:  # The first run also creates the data directory and caches.
+            samples.append(total_ms)
+            wall_samples.append(wall_ms)
+    result = summary(samples, 1, unit='ms')
+    result['wall_median'] = statistics.median(wall_samples)
+    return result
+
+# ============================================================================
+# Baseline comparison
+# ============================================================================
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'thresholds': {'default': DEFAULT_THRESHOLD}, 'results': {}}
+
+def compare(results, baseline):
+    """ Print a table; returns the names of benchmarks that regressed """
+    thresholds = baseline.get('thresholds', {})
+    regressions = []
+    for name, result in results.items():
+        line = f"{name:<32} {result['median']:10.1f} {result['unit']} (best {result['min']:.1f})"
+        base = baseline.get('results', {}).get(name)
+        if base:
+            threshold = thresholds.get(name, thresholds.get('default', DEFAULT_THRESHOLD))
+            ratio = result['min'] / base['min'] if base['min'] else 1.0
+            line += f"  {ratio:6.2f}x baseline"
+            if ratio > threshold:
+                line += f'  REGRESSION (threshold {threshold}x)'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def run(only=None, sizes=DEFAULT_SIZES):
+    fixtures = Fixtures()
+    results = {}
+    for name, sized, function in BENCHMARKS:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        for n in (sizes if sized else (None,)):
+            key = f'{name}[n={n}]' if sized else name
+            results[key] = function(fixtures, n) if sized else function(fixtures)
+    return results
+
+def metadata():
+    import kivy
+    return {
+        'python': platform.python_version(),
+        'kivy': kivy.__version__,
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'gl_backend': os.environ.get('KIVY_GL_BACKEND'),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless benchmarks for Breathe3')
+    parser.add_argument('--only', action='append', help='run benchmarks whose name contains this (repeatable)')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='preset counts for sized benchmarks')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the baseline')
+    args = parser.parse_args()
+
+    results = run(args.only, [int(n) for n in args.sizes.split(',')])
+    document = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1)
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline)
+    if args.update_baseline:
+        baseline['meta'] = document['meta']
+        baseline.setdefault('results', {}).update(results)
+        baseline.setdefault('thresholds', {'default': DEFAULT_THRESHOLD})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        return 0
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import sys
+
+# ============================================================================
+# Ring shader check
+# ----------------------------------------------------------------------------
+# Renders the rings with the fragment shader and with ellipses into
+# offscreen buffers, for points across all four phases, and compares the
+# pixels. Only the ring edges may differ (the shader smooths them), so the
+# share of clearly different pixels must stay small.
+#
+# Needs real GL, but no GPU or display: by default it runs on Mesa's
+# software rasteriser (llvmpipe) through SDL's offscreen video driver.
+#
+#   python benchmarks/shader_check.py    exit status 1 on a mismatch
+# ============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZE = (240, 180)
+SAMPLES = [(phase, progress / 4) for phase in range(4) for progress in range(5)]
+# A channel differing by more than this counts the pixel as different.
+CHANNEL_TOLERANCE = 40
+MAX_DIFFERENT_SHARE = 0.02
+
+for key, value in {
+    'SDL_VIDEODRIVER': 'offscreen',
+    'LIBGL_ALWAYS_SOFTWARE': '1',
+    'KIVY_NO_ARGS': '1',
+    'KIVY_NO_CONSOLELOG': '1',
+    'KIVY_NO_FILELOG': '1',
+}.items():
+    os.environ.setdefault(key, value)
+sys.path.insert(0, ROOT)
+
+from kivy.core.window import Window  # noqa: E402,F401  (creates the GL context)
+from kivy.graphics import ClearBuffers, ClearColor, Color, Ellipse, Fbo  # noqa: E402
+from kivy.graphics import opengl as gl  # noqa: E402
+from kivy.uix.widget import Widget  # noqa: E402
+
+from main import AnimatedCircle  # noqa: E402
+from shader_rings import ShaderRings  # noqa: E402
+from timeline import ring_radii  # noqa: E402
+
+def offscreen():
+    fbo = Fbo(size=SIZE)
+    with fbo:
+        ClearColor(0, 0, 0, 0)
+        ClearBuffers()
+    return fbo
+
+def ellipse_pixels(phase, progress):
+    fbo = offscreen()
+    scale = min(SIZE) / 200.0
+    with fbo:
+        for color, radius in zip(AnimatedCircle.ring_colors, ring_radii(phase, progress)):
+            radius_px = radius * scale
+            Color(*color)
+            Ellipse(pos=(SIZE[0] / 2 - radius_px, SIZE[1] / 2 - radius_px),
+                    size=(radius_px * 2, radius_px * 2), segments=180)
+    fbo.draw()
+    return fbo.pixels
+
+def main():
+    print(f"GL renderer: {gl.glGetString(gl.GL_RENDERER).decode()}")
+    widget = Widget(size=SIZE, pos=(0, 0))
+    rings = ShaderRings(widget, AnimatedCircle.ring_colors)
+    if not rings.ok:
+        print('The ring shader did not compile')
+        return 1
+    fbo = offscreen()
+    fbo.add(widget.canvas)
+    rings.attach()
+    failed = False
+    for phase, progress in SAMPLES:
+        rings.update(phase, progress, resized=True)
+        fbo.draw()
+        shaded = fbo.pixels
+        expected = ellipse_pixels(phase, progress)
+        different = sum(1 for i in range(0, len(shaded), 4)
+                        if max(abs(a - b) for a, b in zip(shaded[i:i + 4], expected[i:i + 4])) > CHANNEL_TOLERANCE)
+        share = different / (SIZE[0] * SIZE[1])
+        status = 'ok' if share <= MAX_DIFFERENT_SHARE else 'MISMATCH'
+        failed |= status != 'ok'
+        print(f'phase {phase} progress {progress:.2f}: {share:.2%} of pixels differ  {status}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
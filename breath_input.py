@@ -0,0 +1,477 @@
+import argparse
+import subprocess
+import sys
+import threading
+import time
+import wave
+from collections import deque, namedtuple
+
+from audio import find_recorder
+from timeline import get_numpy
+
+# ============================================================================
+# Breath input
+# ----------------------------------------------------------------------------
+# Listens to the user breathing and checks it against the session: a source
+# delivers audio in blocks of BLOCK_SECONDS, BreathAnalyzer tells inhale,
+# exhale and quiet apart in each, and BreathTracker compares that with the
+# phase the timeline expects, keeps an adherence score, and (optionally)
+# decides how fast the rest of the start→end ramp should go.
+#
+# Sources: the microphone (through a command-line recorder, like the cue
+# players in audio.py), a WAV file, or a synthetic breather for testing.
+# BreathMonitor runs all of it on a worker thread; the UI only reads its
+# latest reading now and then, and gets a callback when the ramp should
+# change. A change of breath shows in a reading once the new breath is
+# louder than the noise in its band and has held for SWITCH_BLOCKS blocks:
+# about 100 ms for a breath rising from silence over quiet background noise
+# (see benchmarks/breath_check.py), more in a noisy room.
+#
+#   python breath_input.py --demo --start 4 8 8 0 --end 6 10 10 0 --duration 600
+#   python breath_input.py --wav breaths.wav --start 4 7 8 0
+#   python breath_input.py --mic --preset Chill --adapt
+#
+# Needs NumPy.
+# ============================================================================
+
+INHALE, QUIET, EXHALE = 0, 1, 2
+BREATH_NAMES = ('Inhale', 'Quiet', 'Exhale')
+# What each phase of the cycle should sound like.
+EXPECTED = (INHALE, QUIET, EXHALE, QUIET)
+
+RATE = 16000
+BLOCK_SECONDS = 0.04
+# A new breath state must last this many blocks before it is reported.
+SWITCH_BLOCKS = 2
+# Input the worker may fall behind by before it skips blocks to catch up.
+MAX_BACKLOG = 0.1
+# Breath sounds are hiss: the bands their energy is measured in (Hz), each
+# against its own noise floor, so that a breath shows as soon as it is louder
+# than the noise where it sounds rather than across the whole range.
+NOISE_BANDS = (150, 800, 1500, 2500, 4000, 6000)
+# A block is breath when the energy in some band is this many times its
+# noise floor. The floors follow the band energies (averaged with the last
+# block's by NOISE_SMOOTHING, to keep them off the odd quiet block) down at
+# once and drift up slowly.
+ACTIVE_RATIO = 2.0
+FLOOR_RISE = 1.002
+NOISE_SMOOTHING = 0.5
+# Inhales and exhales are told apart by the spectral centroid of the energy
+# above the floors: above a split that follows the average centroid of the
+# breath blocks is an inhale (air drawn in through the nose hisses higher
+# than air let out).
+SPLIT_RATE = 0.01
+# A breath matches when it is what the timeline expects at the time, or up
+# to REACTION_TIME later (a cue is followed with a delay) or EARLY_TIME
+# earlier (a breath tails off before its phase ends).
+REACTION_TIME = 0.6
+EARLY_TIME = 0.3
+# The adherence score is the share of matching blocks over this many seconds,
+# once there are MIN_SCORED_SECONDS of them.
+ADHERENCE_WINDOW = 30.0
+MIN_SCORED_SECONDS = 5.0
+# Ramp adaptation: at most every ADAPT_INTERVAL seconds, a score of
+# HOLD_SCORE or less holds the cycle where it is, FULL_SCORE or more keeps
+# to the planned ramp; changes smaller than PACE_STEP are left out. The pace
+# drops at once but comes back by at most RESUME_STEP at a time.
+ADAPT_INTERVAL = 20.0
+HOLD_SCORE = 0.5
+FULL_SCORE = 0.8
+PACE_STEP = 0.1
+RESUME_STEP = 0.25
+
+BreathReading = namedtuple('BreathReading', 'time state expected score pace')
+
+def ramp_pace(score):
+    """ Share of the rest of the ramp to cover, given an adherence score """
+    return min(1.0, max(0.0, (score - HOLD_SCORE) / (FULL_SCORE - HOLD_SCORE)))
+
+def reading_text(reading):
+    """ The breath label: what is heard, the score and an adapted ramp """
+    if reading is None:
+        return 'Listening…'
+    text = BREATH_NAMES[reading.state]
+    if reading.score is not None:
+        text += f'  ·  adherence {reading.score:.0%}'
+    if reading.pace < 1:
+        text += f'  ·  ramp at {reading.pace:.0%}'
+    return text
+
+# ============================================================================
+# Sources
+# ----------------------------------------------------------------------------
+# read(frames) returns the next `frames` samples as float32 in [-1, 1], mono,
+# or None once the input has ended; `ok` is False if the source cannot be
+# read at all. A file or synthetic source with realtime=True delivers its
+# samples no faster than a live input would.
+# ============================================================================
+class BlockSource:
+    def __init__(self, rate, realtime=False):
+        self.rate = rate
+        self.realtime = realtime
+        self.ok = True
+        self.np = get_numpy()
+        self.started = None
+        self.delivered = 0
+
+    def pace(self, frames):
+        if not self.realtime:
+            return
+        if self.started is None:
+            self.started = time.monotonic()
+        self.delivered += frames
+        delay = self.started + self.delivered / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+class MicrophoneSource(BlockSource):
+    def __init__(self, rate=RATE):
+        super().__init__(rate, realtime=True)
+        self.process = None
+        command = find_recorder(rate)
+        self.ok = command is not None and self.np is not None
+        if self.ok:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, frames):
+        # Blocks until the recorder has captured the samples.
+        data = self.process.stdout.read(frames * 2)
+        if len(data) < frames * 2:
+            return None
+        return self.np.frombuffer(data, dtype='<i2').astype(self.np.float32) / 32768
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+class WavSource(BlockSource):
+    def __init__(self, path, realtime=False):
+        self.file = wave.open(path, 'rb')
+        super().__init__(self.file.getframerate(), realtime)
+        self.channels = self.file.getnchannels()
+        # 16-bit PCM only, as recorders and most editors write it.
+        self.ok = self.file.getsampwidth() == 2 and self.np is not None
+
+    def read(self, frames):
+        data = self.file.readframes(frames)
+        if len(data) < frames * self.channels * 2:
+            return None
+        np = self.np
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+        self.pace(frames)
+        return samples.reshape(-1, self.channels).mean(axis=1)
+
+    def close(self):
+        self.file.close()
+
+class SyntheticSource(BlockSource):
+    """ A breather following `timeline` `delay` seconds late: hiss, higher for inhales, over background noise """
+    def __init__(self, timeline, rate=RATE, delay=0.3, level=0.1, noise=0.005, seed=1, realtime=False):
+        super().__init__(rate, realtime)
+        self.ok = self.np is not None
+        self.timeline = timeline
+        self.delay = delay
+        self.level = level
+        self.noise = noise
+        self.t = 0.0
+        self.masks = {}
+        self.rng = self.np.random.default_rng(seed) if self.ok else None
+
+    def hiss(self, frames, band):
+        np = self.np
+        key = (frames, band)
+        if key not in self.masks:
+            freqs = np.fft.rfftfreq(frames, 1 / self.rate)
+            self.masks[key] = (freqs >= band[0]) & (freqs < band[1])
+        spectrum = self.rng.standard_normal(frames // 2 + 1) + 1j * self.rng.standard_normal(frames // 2 + 1)
+        noise = np.fft.irfft(spectrum * self.masks[key], frames)
+        return noise / max(noise.std(), 1e-12)
+
+    def breathing(self, times):
+        """ The inhale and exhale envelopes (0 to 1) at times """
+        np = self.np
+        envelopes = {0: np.zeros(len(times)), 2: np.zeros(len(times))}
+        i = int(np.searchsorted(times, 0.0))  # Nothing before the session
+        while i < len(times):
+            state = self.timeline.state(times[i])
+            j = max(i + 1, int(np.searchsorted(times, state.end)))
+            if state.phase in envelopes and state.end > state.start:
+                progress = (times[i:j] - state.start) / (state.end - state.start)
+                envelopes[state.phase][i:j] = np.sin(np.pi * progress)
+            i = j
+        return envelopes[0], envelopes[2]
+
+    def read(self, frames):
+        np = self.np
+        times = self.t - self.delay + np.arange(frames) / self.rate
+        self.t += frames / self.rate
+        inhale, exhale = self.breathing(times)
+        samples = self.noise * self.rng.standard_normal(frames)
+        if inhale.any():
+            samples += self.level * inhale * self.hiss(frames, (1800, 5000))
+        if exhale.any():
+            samples += self.level * exhale * self.hiss(frames, (250, 1200))
+        self.pace(frames)
+        return samples.astype(np.float32)
+
+    def truth(self, t):
+        """ What the breather does at session time t """
+        if t - self.delay < 0:
+            return QUIET
+        return EXPECTED[self.timeline.state(t - self.delay).phase]
+
+# ============================================================================
+# BreathAnalyzer
+# ----------------------------------------------------------------------------
+# One block at a time: the power spectrum of the windowed block, its energy
+# in each of the NOISE_BANDS against that band's floor, the centroid of what
+# is above the floors, and from those inhale, exhale or quiet, which has to
+# hold for SWITCH_BLOCKS blocks before it is reported.
+# ============================================================================
+class BreathAnalyzer:
+    def __init__(self, rate):
+        np = self.np = get_numpy()
+        self.block_frames = int(round(rate * BLOCK_SECONDS))
+        self.window = np.hanning(self.block_frames).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.block_frames, 1 / rate)
+        self.edges = np.searchsorted(freqs, NOISE_BANDS)
+        # The centroid is taken over the bands, at their geometric middles.
+        self.centres = np.sqrt(np.array(NOISE_BANDS[:-1], dtype=float) * NOISE_BANDS[1:])
+        self.noise = None
+        self.floors = None
+        self.split = None
+        self.state = QUIET
+        self.candidate = QUIET
+        self.candidate_blocks = 0
+
+    def process(self, block):
+        np = self.np
+        spectrum = np.fft.rfft(block * self.window)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        energies = np.add.reduceat(power[:self.edges[-1]], self.edges[:-1])
+        if self.floors is None:
+            self.noise = energies
+            self.floors = energies.copy()
+        self.noise = self.noise + (energies - self.noise) * NOISE_SMOOTHING
+        self.floors = np.maximum(np.minimum(self.noise, self.floors * FLOOR_RISE), 1e-12)
+        if (energies > self.floors * ACTIVE_RATIO).any():
+            excess = np.maximum(energies - self.floors, 0.0)
+            centroid = float(excess @ self.centres) / float(excess.sum())
+            self.split = centroid if self.split is None else self.split + (centroid - self.split) * SPLIT_RATE
+            heard = INHALE if centroid > self.split else EXHALE
+        else:
+            heard = QUIET
+        if heard == self.state:
+            self.candidate_blocks = 0
+            return self.state
+        if heard != self.candidate:
+            self.candidate = heard
+            self.candidate_blocks = 0
+        self.candidate_blocks += 1
+        if self.candidate_blocks >= SWITCH_BLOCKS:
+            self.state = heard
+            self.candidate_blocks = 0
+        return self.state
+
+# ============================================================================
+# BreathTracker
+# ----------------------------------------------------------------------------
+# Analyses a block and compares it with the timeline: process() returns the
+# BreathReading of a block given the session time of its middle sample. With
+# adapt, the reading's pace is what the rest of the ramp should run at (see
+# BreathSession.set_ramp_pace); otherwise it stays 1.
+# ============================================================================
+class BreathTracker:
+    def __init__(self, rate, adapt=False):
+        self.analyzer = BreathAnalyzer(rate)
+        self.block_seconds = self.analyzer.block_frames / rate
+        self.matches = deque(maxlen=int(round(ADHERENCE_WINDOW / self.block_seconds)))
+        self.matched = 0
+        self.adapt = adapt
+        self.pace = 1.0
+        self.next_adapt = None
+
+    def score(self):
+        if len(self.matches) * self.block_seconds < MIN_SCORED_SECONDS:
+            return None
+        return self.matched / len(self.matches)
+
+    def process(self, block, t, timeline):
+        state = self.analyzer.process(block)
+        expected = EXPECTED[timeline.state(t).phase]
+        matched = state == expected or any(state == EXPECTED[timeline.state(t + offset).phase]
+                                           for offset in (-REACTION_TIME, EARLY_TIME))
+        if len(self.matches) == self.matches.maxlen:
+            self.matched -= self.matches[0]
+        self.matches.append(matched)
+        self.matched += matched
+        score = self.score()
+        if self.adapt and score is not None:
+            self.adapt_pace(t, score)
+        return BreathReading(t, state, expected, score, self.pace)
+
+    def adapt_pace(self, t, score):
+        if self.next_adapt is None:
+            self.next_adapt = t + ADAPT_INTERVAL
+        if t < self.next_adapt:
+            return
+        self.next_adapt = t + ADAPT_INTERVAL
+        pace = min(ramp_pace(score), self.pace + RESUME_STEP)
+        if abs(pace - self.pace) >= PACE_STEP or (pace != self.pace and pace in (0.0, 1.0)):
+            self.pace = pace
+
+def track(source, timeline, t=0.0, adapt=False):
+    """ Readings of a whole (non-live) source from session time t on; timeline() is read per block """
+    tracker = BreathTracker(source.rate, adapt)
+    frames = tracker.analyzer.block_frames
+    while True:
+        block = source.read(frames)
+        if block is None:
+            return
+        yield tracker.process(block, t + tracker.block_seconds / 2, timeline())
+        t += tracker.block_seconds
+
+# ============================================================================
+# BreathMonitor
+# ----------------------------------------------------------------------------
+# Runs a BreathTracker on its own thread, against the session clock:
+#
+#   clock()     the current session time; read from the monitor's thread
+#   timeline()  the current BreathTimeline
+#
+# `reading` is the latest BreathReading (None before the first), for the UI
+# to look at when it likes; `running` turns False if the input ends.
+# on_pace(pace) is called from the monitor's thread when an adapted ramp
+# should change. If the analysis falls behind a live input by MAX_BACKLOG,
+# blocks are read and dropped until it catches up, so readings never lag
+# further behind than that.
+# ============================================================================
+class BreathMonitor:
+    def __init__(self, on_pace=None):
+        self.on_pace = on_pace
+        self.reading = None
+        self.running = False
+        self.thread = None
+        self.dropped = 0
+
+    def start(self, source, timeline, clock, adapt=False):
+        self.stop()
+        self.running = True
+        self.reading = None
+        self.thread = threading.Thread(target=self.run, args=(source, timeline, clock, adapt),
+                                       name='BreathMonitor', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def run(self, source, timeline, clock, adapt):
+        tracker = BreathTracker(source.rate, adapt)
+        frames = tracker.analyzer.block_frames
+        started = None
+        received = 0
+        pace = tracker.pace
+        try:
+            while self.running:
+                block = source.read(frames)
+                if block is None:
+                    return
+                now = time.monotonic()
+                if started is None:
+                    started = now - tracker.block_seconds
+                received += frames
+                if now - started - received / source.rate > MAX_BACKLOG:
+                    self.dropped += 1
+                    continue
+                self.reading = reading = tracker.process(block, clock() - tracker.block_seconds / 2, timeline())
+                if reading.pace != pace:
+                    pace = reading.pace
+                    if self.on_pace:
+                        self.on_pace(pace)
+        finally:
+            source.close()
+            self.running = False
+
+def main(argv=None):
+    from session import BreathSession, clamp_duration, load_preset
+    parser = argparse.ArgumentParser(description='Compare breathing with a session, from audio.')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('--mic', action='store_true', help='listen to the microphone')
+    inputs.add_argument('--wav', help='16-bit WAV file of breathing')
+    inputs.add_argument('--demo', action='store_true', help='a synthetic breather keeping the start rhythm')
+    parser.add_argument('--preset', help='preset name (default presets unless --presets is given)')
+    parser.add_argument('--presets', help='presets.db or presets.json to look the preset up in')
+    parser.add_argument('--start', type=float, nargs=4, metavar='S', help='start cycle: inhale hold exhale hold')
+    parser.add_argument('--end', type=float, nargs=4, metavar='S', help='end cycle (default: the start cycle)')
+    parser.add_argument('--duration', type=float, help='session length in seconds')
+    parser.add_argument('--adapt', action='store_true', help='slow the ramp down when the breathing lags behind')
+    args = parser.parse_args(argv)
+
+    if args.preset:
+        preset = load_preset(args.preset, args.presets)
+        if preset is None:
+            parser.error(f"no preset named '{args.preset}'")
+        start, end, duration = preset
+    elif args.start:
+        start, end, duration = args.start, args.end or args.start, 5 * 60
+    else:
+        parser.error('give either --preset or --start')
+    if args.duration is not None:
+        duration = args.duration
+    session = BreathSession(start, end, clamp_duration(duration), use_numpy=False)
+    if args.mic:
+        source = MicrophoneSource()
+    elif args.wav:
+        source = WavSource(args.wav)
+    else:
+        from timeline import BreathTimeline
+        source = SyntheticSource(BreathTimeline(start, start, float('inf')))
+    if not source.ok:
+        print('Cannot read the input (breath input needs NumPy, a 16-bit WAV, '
+              'or a recorder: arecord, parec or rec)', file=sys.stderr)
+        return 1
+
+    def show(reading):
+        minutes, seconds = divmod(int(reading.time), 60)
+        print(f'{minutes:02d}:{seconds:02d}  expected {BREATH_NAMES[reading.expected]:6}  {reading_text(reading)}',
+              flush=True)
+
+    end_time = session.end()
+    shown = -1
+    if not args.mic:
+        # As fast as the file can be read, in session time.
+        pace = 1.0
+        for reading in track(source, session.get_timeline, adapt=args.adapt):
+            if reading.pace != pace:
+                pace = reading.pace
+                session.set_ramp_pace(pace, reading.time)
+            if int(reading.time) > shown:
+                shown = int(reading.time)
+                show(reading)
+            if reading.time >= end_time:
+                break
+        source.close()
+        return 0
+    started = time.monotonic()
+    monitor = BreathMonitor(on_pace=lambda pace: session.set_ramp_pace(pace, time.monotonic() - started))
+    monitor.start(source, session.get_timeline, lambda: time.monotonic() - started, args.adapt)
+    try:
+        while time.monotonic() - started < end_time:
+            time.sleep(1)
+            if monitor.reading is not None:
+                show(monitor.reading)
+    except KeyboardInterrupt:
+        pass
+    monitor.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import statistics
+import threading
+import time
+
+from kivy.clock import Clock
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.popup import Popup
+
+BEATS = 12
+BEAT_INTERVAL = 1.0
+# The first beats are for finding the rhythm and are not measured.
+SKIPPED_BEATS = 3
+MIN_TAPS = 5
+MAX_LATENCY = 0.5
+
+def measure_latency(beats, taps):
+    """ Median delay from starting a beat to the tap on it, or None if too few taps match a beat """
+    offsets = []
+    for tap in taps:
+        beat = min(beats, key=lambda b: abs(tap - b))
+        if abs(tap - beat) < BEAT_INTERVAL / 2:
+            offsets.append(tap - beat)
+    if len(offsets) < MIN_TAPS:
+        return None
+    return min(MAX_LATENCY, max(0.0, statistics.median(offsets)))
+
+# ============================================================================
+# CalibrationPopup
+# ----------------------------------------------------------------------------
+# Opened by the "Test sound" button. Besides playing the test sound, it
+# measures how long this device takes from starting a sound to it being
+# heard: a cue plays on a steady beat and the user taps along in rhythm.
+# Tapping along (rather than reacting) cancels out reaction time, so the
+# typical delay from starting each beat to the tap on it is the output
+# latency, which the cue scheduler then starts cues ahead by.
+#
+# Beats and taps are both stamped with time.time(), the clock of Kivy's
+# touch events, so the frame a tap is delivered in does not count.
+#
+# Known limit: a tap is stamped when Kivy receives the touch, so the delay
+# from finger to event (touchscreen input latency, tens of ms on many phones)
+# is measured as output latency too, and cues start early by that much.
+# Telling the two apart would take a second, silent round of tapping to a
+# visual beat, which has display latency of its own; that is not done.
+# ============================================================================
+class CalibrationPopup(Popup):
+    def __init__(self, sounds, latency, on_calibrated, **kwargs):
+        super().__init__(**kwargs)
+        self.title = 'Sound'
+        self.size_hint = (0.9, 0.6)
+        self.sounds = sounds
+        self.on_calibrated = on_calibrated
+        self.beats = []
+        self.taps = []
+        self.thread = None
+        self.stopped = threading.Event()
+        layout = BoxLayout(orientation='vertical', spacing=5)
+        self.status_label = Label(text=self.latency_text(latency), halign='center')
+        layout.add_widget(self.status_label)
+        buttons = BoxLayout(orientation='horizontal', spacing=5, size_hint_y=0.3)
+        play_button = Button(text='Play test sound', bold=True)
+        play_button.bind(on_press=self.play_test_sound)
+        buttons.add_widget(play_button)
+        self.calibrate_button = Button(text='Calibrate', bold=True)
+        self.calibrate_button.bind(on_press=self.start_calibration)
+        buttons.add_widget(self.calibrate_button)
+        layout.add_widget(buttons)
+        self.tap_button = Button(text='Tap along with the beat', bold=True, disabled=True)
+        self.tap_button.bind(on_touch_down=self.tap)
+        layout.add_widget(self.tap_button)
+        self.content = layout
+        self.bind(on_dismiss=lambda *args: self.stopped.set())
+
+    @staticmethod
+    def latency_text(latency):
+        return f'Cues start {latency * 1000:.0f} ms early to make up for output latency'
+
+    def play_test_sound(self, instance):
+        sound = self.sounds.get(4)
+        if sound:
+            sound.play()
+
+    def start_calibration(self, instance):
+        if self.thread is not None:
+            return
+        self.beats = []
+        self.taps = []
+        self.calibrate_button.disabled = True
+        self.tap_button.disabled = False
+        self.status_label.text = 'Tap in time with each beat, as it sounds'
+        self.stopped.clear()
+        # Loaded here, on the UI thread, if it is not yet.
+        sound = self.sounds.get(0)
+        self.thread = threading.Thread(target=self.play_beats, args=(sound,), name='Calibration', daemon=True)
+        self.thread.start()
+
+    def play_beats(self, sound):
+        start = time.time() + BEAT_INTERVAL
+        for i in range(BEATS):
+            if self.stopped.wait(max(0.0, start + i * BEAT_INTERVAL - time.time())):
+                return
+            self.beats.append(time.time())
+            if sound:
+                sound.play()
+        self.stopped.wait(BEAT_INTERVAL)
+        Clock.schedule_once(self.finish)
+
+    def tap(self, instance, touch):
+        if instance.collide_point(*touch.pos) and not instance.disabled:
+            self.taps.append(touch.time_start)
+            return True
+
+    def finish(self, dt):
+        self.thread = None
+        self.calibrate_button.disabled = False
+        self.tap_button.disabled = True
+        latency = measure_latency(self.beats[SKIPPED_BEATS:], self.taps)
+        if latency is None:
+            self.status_label.text = 'Not enough taps on the beat; try again'
+            return
+        self.status_label.text = self.latency_text(latency)
+        self.on_calibrated(latency)
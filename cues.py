@@ -0,0 +1,83 @@
+import threading
+
+# Passed to the cue callback when the session time reaches its end.
+END_CUE = 4
+# Longest sleep between looks at the clock. Sleeping until the next boundary
+# is exact for a steady clock, but the session clock may also be moved (a
+# drag of the remaining time) or stopped (a paused group session).
+MAX_WAIT = 0.5
+
+# ============================================================================
+# CueScheduler
+# ----------------------------------------------------------------------------
+# Plays the phase cues of a running session from its own thread, so that
+# starting a sound never waits for (or holds up) a frame. It sleeps until the
+# next phase boundary of the timeline and calls cue(phase, due) `latency`
+# seconds before it, so that the sound is heard at the boundary itself;
+# cue(END_CUE, end) the same way at the end of the session.
+#
+#   clock()     the current session time; read from the scheduler's thread
+#   timeline()  the current BreathTimeline (the cycle may be edited mid-session)
+#
+# resync() makes it look at both again at once, after either has changed.
+# cue() runs on the scheduler's thread. next_cue() is the whole decision, so
+# that a replay can run it against a simulated clock.
+# ============================================================================
+class CueScheduler:
+    def __init__(self, cue):
+        self.cue = cue
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.running = False
+        self.thread = None
+        self.latency = 0.0
+
+    def start(self, timeline, clock, end, phase, latency=0.0):
+        """ Cue from now on, `phase` having been cued already; end may be inf """
+        self.stop()
+        self.running = True
+        self.latency = latency
+        self.thread = threading.Thread(target=self.run, args=(timeline, clock, end, phase),
+                                       name='CueScheduler', daemon=True)
+        self.thread.start()
+
+    def resync(self):
+        with self.lock:
+            self.wake.notify()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.wake.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    @staticmethod
+    def next_cue(timeline, t, end, phase):
+        """ The cue due at session time t after `phase`: (phase, due), or (None, when the next may be) """
+        if t >= end:
+            return END_CUE, end
+        state = timeline.state(t)
+        if state.phase != phase:
+            return state.phase, state.start
+        if state.end <= t:  # All-zero cycle: nothing to cue until the end
+            return None, end
+        return None, min(state.end, end)
+
+    def run(self, timeline, clock, end, phase):
+        while True:
+            with self.lock:
+                if not self.running:
+                    return
+                # What is heard now was started `latency` ago.
+                t = clock() + self.latency
+                current, due = self.next_cue(timeline(), t, end, phase)
+                if current is None:
+                    self.wake.wait(min(due - t, MAX_WAIT))
+                    continue
+            # Outside the lock, so that the callback may stop the scheduler.
+            self.cue(current, due)
+            if current == END_CUE:
+                return
+            phase = current
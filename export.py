@@ -0,0 +1,258 @@
+import argparse
+import bisect
+import os
+import sys
+import wave
+
+from audio import SOUND_NAMES, PcmCache, find_sound_asset
+from cues import END_CUE
+from timeline import BreathTimeline, get_numpy
+
+# ============================================================================
+# Session audio export
+# ----------------------------------------------------------------------------
+# Renders a whole guided session (start and end cycle, duration) as an audio
+# track: the cue sounds at the sample where each phase begins, as
+# animate_circle would play them, over silence or a looped ambient bed, and
+# the end sound at the end of the session.
+#
+# The track is mixed and written one fixed-size block at a time, so memory
+# does not grow with its length. Needs NumPy; OGG output also needs the
+# soundfile package, WAV only the standard library.
+#
+#   python export.py --preset Chill -o chill.ogg
+#   python export.py --start 4 8 8 0 --end 6 10 10 0 --duration 1800 -o s.wav
+# ============================================================================
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+DEFAULT_RATE = 48000
+DEFAULT_CHANNELS = 2
+BLOCK_FRAMES = 1 << 16
+AMBIENT_GAIN = 0.3
+FORMATS = ('.wav', '.ogg')
+
+class ExportError(Exception):
+    pass
+
+def require_numpy():
+    np = get_numpy()
+    if np is None:
+        raise ExportError('Exporting a session needs NumPy')
+    return np
+
+def default_extension():
+    """ .ogg where it can be encoded, otherwise .wav """
+    try:
+        import soundfile  # noqa: F401
+    except ImportError:
+        return '.wav'
+    return '.ogg'
+
+def cue_times(start_cycle_time, end_cycle_time, duration):
+    """ (session time, cue) for every cue of a session, in order """
+    timeline = BreathTimeline(start_cycle_time, end_cycle_time, duration)
+    cues = [(0.0, timeline.state(0).phase)]
+    # A zero-length phase ends where it begins and is never shown, so only the
+    # phase a boundary lands in is cued (like animate_circle).
+    for t in timeline.starts[1:]:
+        if t >= duration:
+            break
+        if t > cues[-1][0]:
+            cues.append((t, timeline.state(t).phase))
+    cues.append((float(duration), END_CUE))
+    return cues
+
+def pcm_samples(pcm, rate, channels):
+    """ Float samples of pcm, shape (frames, channels), resampled to rate """
+    np = require_numpy()
+    if pcm.sample_width == 2:
+        samples = np.frombuffer(pcm.data, dtype='<i2').astype(np.float32) / 32768
+    elif pcm.sample_width == 1:
+        samples = (np.frombuffer(pcm.data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif pcm.sample_width == 3:
+        # 24-bit samples become the top three bytes of 32-bit ones.
+        padded = np.zeros((len(pcm.data) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(pcm.data, dtype=np.uint8).reshape(-1, 3)
+        samples = padded.view('<i4').ravel().astype(np.float32) / 2147483648
+    elif pcm.sample_width == 4:
+        samples = np.frombuffer(pcm.data, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ExportError(f'Unsupported sample width: {pcm.sample_width} bytes')
+    samples = samples.reshape(-1, pcm.channels)
+    if pcm.channels != channels:
+        # Through mono: the channels are averaged, then repeated.
+        samples = np.repeat(samples.mean(axis=1, keepdims=True), channels, axis=1)
+    if pcm.rate != rate and len(samples):
+        frames = int(round(len(samples) * rate / pcm.rate))
+        positions = np.arange(frames) * (pcm.rate / rate)
+        source = np.arange(len(samples))
+        samples = np.stack([np.interp(positions, source, samples[:, c]) for c in range(channels)], axis=1)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+# ============================================================================
+# TrackMixer
+# ----------------------------------------------------------------------------
+# Produces the track as consecutive int16 blocks of `block_frames` frames
+# (the last one shorter). A block is silence, or the ambient bed read
+# around its loop, plus the part of each cue that overlaps it; the cues are
+# sorted by offset, so finding them is a binary search.
+# ============================================================================
+class TrackMixer:
+    def __init__(self, cues, sounds, rate, channels, ambient=None, ambient_gain=AMBIENT_GAIN,
+                 block_frames=BLOCK_FRAMES):
+        self.rate = rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.ambient = ambient if ambient is not None and len(ambient) else None
+        self.ambient_gain = ambient_gain
+        # Sample-exact offsets of the cues that have a sound.
+        self.events = [(int(round(t * rate)), sounds[cue]) for t, cue in cues if sounds.get(cue) is not None]
+        self.offsets = [offset for offset, _ in self.events]
+        self.longest = max((len(samples) for _, samples in self.events), default=0)
+        end = max((offset + len(samples) for offset, samples in self.events), default=0)
+        self.frames = max(end, int(round(cues[-1][0] * rate)) if cues else 0)
+
+    def blocks(self):
+        np = require_numpy()
+        block = np.empty((self.block_frames, self.channels), dtype=np.float32)
+        for start in range(0, self.frames, self.block_frames):
+            end = min(start + self.block_frames, self.frames)
+            mix = block[:end - start]
+            if self.ambient is None:
+                mix.fill(0)
+            else:
+                indices = np.arange(start, end) % len(self.ambient)
+                np.multiply(self.ambient[indices], self.ambient_gain, out=mix)
+            first = bisect.bisect_right(self.offsets, start - self.longest)
+            last = bisect.bisect_left(self.offsets, end)
+            for offset, samples in self.events[first:last]:
+                lo = max(start, offset)
+                hi = min(end, offset + len(samples))
+                if hi > lo:
+                    mix[lo - start:hi - start] += samples[lo - offset:hi - offset]
+            np.clip(mix, -1, 1, out=mix)
+            yield (mix * 32767).astype('<i2')
+
+# ============================================================================
+# Writers
+# ----------------------------------------------------------------------------
+# Both take int16 blocks of shape (frames, channels). The track is written to
+# a temporary file next to the target and moved into place when complete.
+# ============================================================================
+class WavWriter:
+    def __init__(self, path, rate, channels):
+        self.file = wave.open(path, 'wb')
+        self.file.setframerate(rate)
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+
+    def write(self, block):
+        self.file.writeframesraw(block.tobytes())
+
+    def close(self):
+        self.file.close()  # Patches the frame count in the header
+
+class OggWriter:
+    def __init__(self, path, rate, channels):
+        # Optional: only available where the soundfile package is installed.
+        try:
+            import soundfile
+        except ImportError:
+            raise ExportError('OGG export needs the soundfile package; export a .wav instead')
+        self.file = soundfile.SoundFile(path, 'w', samplerate=rate, channels=channels,
+                                        format='OGG', subtype='VORBIS')
+
+    def write(self, block):
+        self.file.write(block)
+
+    def close(self):
+        self.file.close()
+
+WRITERS = {'.wav': WavWriter, '.ogg': OggWriter}
+
+def load_sounds(rate, channels, assets_dir=ASSETS_DIR, cache=None):
+    cache = cache or PcmCache()
+    sounds = {}
+    for key, name in SOUND_NAMES.items():
+        path = find_sound_asset(assets_dir, name)
+        sounds[key] = pcm_samples(cache.load(path), rate, channels) if path else None
+    return sounds
+
+def export_track(path, start_cycle_time, end_cycle_time, duration, ambient_path=None,
+                 ambient_gain=AMBIENT_GAIN, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS,
+                 assets_dir=ASSETS_DIR, progress=None, cancelled=None):
+    """ Write the session to path (.wav or .ogg); path, or None if cancelled() stopped it """
+    # progress(fraction) is called after every block. Once cancelled() returns
+    # True the export stops and the partial file is removed.
+    if duration == float('inf') or duration <= 0:
+        raise ExportError('Only a session with a finite duration can be exported')
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ExportError(f"Unsupported format '{extension}', use one of {', '.join(FORMATS)}")
+    cache = PcmCache()
+    sounds = load_sounds(rate, channels, assets_dir, cache)
+    ambient = pcm_samples(cache.load(ambient_path), rate, channels) if ambient_path else None
+    mixer = TrackMixer(cue_times(start_cycle_time, end_cycle_time, duration), sounds, rate, channels,
+                       ambient, ambient_gain)
+    # The extension is kept so that soundfile can tell the format.
+    tmp_path = f'{path}.tmp{extension}'
+    writer = WRITERS[extension](tmp_path, rate, channels)
+    written = 0
+    try:
+        for block in mixer.blocks():
+            if cancelled is not None and cancelled():
+                break
+            writer.write(block)
+            written += len(block)
+            if progress is not None:
+                progress(written / mixer.frames)
+    finally:
+        writer.close()
+        if written < mixer.frames:
+            os.remove(tmp_path)
+    if written < mixer.frames:
+        return None
+    os.replace(tmp_path, path)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a breathing session as an audio track.')
+    parser.add_argument('-o', '--output', required=True, help='output file, .wav or .ogg')
+    parser.add_argument('--preset', help='name of a saved preset')
+    parser.add_argument('--presets', help='presets.db or presets.json to look the preset up in')
+    parser.add_argument('--start', type=float, nargs=4, metavar='S', help='start cycle: inhale hold exhale hold')
+    parser.add_argument('--end', type=float, nargs=4, metavar='S', help='end cycle (default: the start cycle)')
+    parser.add_argument('--duration', type=float, help='session length in seconds')
+    parser.add_argument('--ambient', help='audio file looped under the cues')
+    parser.add_argument('--ambient-gain', type=float, default=AMBIENT_GAIN)
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE)
+    parser.add_argument('--channels', type=int, choices=(1, 2), default=DEFAULT_CHANNELS)
+    args = parser.parse_args(argv)
+
+    if args.preset:
+        from session import load_preset
+        preset = load_preset(args.preset, args.presets)
+        if preset is None:
+            parser.error(f"no preset named '{args.preset}'")
+        start, end, duration = preset
+    elif args.start:
+        start = args.start
+        end = args.end or args.start
+        duration = args.duration
+        if duration is None:
+            parser.error('--duration is required with --start')
+    else:
+        parser.error('give either --preset or --start')
+    if args.preset and args.duration is not None:
+        duration = args.duration
+
+    try:
+        export_track(args.output, start, end, duration, args.ambient, args.ambient_gain, args.rate, args.channels)
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f'Wrote {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.graphics import Color, Rectangle
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+
+from instrumentation import HISTOGRAM_EDGES_MS, SPAN_NAMES, instrumentation
+
+OVERLAY_SIZE = (560, 340)
+HISTOGRAM_HEIGHT = 110
+# Summarising sorts the whole recording, so it is not done every frame.
+REFRESH_INTERVAL = 1.0
+
+def bucket_label(index):
+    if index < len(HISTOGRAM_EDGES_MS):
+        return f'≤{HISTOGRAM_EDGES_MS[index]}'
+    return f'>{HISTOGRAM_EDGES_MS[-1]}'
+
+# ============================================================================
+# FrameTimingOverlay
+# ----------------------------------------------------------------------------
+# A translucent panel in the top left corner of the window with the frame
+# time histogram, dt and lateness percentiles, dropped frames, cue latency
+# and the per-call cost of the instrumented hot paths. It sits on the window
+# rather than in the layout, so showing it does not move anything.
+# ============================================================================
+class FrameTimingOverlay(Widget):
+    def __init__(self, **kwargs):
+        super().__init__(size_hint=(None, None), size=OVERLAY_SIZE, **kwargs)
+        buckets = len(HISTOGRAM_EDGES_MS) + 1
+        with self.canvas:
+            Color(0, 0, 0, 0.7)
+            self.background = Rectangle()
+            Color(0.988, 0.667, 0.992, 1)
+            self.bars = [Rectangle(size=(0, 0)) for _ in range(buckets)]
+        self.text = Label(halign='left', valign='top', font_size='12sp')
+        self.add_widget(self.text)
+        self.bucket_labels = [Label(text=bucket_label(i), font_size='10sp') for i in range(buckets)]
+        for label in self.bucket_labels:
+            self.add_widget(label)
+        self.event = None
+        self.bind(pos=self.refresh, size=self.refresh)
+        Window.bind(size=self.place)
+
+    def show(self):
+        if self.parent is None:
+            Window.add_widget(self)
+        self.place()
+        self.refresh()
+        if self.event is None:
+            self.event = Clock.schedule_interval(self.refresh, REFRESH_INTERVAL)
+
+    def hide(self):
+        if self.event:
+            self.event.cancel()
+            self.event = None
+        if self.parent is not None:
+            self.parent.remove_widget(self)
+
+    def place(self, *args):
+        self.pos = (0, Window.height - self.height)
+
+    def refresh(self, *args):
+        summary = instrumentation.summary()
+        x, y = self.pos
+        width, height = self.size
+        self.background.pos = self.pos
+        self.background.size = self.size
+        lines = [
+            f"frames {summary['frames']}   dropped {summary['dropped']}",
+            f"dt p50 {summary['dt_p50']:.1f} ms   p99 {summary['dt_p99']:.1f} ms",
+            f"late p50 {summary['late_p50']:.1f} ms   p99 {summary['late_p99']:.1f} ms",
+            f"cue latency p50 {summary['sound_p50']:.1f} ms   p99 {summary['sound_p99']:.1f} ms",
+        ]
+        for name in SPAN_NAMES:
+            span = summary['spans'][name]
+            lines.append(f"{name} ×{span['count']}   p50 {span['p50'] * 1000:.0f} µs   p99 {span['p99'] * 1000:.0f} µs")
+        self.text.text = '\n'.join(lines)
+        self.text.pos = (x + 10, y + HISTOGRAM_HEIGHT + 20)
+        self.text.size = (width - 20, height - HISTOGRAM_HEIGHT - 30)
+        self.text.text_size = self.text.size
+        # Histogram of frame times, scaled to the fullest bucket.
+        histogram = summary['histogram']
+        tallest = max(histogram) or 1
+        slot = (width - 20) / len(histogram)
+        for i, (bar, label, count) in enumerate(zip(self.bars, self.bucket_labels, histogram)):
+            bar.pos = (x + 10 + i * slot + 4, y + 20)
+            bar.size = (slot - 8, (HISTOGRAM_HEIGHT - 10) * count / tallest)
+            label.pos = (x + 10 + i * slot, y)
+            label.size = (slot, 20)
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+# ============================================================================
+# Group sessions
+# ----------------------------------------------------------------------------
+# One session timeline shared by many devices in a class. A GroupServer
+# publishes the session (cycle times, duration, and where its clock stands)
+# to every connected GroupClient; clients estimate the offset between their
+# clock and the server's, so they all compute the same session time and the
+# same phase at the same moment.
+#
+# The protocol is JSON, one message per line, over TCP:
+#
+#   server → client  {"type": "session", "session": {...} or null}
+#                    {"type": "pong", "t": <client time>, "server": <server time>}
+#   client → server  {"type": "ping", "t": <client time>}
+#
+# The server has no tick: it only writes when the session changes (the same
+# encoded message to every client) and answers pings, so its work per second
+# does not grow with the length of the session.
+#
+#   python group_session.py serve --preset Chill     host a session (console)
+#   python group_session.py clients --count 200      many clients, one process
+# ============================================================================
+
+PORT = 8765
+# Pings right after connecting, for a first estimate, then one per interval.
+SYNC_PINGS = 8
+SYNC_PING_SPACING = 0.1
+PING_INTERVAL = 5.0
+# The offset comes from the ping with the shortest round trip among these.
+OFFSET_SAMPLES = 16
+RECONNECT_DELAY = 2.0
+# A client that stops reading is dropped once this much is waiting for it.
+MAX_BUFFERED = 64 * 1024
+
+server_clock = time.monotonic
+
+# The clock of a session stands at `elapsed` at server time `anchor` and runs
+# from there while `running`. `session` counts the sessions started on a
+# server, `version` every change (start, pause, resume).
+SessionState = namedtuple('SessionState', 'session version start_cycle_time end_cycle_time duration elapsed anchor running')
+
+def session_time_at(state, server_time):
+    if not state.running:
+        return state.elapsed
+    return state.elapsed + server_time - state.anchor
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+def session_message(state):
+    return encode({'type': 'session', 'session': state._asdict() if state else None})
+
+# ============================================================================
+# GroupServer
+# ----------------------------------------------------------------------------
+# start_session(), pause(), resume() and stop_session() may be called from
+# any thread; the new state is visible to session_time() at once and sent to
+# the clients from the server's event loop.
+# ============================================================================
+class GroupServer:
+    def __init__(self, host='0.0.0.0', port=PORT):
+        self.host = host
+        self.port = port
+        self.state = None
+        self.sessions = 0
+        self.message = session_message(None)
+        self.writers = set()
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    # Session control -------------------------------------------------------
+
+    def start_session(self, start_cycle_time, end_cycle_time, duration):
+        self.sessions += 1
+        self.publish(SessionState(self.sessions, 0, list(start_cycle_time), list(end_cycle_time), duration,
+                                  0.0, server_clock(), True))
+
+    def pause(self):
+        state = self.state
+        if state is not None and state.running:
+            now = server_clock()
+            self.publish(state._replace(version=state.version + 1, elapsed=session_time_at(state, now),
+                                        anchor=now, running=False))
+
+    def resume(self):
+        state = self.state
+        if state is not None and not state.running:
+            self.publish(state._replace(version=state.version + 1, anchor=server_clock(), running=True))
+
+    def stop_session(self):
+        if self.state is not None:
+            self.publish(None)
+
+    def session_time(self):
+        state = self.state
+        return None if state is None else session_time_at(state, server_clock())
+
+    def publish(self, state):
+        self.state = state
+        self.message = session_message(state)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.broadcast)
+
+    def broadcast(self):
+        message = self.message
+        for writer in list(self.writers):
+            self.send(writer, message)
+
+    def send(self, writer, message):
+        if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            self.writers.discard(writer)
+            writer.transport.abort()
+            return
+        writer.write(message)
+
+    # Networking ------------------------------------------------------------
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        self.send(writer, self.message)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    break
+                if message.get('type') == 'ping':
+                    self.send(writer, encode({'type': 'pong', 't': message.get('t'), 'server': server_clock()}))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]  # When started on port 0
+
+    def start_in_thread(self):
+        """ Run the server on its own event loop thread; returns once it listens """
+        started = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.serve())
+            except OSError as e:
+                failure.append(e)
+                started.set()
+                loop.close()
+                return
+            started.set()
+            loop.run_forever()
+            loop.close()
+
+        self.thread = threading.Thread(target=run, name='GroupServer', daemon=True)
+        self.thread.start()
+        started.wait()
+        if failure:
+            self.thread = None
+            raise failure[0]
+
+    def stop(self):
+        loop = self.loop
+        if loop is None:
+            return
+
+        def shutdown():
+            self.server.close()
+            for writer in list(self.writers):
+                writer.transport.abort()
+            self.writers.clear()
+            loop.stop()
+        loop.call_soon_threadsafe(shutdown)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.loop = None
+
+# ============================================================================
+# GroupClient
+# ----------------------------------------------------------------------------
+# Follows a GroupServer: keeps its latest SessionState and an estimate of the
+# server clock, and reconnects when the connection drops (the session clock
+# keeps running meanwhile). on_session(state) is called on the client's
+# thread whenever the state changes, with None when the session has stopped.
+#
+# The clock offset is NTP-style: a ping answered at server time s after a
+# round trip r puts the server clock at s + r/2 when the answer arrives. The
+# sample with the shortest round trip is the least distorted by queueing, so
+# it is the one used.
+# ============================================================================
+class GroupClient:
+    def __init__(self, host, port=PORT, on_session=None):
+        self.host = host
+        self.port = port
+        self.on_session = on_session
+        self.state = None
+        self.offset = 0.0
+        self.samples = deque(maxlen=OFFSET_SAMPLES)  # (round trip, offset)
+        self.connected = False
+        self.loop = None
+        self.task = None
+        self.thread = None
+
+    def server_time(self):
+        return time.monotonic() + self.offset
+
+    def session_time(self):
+        state = self.state
+        return None if state is None else session_time_at(state, self.server_time())
+
+    def round_trip(self):
+        return min(self.samples)[0] if self.samples else None
+
+    def handle(self, message):
+        kind = message.get('type')
+        if kind == 'pong':
+            now = time.monotonic()
+            rtt = now - message['t']
+            self.samples.append((rtt, message['server'] + rtt / 2 - now))
+            self.offset = min(self.samples)[1]
+        elif kind == 'session':
+            session = message.get('session')
+            self.state = SessionState(**session) if session else None
+            if self.on_session is not None:
+                self.on_session(self.state)
+
+    async def ping(self, writer):
+        for i in range(SYNC_PINGS):
+            writer.write(encode({'type': 'ping', 't': time.monotonic()}))
+            # Jittered, so that clients that connected together do not queue
+            # their pings behind each other's on every round.
+            await asyncio.sleep(SYNC_PING_SPACING * random.uniform(0.5, 1.5))
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            writer.write(encode({'type': 'ping', 't': time.monotonic()}))
+
+    async def follow(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connected = True
+        pinger = asyncio.ensure_future(self.ping(writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self.handle(json.loads(line))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    # A malformed message (or one from a newer host) is
+                    # dropped; the connection and the current state stay.
+                    print(f"Group session {self.host}:{self.port}: dropped message: {e!r}")
+        finally:
+            self.connected = False
+            pinger.cancel()
+            writer.close()
+
+    async def run(self):
+        while True:
+            try:
+                await self.follow()
+            except (OSError, ValueError) as e:
+                print(f"Group session {self.host}:{self.port}: {e}")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def start_in_thread(self):
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.task = self.loop.create_task(self.run())
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name='GroupClient', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        while self.task is None:  # Not created yet
+            time.sleep(0.001)
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join()
+        self.thread = None
+
+def parse_address(address, default_host='127.0.0.1'):
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        return address or default_host, PORT
+    return host or default_host, int(port)
+
+# ============================================================================
+# Command line
+# ============================================================================
+async def console(server, session):
+    # Reads commands from stdin while the server runs on the same loop.
+    loop = asyncio.get_running_loop()
+    print(f'Serving on {server.host}:{server.port}; commands: start pause resume stop status quit')
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        command = line.strip()
+        if not line or command == 'quit':
+            return
+        if command == 'start':
+            server.start_session(*session)
+        elif command == 'pause':
+            server.pause()
+        elif command == 'resume':
+            server.resume()
+        elif command == 'stop':
+            server.stop_session()
+        elif command == 'status':
+            t = server.session_time()
+            print(f"{len(server.writers)} clients; " + ('no session' if t is None else f'session time {t:.1f} s'))
+        elif command:
+            print(f'Unknown command: {command}')
+
+async def serve_main(args, session):
+    server = GroupServer(args.host, args.port)
+    await server.serve()
+    if args.autostart:
+        server.start_session(*session)
+    await console(server, session)
+
+async def clients_main(args):
+    # Many clients on one loop, reporting what each would show after a while.
+    host, port = parse_address(args.address)
+    clients = [GroupClient(host, port) for _ in range(args.count)]
+    tasks = [asyncio.ensure_future(client.run()) for client in clients]
+    await asyncio.sleep(args.seconds)
+    now = time.monotonic()
+    report = {
+        'connected': sum(client.connected for client in clients),
+        # Only meaningful on the server's machine, whose clock is the same.
+        'offsets': [client.offset for client in clients],
+        'round_trips': [client.round_trip() for client in clients],
+        'versions': [None if client.state is None else [client.state.session, client.state.version]
+                     for client in clients],
+        'session_times': [None if client.state is None else session_time_at(client.state, now + client.offset)
+                          for client in clients],
+        'at': now,
+    }
+    for task in tasks:
+        task.cancel()
+    print(json.dumps(report))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve or follow a group breathing session.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='host a session')
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=PORT)
+    serve.add_argument('--preset', default='Chill', help='name of a default preset')
+    serve.add_argument('--start', type=float, nargs=4, metavar='S', help='start cycle: inhale hold exhale hold')
+    serve.add_argument('--end', type=float, nargs=4, metavar='S', help='end cycle (default: the start cycle)')
+    serve.add_argument('--duration', type=float, help='session length in seconds')
+    serve.add_argument('--autostart', action='store_true', help='start the session right away')
+    clients = commands.add_parser('clients', help='connect many clients and report their clocks')
+    clients.add_argument('address', nargs='?', default=f'127.0.0.1:{PORT}')
+    clients.add_argument('--count', type=int, default=100)
+    clients.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'clients':
+        asyncio.run(clients_main(args))
+        return 0
+    if args.start:
+        session = (args.start, args.end or args.start, args.duration or 5 * 60)
+    else:
+        from presets_store import DEFAULT_PRESETS
+        if args.preset not in DEFAULT_PRESETS:
+            parser.error(f"no default preset named '{args.preset}'")
+        session = DEFAULT_PRESETS[args.preset]
+        if args.duration:
+            session = (session[0], session[1], args.duration)
+    asyncio.run(serve_main(args, session))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+
+from persistence import write_json_atomic
+
+MAGIC = b'BR3H'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')  # magic, version, record size
+# started_at, planned and actual seconds, breaths, interruptions, flags,
+# effective start and end cycle times, preset name (UTF-8, NUL padded).
+RECORD = struct.Struct('<dddIHH4f4f32s')
+FLAG_COMPLETED = 1
+
+SessionRecord = namedtuple('SessionRecord',
+                           'started_at planned actual breaths interruptions completed start_cycle end_cycle preset')
+
+def stored_preset_name(name):
+    """ The preset name as the log keeps it: at most 32 bytes of UTF-8 """
+    return name.encode('utf-8')[:32].decode('utf-8', 'ignore')
+
+def pack_record(record):
+    return RECORD.pack(record.started_at, record.planned, record.actual, record.breaths,
+                       min(record.interruptions, 0xFFFF), FLAG_COMPLETED if record.completed else 0,
+                       *record.start_cycle, *record.end_cycle, record.preset.encode('utf-8')[:32])
+
+def unpack_record(buffer, offset):
+    fields = RECORD.unpack_from(buffer, offset)
+    started_at, planned, actual, breaths, interruptions, flags = fields[:6]
+    preset = fields[14].rstrip(b'\0').decode('utf-8', 'ignore')
+    return SessionRecord(started_at, planned, actual, breaths, interruptions, bool(flags & FLAG_COMPLETED),
+                         list(fields[6:10]), list(fields[10:14]), preset)
+
+def session_day(started_at):
+    return datetime.date.fromtimestamp(started_at)
+
+# ============================================================================
+# SessionStats
+# ----------------------------------------------------------------------------
+# Running aggregates over the history log. add() folds in one record, so the
+# totals follow the log as it grows instead of being recomputed from it.
+# `records` is how many log records have been folded in.
+# ============================================================================
+class SessionStats:
+    def __init__(self, data=None):
+        data = data or {}
+        self.records = data.get('records', 0)
+        self.sessions = data.get('sessions', 0)
+        self.seconds = data.get('seconds', 0.0)
+        self.breaths = data.get('breaths', 0)
+        self.daily = data.get('daily', {})  # ISO date -> seconds
+        self.presets = data.get('presets', {})  # preset name -> seconds
+        self.last_day = data.get('last_day')
+        self.streak = data.get('streak', 0)
+        self.longest_streak = data.get('longest_streak', 0)
+
+    def to_json(self):
+        return {
+            'version': VERSION,
+            'records': self.records,
+            'sessions': self.sessions,
+            'seconds': self.seconds,
+            'breaths': self.breaths,
+            'daily': self.daily,
+            'presets': self.presets,
+            'last_day': self.last_day,
+            'streak': self.streak,
+            'longest_streak': self.longest_streak,
+        }
+
+    def copy(self):
+        return SessionStats(json.loads(json.dumps(self.to_json())))
+
+    def add(self, record):
+        self.records += 1
+        self.sessions += 1
+        self.seconds += record.actual
+        self.breaths += record.breaths
+        day = session_day(record.started_at)
+        key = day.isoformat()
+        self.daily[key] = self.daily.get(key, 0.0) + record.actual
+        if record.preset:
+            preset = stored_preset_name(record.preset)
+            self.presets[preset] = self.presets.get(preset, 0.0) + record.actual
+        if self.last_day is None or key > self.last_day:
+            last_day = None if self.last_day is None else datetime.date.fromisoformat(self.last_day)
+            self.streak = self.streak + 1 if last_day == day - datetime.timedelta(days=1) else 1
+            self.last_day = key
+        self.longest_streak = max(self.longest_streak, self.streak)
+
+    def current_streak(self, today=None):
+        """ The streak still counts until a whole day has been missed """
+        if self.last_day is None:
+            return 0
+        today = today or datetime.date.today()
+        missed = (today - datetime.date.fromisoformat(self.last_day)).days
+        return self.streak if missed <= 1 else 0
+
+    def day_seconds(self, day):
+        return self.daily.get(day.isoformat(), 0.0)
+
+# ============================================================================
+# SessionHistory
+# ----------------------------------------------------------------------------
+# Every session is appended as one fixed-size record to history.bin; records
+# are never rewritten, and are read back through mmap. The aggregates live in
+# history_stats.json next to it, together with the number of records they
+# cover: opening folds in only the records appended since (after a crash
+# between the two writes, say), never the whole log.
+#
+# append() only queues the record; a background thread writes it, fsyncs and
+# updates the aggregates, so ending a session from the frame callback costs
+# nothing. flush() writes whatever is pending right away (on pause/stop).
+# ============================================================================
+class SessionHistory:
+    def __init__(self, directory):
+        self.log_path = os.path.join(directory, 'history.bin')
+        self.stats_path = os.path.join(directory, 'history_stats.json')
+        self.stats = SessionStats()
+        self.pending = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.io_lock = threading.Lock()
+        self.loaded = threading.Event()
+        self.thread = None
+
+    def open(self):
+        self.thread = threading.Thread(target=self.run, name='SessionHistory', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.load()
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.changed.wait()
+            self.flush()
+
+    def load(self):
+        try:
+            with self.io_lock:
+                self.check_header()
+                try:
+                    with open(self.stats_path, 'r') as f:
+                        data = json.load(f)
+                    valid = isinstance(data, dict) and data.get('version') == VERSION
+                    stats = SessionStats(data) if valid else SessionStats()
+                except (FileNotFoundError, json.JSONDecodeError, ValueError):
+                    stats = SessionStats()
+                count = self.record_count()
+                if stats.records > count:
+                    # The log was replaced or truncated; start the aggregates over.
+                    stats = SessionStats()
+                folded = stats.records
+                for record in self.read(stats.records, count):
+                    stats.add(record)
+                with self.lock:
+                    self.stats = stats
+                if stats.records != folded:
+                    self.save_stats(stats)
+        finally:
+            # snapshot() and flush() wait for this, flush() on the UI thread.
+            self.loaded.set()
+
+    def check_header(self):
+        try:
+            with open(self.log_path, 'rb') as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return
+        if not header:
+            return  # Created, but the first write never made it.
+        if len(header) == HEADER.size and HEADER.unpack(header) == (MAGIC, VERSION, RECORD.size):
+            return
+        bad_path = self.log_path + '.bad'
+        try:
+            os.replace(self.log_path, bad_path)
+        except OSError as e:
+            print(f"Error moving unrecognised session history to {bad_path}: {e}")
+            return
+        print(f"Unrecognised session history, moved to {bad_path}")
+
+    def record_count(self):
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+        return max(0, (size - HEADER.size) // RECORD.size)
+
+    def read(self, start=0, stop=None):
+        """ Records start..stop in log order """
+        count = self.record_count()
+        stop = count if stop is None else min(stop, count)
+        if start >= stop:
+            return []
+        with open(self.log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            return [unpack_record(view, HEADER.size + i * RECORD.size) for i in range(start, stop)]
+
+    def recent(self, n):
+        """ The last n sessions, newest first """
+        count = self.record_count()
+        return self.read(max(0, count - n), count)[::-1]
+
+    def snapshot(self):
+        self.loaded.wait()
+        with self.lock:
+            return self.stats.copy()
+
+    def append(self, record):
+        with self.lock:
+            self.pending.append(record)
+            self.changed.notify()
+
+    def flush(self):
+        if self.thread is None:
+            return
+        # Records are folded into the aggregates, so those must be read first.
+        self.loaded.wait()
+        with self.io_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                self.write_records(pending)
+            except OSError as e:
+                print(f"Error writing {self.log_path}: {e}")
+                return
+            with self.lock:
+                for record in pending:
+                    self.stats.add(record)
+                stats = self.stats.copy()
+            self.save_stats(stats)
+
+    def write_records(self, records):
+        with open(self.log_path, 'ab') as f:
+            size = f.tell()
+            if size < HEADER.size:
+                f.truncate(0)
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            else:
+                # Drop a record torn by a crash half way through its write.
+                whole = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+                if whole != size:
+                    f.truncate(whole)
+            f.write(b''.join(pack_record(record) for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save_stats(self, stats):
+        try:
+            write_json_atomic(self.stats_path, stats.to_json())
+        except OSError as e:
+            print(f"Error writing {self.stats_path}: {e}")
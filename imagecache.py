@@ -0,0 +1,68 @@
+import hashlib
+import os
+import struct
+import zlib
+
+def file_digest(path):
+    """ Short content hash of a file, used to key derived images """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+def cached_image_path(cache_dir, prefix, key, size):
+    return os.path.join(cache_dir, f'{prefix}-{key}-{size[0]}x{size[1]}.png')
+
+def prune_cache(cache_dir, prefix, key):
+    """ Remove images derived from older versions of a source """
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix + '-') and not name.startswith(f'{prefix}-{key}-'):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+def write_png(path, width, height, rgba, flip=False):
+    """ Encode 8-bit RGBA pixels as PNG; flip for bottom-up (GL) row order """
+    stride = width * 4
+    rows = range(height - 1, -1, -1) if flip else range(height)
+    raw = b''.join(b'\x00' + rgba[y * stride:(y + 1) * stride] for y in rows)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+    png = (b'\x89PNG\r\n\x1a\n'
+           + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+           + chunk(b'IDAT', zlib.compress(raw, 6))
+           + chunk(b'IEND', b''))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+
+def read_png(path):
+    """ (width, height, rgba) of a PNG written by write_png (top-down rows), or None for any other PNG """
+    with open(path, 'rb') as f:
+        png = f.read()
+    if png[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    header, data, pos = None, [], 8
+    try:
+        while pos + 8 <= len(png):
+            length, tag = struct.unpack('>I4s', png[pos:pos + 8])
+            body = png[pos + 8:pos + 8 + length]
+            if tag == b'IHDR':
+                header = struct.unpack('>IIBBBBB', body)
+            elif tag == b'IDAT':
+                data.append(body)
+            pos += 12 + length
+        if header is None or header[2:] != (8, 6, 0, 0, 0):
+            return None
+        raw = zlib.decompress(b''.join(data))
+    except (struct.error, zlib.error):
+        return None  # Truncated or corrupt
+    width, height = header[:2]
+    stride = width * 4
+    if len(raw) != height * (stride + 1) or any(raw[y * (stride + 1)] for y in range(height)):
+        return None  # Rows with PNG filters other than none
+    return width, height, b''.join(raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)] for y in range(height))
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from array import array
+
+# BREATHE3_INSTRUMENT=1 starts recording (and shows the overlay) at startup;
+# otherwise it is switched on from the settings panel.
+
+# Span kinds, in the order of SPAN_NAMES.
+ANIMATE, CANVAS, LABELS, SOUND = range(4)
+SPAN_NAMES = ('animate_circle', 'update_canvas', 'labels', 'sound.play')
+# Upper edges of the frame time histogram buckets, in milliseconds; the last
+# bucket takes everything above.
+HISTOGRAM_EDGES_MS = (8, 17, 25, 33, 50, 100, 250)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+# ============================================================================
+# RingBuffer
+# ----------------------------------------------------------------------------
+# Fixed-capacity rows of floats stored column-wise in preallocated arrays;
+# once full, each append overwrites the oldest row. Appending allocates
+# nothing, so recording stays cheap enough to leave on during a session.
+# ============================================================================
+class RingBuffer:
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.columns = [array('d', bytes(8 * capacity)) for _ in range(columns)]
+        self.count = 0  # Rows ever appended
+
+    def append(self, *values):
+        i = self.count % self.capacity
+        for column, value in zip(self.columns, values):
+            column[i] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def column(self, index):
+        """ One column, oldest row first """
+        values = self.columns[index]
+        if self.count <= self.capacity:
+            return values[:self.count].tolist()
+        split = self.count % self.capacity
+        return (values[split:] + values[:split]).tolist()
+
+    def rows(self):
+        return list(zip(*(self.column(i) for i in range(len(self.columns)))))
+
+    def clear(self):
+        self.count = 0
+
+# ============================================================================
+# Instrumentation
+# ----------------------------------------------------------------------------
+# Opt-in recording of frame timing. Callers check `enabled` before taking a
+# timestamp, so a disabled instance costs one attribute read per call site.
+#
+#   frames: when each frame ran, its dt, and how much later than requested
+#   spans:  time spent in animate_circle, update_canvas, label updates and
+#           starting cue sounds
+#   sounds: how far past its phase boundary each cue was started
+#
+# A frame counts as dropped when it ran more than one frame interval later
+# than the delay it was scheduled with.
+#
+# Spans and sounds are also recorded from the cue scheduler thread, so they
+# are appended and read under `lock`.
+# ============================================================================
+class Instrumentation:
+    def __init__(self, enabled=False, capacity=4096):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.frames = RingBuffer(capacity, 3)  # time, dt, lateness
+        self.spans = RingBuffer(capacity * 4, 3)  # kind, start, duration
+        self.sounds = RingBuffer(256, 3)  # time, phase, latency
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def reset(self):
+        self.origin = time.perf_counter()
+        self.frames.clear()
+        with self.lock:
+            self.spans.clear()
+            self.sounds.clear()
+        self.dropped = 0
+
+    def frame(self, dt, requested, frame_interval):
+        lateness = max(0.0, dt - requested)
+        self.frames.append(time.perf_counter() - self.origin, dt, lateness)
+        if lateness > frame_interval:
+            self.dropped += 1
+
+    def span(self, kind, started):
+        duration = time.perf_counter() - started
+        with self.lock:
+            self.spans.append(kind, started - self.origin, duration)
+
+    def sound(self, phase, latency):
+        at = time.perf_counter() - self.origin
+        with self.lock:
+            self.sounds.append(at, phase, latency)
+
+    def summary(self):
+        """ Percentiles in milliseconds, and the frame time histogram counts """
+        dts = sorted(self.frames.column(1))
+        lateness = sorted(self.frames.column(2))
+        with self.lock:
+            latencies = sorted(self.sounds.column(2))
+            span_rows = self.spans.rows()
+        spans = {name: [] for name in SPAN_NAMES}
+        for kind, start, duration in span_rows:
+            spans[SPAN_NAMES[int(kind)]].append(duration)
+        histogram = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+        bucket = 0
+        for dt in dts:  # Sorted, so the bucket only moves forward
+            while bucket < len(HISTOGRAM_EDGES_MS) and dt * 1000 > HISTOGRAM_EDGES_MS[bucket]:
+                bucket += 1
+            histogram[bucket] += 1
+        result = {
+            'frames': self.frames.count,
+            'dropped': self.dropped,
+            'dt_p50': percentile(dts, 0.5) * 1000,
+            'dt_p99': percentile(dts, 0.99) * 1000,
+            'late_p50': percentile(lateness, 0.5) * 1000,
+            'late_p99': percentile(lateness, 0.99) * 1000,
+            'sound_p50': percentile(latencies, 0.5) * 1000,
+            'sound_p99': percentile(latencies, 0.99) * 1000,
+            'histogram': histogram,
+            'spans': {},
+        }
+        for name, durations in spans.items():
+            durations.sort()
+            result['spans'][name] = {
+                'count': len(durations),
+                'p50': percentile(durations, 0.5) * 1000,
+                'p99': percentile(durations, 0.99) * 1000,
+            }
+        return result
+
+    def chrome_trace(self):
+        """ The recording as Chrome trace-event JSON (chrome://tracing, Perfetto) """
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'Breathe3'}}]
+        with self.lock:
+            span_rows = self.spans.rows()
+            sound_rows = self.sounds.rows()
+        for kind, start, duration in span_rows:
+            events.append({'name': SPAN_NAMES[int(kind)], 'ph': 'X', 'pid': 1, 'tid': 1,
+                           'ts': start * 1e6, 'dur': duration * 1e6})
+        for at, dt, lateness in self.frames.rows():
+            events.append({'name': 'frame', 'ph': 'C', 'pid': 1, 'tid': 1, 'ts': at * 1e6,
+                           'args': {'dt_ms': dt * 1000, 'late_ms': lateness * 1000}})
+        for at, phase, latency in sound_rows:
+            events.append({'name': f'cue {int(phase)}', 'ph': 'i', 's': 't', 'pid': 1, 'tid': 1, 'ts': at * 1e6,
+                           'args': {'latency_ms': latency * 1000}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'dropped_frames': self.dropped, 'frames': self.frames.count}}
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+instrumentation = Instrumentation(enabled=os.environ.get('BREATHE3_INSTRUMENT') not in (None, '', '0'))
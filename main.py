@@ -3,40 +3,107 @@ import sys
 import json
 import math
 import time
+import threading
 
-from kivy.core.audio import SoundLoader
-from kivy.core.image import Image as CoreImage
+from startup import profiler
+
+from kivy.core.text import Label as CoreLabel
 from kivy.core.window import Window
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.widget import Widget
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.popup import Popup
-from kivy.uix.textinput import TextInput
-from kivy.graphics import Color, Ellipse, Rectangle
+from kivy.graphics import Color, Ellipse, InstructionGroup, Rectangle
 from kivy.clock import Clock
-from kivy.properties import NumericProperty, ListProperty, BooleanProperty
+from kivy.properties import NumericProperty, ListProperty, BooleanProperty, StringProperty
 from kivy.uix.slider import Slider
 from kivy.uix.label import Label
 
-ALLOW_INF = False
+from audio import SOUND_NAMES, PcmCache, find_sound_asset
+from cues import END_CUE, CueScheduler
+from history import SessionHistory
+from instrumentation import ANIMATE, CANVAS, LABELS, SOUND, instrumentation
+from imagecache import cached_image_path, file_digest, prune_cache, write_png
+from persistence import state_store
+from session import (MAX_DURATION, UNBOUNDED, BreathSession, CueClock, duration_text, has_end, is_unbounded,
+                     shows_infinity)
+from session_model import COUNTDOWN, CYCLE_TIME, DURATION, PERSISTED, RAMP, RUNNING, SessionModel
+from timeline import ring_radii
+
+# Modules only needed by the settings panel, the preset editor, audio or the
+# background (RecycleView, Popup, TextInput, SoundLoader, Loader, jnius) are
+# imported where they are first used, after the first frame.
+profiler.end_imports()
+
+# Frame rate caps offered in the settings; the first one is the default.
+FRAME_RATE_CAPS = (60, 30, 20)
+# Longest time a running session may go without a frame, and the smallest ring
+# movement (in pixels) that is worth drawing.
+MAX_FRAME_INTERVAL = 1.0
+MIN_VISIBLE_CHANGE = 0.5
+# The cycle time sliders, in phase order.
+CYCLE_SLIDER_NAMES = ('Inhale', 'Hold 1', 'Exhale', 'Hold 2')
+# Ways of drawing the rings offered in the settings; the first one is the default.
+RENDERERS = ('ellipses', 'shader', 'particles')
+# Particle counts offered for the particle renderer; the first one is the default.
+PARTICLE_BUDGETS = (1500, 4000, 500)
+# What the breath input listens to; the first one is the default. The demo is
+# a synthetic breather keeping the session's start rhythm.
+BREATH_INPUTS = ('off', 'microphone', 'demo')
+# How often the breath label shows the latest reading, in seconds.
+BREATH_LABEL_INTERVAL = 0.5
+
+# A session on screen keeps the screen on; an audio-only session (paused app,
+# eyes-closed mode) only keeps the CPU awake for its cues.
+SCREEN_WAKE_LOCK = 'SCREEN_BRIGHT_WAKE_LOCK'
+PARTIAL_WAKE_LOCK = 'PARTIAL_WAKE_LOCK'
+
+def available_breath_inputs():
+    """ BREATH_INPUTS, without the microphone where there is nothing to record with """
+    from audio import find_recorder
+    from breath_input import RATE
+    if find_recorder(RATE) is None:
+        return tuple(name for name in BREATH_INPUTS if name != 'microphone')
+    return BREATH_INPUTS
 
-wake_lock = None
+wake_locks = {}
 
-try:
-    from jnius import autoclass, JavaException
-    PowerManager = autoclass('android.os.PowerManager')
-    Context = autoclass('android.content.Context')
-    PythonActivity = autoclass('org.kivy.android.PythonActivity')
+def get_wake_lock(level=SCREEN_WAKE_LOCK):
+    # Looking up the Android classes through jnius is slow, so it happens after
+    # the first frame (or when a session first needs the lock).
+    if level in wake_locks:
+        return wake_locks[level]
+    wake_locks[level] = None
+    try:
+        from jnius import autoclass, JavaException
+        PowerManager = autoclass('android.os.PowerManager')
+        Context = autoclass('android.content.Context')
+        PythonActivity = autoclass('org.kivy.android.PythonActivity')
+
+        activity = PythonActivity.mActivity
+        power_manager = activity.getSystemService(Context.POWER_SERVICE)
+
+        wake_locks[level] = power_manager.newWakeLock(getattr(PowerManager, level), f'Breathe3:{level}')
+    except ImportError:
+        print("Jnius is not available. Wakelock functionality will be disabled.")
+    except Exception as e:
+        print(f"Exception: {e}")
+    return wake_locks[level]
 
-    activity = PythonActivity.mActivity
-    power_manager = activity.getSystemService(Context.POWER_SERVICE)
+def hold_wake_lock(level=None):
+    """ Hold the wake lock of this level and release the other one; None releases both """
+    for candidate in (SCREEN_WAKE_LOCK, PARTIAL_WAKE_LOCK):
+        wake_lock = get_wake_lock(candidate)
+        if wake_lock is None:
+            continue
+        if candidate == level and not wake_lock.isHeld():
+            wake_lock.acquire()
+        elif candidate != level and wake_lock.isHeld():
+            wake_lock.release()
 
-    wake_lock = power_manager.newWakeLock(PowerManager.SCREEN_BRIGHT_WAKE_LOCK, 'Breathe3:WakelockTag')
-except ImportError:
-    print("Jnius is not available. Wakelock functionality will be disabled.")
-except Exception as e:
-    print(f"Exception: {e}")
+def after_first_frame(callback):
+    # Callbacks scheduled with a zero timeout run before the frame is drawn, so
+    # go through one more frame to be sure the first one is on screen.
+    Clock.schedule_once(lambda dt: Clock.schedule_once(callback))
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -46,20 +113,130 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def sin_intp(x):
-    return (1-math.cos(x*math.pi))/2
+def ellipse_segments(radius_px):
+    # Roughly one segment per 8 px of circumference, in steps of 8 so that a
+    # ring growing by a pixel does not regenerate its vertex buffer.
+    segments = int(2 * math.pi * radius_px / 8) // 8 * 8
+    return max(24, min(180, segments))
+
+def set_text(label, text):
+    # Every text assignment that differs re-rasterises the label texture, so
+    # callers on hot paths go through here.
+    if label.text != text:
+        label.text = text
+
+# ============================================================================
+# GlyphLabel
+# ----------------------------------------------------------------------------
+# Draws single-line text from a cache of per-character textures instead of
+# rendering the whole string into a new texture on every change. Used for the
+# large countdown, whose text is a handful of digits that change every second.
+# ============================================================================
+class GlyphLabel(Widget):
+    text = StringProperty('')
+    font_size = NumericProperty(15)
+    bold = BooleanProperty(False)
+    glyph_cache = {}
+
+    def __init__(self, prerender='0123456789:', **kwargs):
+        super(GlyphLabel, self).__init__(**kwargs)
+        self.rects = []
+        with self.canvas:
+            Color(1, 1, 1, 1)
+        self.bind(text=self.update_glyphs, pos=self.update_glyphs, size=self.update_glyphs,
+                  font_size=self.update_glyphs, bold=self.update_glyphs)
+        Clock.schedule_once(lambda dt: [self.glyph(char) for char in prerender])
+
+    def glyph(self, char):
+        key = (char, self.font_size, self.bold)
+        texture = self.glyph_cache.get(key)
+        if texture is None:
+            label = CoreLabel(text=char, font_size=self.font_size, bold=self.bold)
+            label.refresh()
+            texture = self.glyph_cache[key] = label.texture
+        return texture
+
+    def update_glyphs(self, *args):
+        textures = [self.glyph(char) for char in self.text]
+        while len(self.rects) < len(textures):
+            with self.canvas:
+                self.rects.append(Rectangle(size=(0, 0)))
+        x = self.center_x - sum(texture.width for texture in textures) / 2
+        for rect, texture in zip(self.rects, textures):
+            rect.texture = texture
+            rect.size = texture.size
+            rect.pos = (x, self.center_y - texture.height / 2)
+            x += texture.width
+        for rect in self.rects[len(textures):]:
+            rect.size = (0, 0)
+
+# ============================================================================
+# SoundBank
+# ----------------------------------------------------------------------------
+# The cue sounds, keyed like SOUND_NAMES. Nothing is loaded at construction:
+# preload() decodes the compressed assets into WAVs under the cache dir on a
+# background thread, then creates the backend sounds on the UI thread, one
+# per frame. A cue needed before that is loaded on demand. The backend reads
+# the files itself (SoundLoader takes no sample data), so no samples are
+# kept here.
+# ============================================================================
+class SoundBank:
+    def __init__(self):
+        assets_dir = resource_path('assets')
+        self.paths = {key: find_sound_asset(assets_dir, name) for key, name in SOUND_NAMES.items()}
+        self.sounds = {}
+        self.pcm = None
+
+    def preload(self, cache_dir=None):
+        self.pcm = PcmCache(cache_dir)
+        threading.Thread(target=self.decode_all, name='SoundBank', daemon=True).start()
+
+    def decode_all(self):
+        for path in self.paths.values():
+            if path:
+                try:
+                    self.pcm.prepare(path)
+                except Exception as e:
+                    print(f"Error decoding {path}: {e}")
+        Clock.schedule_once(self.load_next)
+
+    def load_next(self, dt):
+        for key in self.paths:
+            if key not in self.sounds:
+                self.load(key)
+                Clock.schedule_once(self.load_next)
+                return
+
+    def load(self, key):
+        path = self.paths.get(key)
+        if path and self.pcm:
+            decoded_path = self.pcm.decoded_path(path)
+            if os.path.exists(decoded_path):
+                path = decoded_path
+        from kivy.core.audio import SoundLoader
+        sound = self.sounds[key] = SoundLoader.load(path) if path else None
+        return sound
+
+    def get(self, key):
+        if key in self.sounds:
+            return self.sounds[key]
+        return self.load(key)
 
-def cub_intp(x):
-    if x > 1:
-        x = 2-x
-    return -2*x**3+3*x**2
+    __getitem__ = get
+
+def session_attribute(name):
+    return property(lambda self: getattr(self.session, name),
+                    lambda self, value: setattr(self.session, name, value))
 
 # ============================================================================
 # AnimatedCircle
 # ----------------------------------------------------------------------------
 # We no longer use a single cycle_time; instead we store separate start
-# and end values. In animate_circle() we compute the effective cycle times
-# via linear interpolation over the session.
+# and end values. The session itself (clock, timeline, phases, breaths) is a
+# BreathSession; every frame advances it and looks up its phase, progress and
+# ring radii from the session time, so frames carry no state of their own.
+# Settings changes (slider, drag, preset) go through a SessionModel, which
+# tells the widgets that show them once per frame.
 # ============================================================================
 class AnimatedCircle(Widget):
     radius_a = 75
@@ -68,34 +245,74 @@ class AnimatedCircle(Widget):
     radius_d = 20
     radius_e = 20
     # (Note: the old “cycle_time” property is no longer used.)
+    ring_colors = (
+        (0.094, 0.004, 0.114, 0.25),
+        (0.95, 0.95, 0.95, 0.75),
+        (0.988, 0.667, 0.992, 1),
+        (0.95, 0.95, 0.95, 1),
+        (0.231, 0.051, 0.286, 1),
+    )
+    # Kept on the session, read and written here like attributes.
+    start_cycle_time = session_attribute('start_cycle_time')
+    end_cycle_time = session_attribute('end_cycle_time')
+    selected_duration = session_attribute('selected_duration')
+    duration = session_attribute('duration')
+    elapsed = session_attribute('elapsed')
+    phase = session_attribute('phase')
+    last_phase = session_attribute('last_phase')
+    progress = session_attribute('progress')
+    breaths = session_attribute('breaths')
+    interruptions = session_attribute('interruptions')
+    session_started_at = session_attribute('session_started_at')
+    animation_active = property(lambda self: self.model.running,
+                                lambda self, value: self.model.set_running(value))
 
-    def __init__(self, duration_slider=None, duration_label=None, update_button_label=None, **kwargs):
+    def __init__(self, update_button_label=None, session_ended=None, **kwargs):
+        # Default start and end cycle times (if you want a static cycle, keep them identical)
+        self.session = BreathSession([4, 8, 8, 0], [4, 8, 8, 0], 5 * 60)
+        self.model = SessionModel(self.session, lambda notify: Clock.schedule_once(notify, -1))
+        self.model.subscribe(self.settings_changed, (CYCLE_TIME, DURATION, RAMP))
         super(AnimatedCircle, self).__init__(**kwargs)
-        self.framerate = 1/60
-        self.duration_slider = duration_slider
-        self.duration_label = duration_label
+        self.max_fps = FRAME_RATE_CAPS[0]
         self.update_button_label = update_button_label
+        self.session_ended = session_ended
+        # ShaderRings or ParticleRings when the ellipses are not used.
+        self.ring_renderer = None
+        self.particle_budget = PARTICLE_BUDGETS[0]
+        self.build_canvas()
         self.bind(size=self.update_canvas, pos=self.update_canvas)
-        self.phase = 0
-        self.last_phase = -1
-        self.progress = 0
+        self.animation_active = False
+        self.shown_duration = None
+        # Low-power mode: no frames; the cues go on regardless.
+        self.low_power = False
+        # Cues are played by the scheduler's thread, `cue_latency` early. It
+        # follows the session time of the last frame, run on by the
+        # monotonic clock (local_clock).
+        self.cues = CueScheduler(self.play_cue)
+        self.cue_latency = 0.0
+        self.local_clock = CueClock(self.session)
+        # In a group session, the session time comes from the group's clock.
+        self.session_clock = None
+        # Listens to the user's breathing during a session (see breath_input).
+        self.breath_input = BREATH_INPUTS[0]
+        self.adapt_ramp = False
+        self.breath_monitor = None
         self.initial_touch_pos = None  # For touch–drag duration adjustment
-        self.animation_event = Clock.schedule_interval(self.animate_circle, self.framerate)
-        self.animation_event.cancel()  # start paused
-        self.sounds = {
-            0: SoundLoader.load(resource_path('assets/ding_inhale.wav')),
-            1: SoundLoader.load(resource_path('assets/ding_hold1.wav')),
-            2: SoundLoader.load(resource_path('assets/ding_exhale.wav')),
-            3: SoundLoader.load(resource_path('assets/ding_hold2.wav')),
-            4: SoundLoader.load(resource_path('assets/ding_end.wav'))
-        }
-        self.duration = 5 * 60
-        self.selected_duration = 5 * 60
-        # Default start and end cycle times (if you want a static cycle, keep them identical)
-        self.start_cycle_time = [4, 8, 8, 0]
-        self.end_cycle_time = [4, 8, 8, 0]
+        # Frames are scheduled one at a time; animate_circle re-arms the trigger
+        # with a delay that depends on when the next visible change happens.
+        self.animation_event = Clock.create_trigger(self.animate_circle, 0)
+        self.sounds = SoundBank()
+        # Audio is not needed for the first frame; start loading once it is drawn.
+        after_first_frame(self.preload_sounds)
+
+    def preload_sounds(self, dt):
+        from kivy.app import App
+        app = App.get_running_app()
+        self.sounds.preload(os.path.join(app.user_data_dir, 'audio_cache') if app else None)
 
     def on_touch_down(self, touch):
+        if self.low_power:
+            return False  # Nothing is drawn, so nothing can be dragged
         if self.collide_point(*touch.pos):
             self.initial_touch_pos = touch.pos
             self.touch_start = touch.pos
@@ -121,6 +338,8 @@ class AnimatedCircle(Widget):
             touch_duration = time.time() - self.touch_start_time
             if distance_moved < 10 and touch_duration < 0.5:
                 self.handle_tap()
+            elif self.animation_active:
+                self.interruptions += 1  # Dragged the remaining time mid-session
             self.touch_start = None
             return True
         return super(AnimatedCircle, self).on_touch_up(touch)
@@ -145,259 +364,390 @@ class AnimatedCircle(Widget):
             angle_change = angle_current - angle_initial
             angle_change_deg = math.degrees(angle_change)
             duration_change = - angle_change_deg / 360 * 4 * 60 
-            if ((self.duration == float('inf') or self.duration >= 30*60+1) and duration_change < 0):
-                self.duration = 30*60+1 + duration_change
-            elif ((self.duration == float('inf') or self.duration >= 30*60+1) and duration_change > 0):
-                self.duration = float('inf') if ALLOW_INF else 30*60+1
-            else:
-                self.duration += duration_change
-            self.duration = max(0, self.duration)
-            if self.duration >= 30*60+1:
-                self.duration = float('inf') if ALLOW_INF else 30*60+1
-            if not self.animation_event.is_triggered:
-                self.selected_duration = max(0, self.selected_duration + duration_change * 60)
-            if self.duration_slider and self.duration_label:
-                if self.duration == float('inf') or self.duration >= 30*60+1 and not ALLOW_INF:
-                    self.duration = 30*60
-                if self.duration == float('inf') or self.duration >= 30*60+1:
-                    self.duration_slider.value = 30*60+1
-                    self.duration_label.text = f'Time: ∞' if ALLOW_INF else "30"
-                else:
-                    self.duration_slider.value = self.duration
-                    minutes, seconds = divmod(int(self.duration), 60)
-                    if minutes:
-                        minutes = int((self.duration+30)//60)
-                    self.duration_label.text = f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
+            self.model.drag_duration(duration_change)
 
     def toggle_animation(self, enable):
         if not enable:
+            self.cues.stop()
+            self.stop_breath_input()
+            self.leave_low_power()
             self.animation_event.cancel()
             self.animation_active = False
+            self.end_session(completed=False)
         else:
-            self.animation_event = Clock.schedule_interval(self.animate_circle, self.framerate)
+            self.rewind()
             self.animation_active = True
+            self.start_cues()
+            self.start_breath_input()
+            self.request_frame()
 
-    def update_canvas(self, *args):
-        self.canvas.clear()
-        with self.canvas:
-            Color(0.094, 0.004, 0.114, 0.25)
-            radius_a = (min(self.width, self.height) / 2) * (self.radius_a / 100.0)
-            Ellipse(pos=(self.center_x - radius_a, self.center_y - radius_a), size=(radius_a * 2, radius_a * 2))
+    def request_frame(self, delay=0):
+        # Nothing is drawn in low power; leaving it requests the next frame.
+        if not self.animation_active or self.low_power:
+            return
+        self.animation_event.cancel()
+        self.animation_event.timeout = delay
+        self.animation_event()
 
-            Color(0.95, 0.95, 0.95, 0.75)
-            radius_b = (min(self.width, self.height) / 2) * (self.radius_b / 100.0)
-            Ellipse(pos=(self.center_x - radius_b, self.center_y - radius_b), size=(radius_b * 2, radius_b * 2))
+    def next_frame_delay(self, t, state):
+        # Sleep until the earliest of: the next phase boundary, the next change
+        # of the countdown text, or the rings moving by a visible amount.
+        min_interval = 1 / self.max_fps
+        horizon = MAX_FRAME_INTERVAL
+        if state.end > t:
+            horizon = min(horizon, state.end - t)
+        duration = self.session.duration
+        if duration != float('inf'):
+            horizon = min(horizon, duration - math.floor(duration) or 1.0)
+        if self.ring_renderer is not None and self.ring_renderer.always_moving:
+            return min(min_interval, horizon) + 0.001
+        scale = min(self.width, self.height) / 200.0
+        length = state.end - state.start
+        delay = min_interval
+        while delay < horizon and length > 0:
+            candidate = min(delay * 2, horizon)
+            radii = ring_radii(state.phase, state.progress + candidate / length)
+            if max(abs(a - b) for a, b in zip(radii, state.radii)) * scale >= MIN_VISIBLE_CHANGE:
+                break
+            delay = candidate
+        # A boundary closer than one frame is still honoured so that the new
+        # phase is drawn on time; everything else respects the frame rate cap.
+        return min(delay, horizon) + 0.001
 
-            Color(0.988, 0.667, 0.992, 1)
-            radius_c = (min(self.width, self.height) / 2) * (self.radius_c / 100.0)
-            Ellipse(pos=(self.center_x - radius_c, self.center_y - radius_c), size=(radius_c * 2, radius_c * 2))
+    def rewind(self):
+        self.session.rewind()
+        self.shown_duration = None
 
-            Color(0.95, 0.95, 0.95, 1)
-            radius_d = (min(self.width, self.height) / 2) * (self.radius_d / 100.0)
-            Ellipse(pos=(self.center_x - radius_d, self.center_y - radius_d), size=(radius_d * 2, radius_d * 2))
+    def session_time(self):
+        return self.session.session_time()
 
-            Color(0.231, 0.051, 0.286, 1)
-            radius_e = (min(self.width, self.height) / 2) * (self.radius_e / 100.0)
-            Ellipse(pos=(self.center_x - radius_e, self.center_y - radius_e), size=(radius_e * 2, radius_e * 2))
+    def get_timeline(self):
+        return self.session.get_timeline()
 
-    def animate_circle(self, dt):
-        # Update the duration countdown
-        if (self.duration != float('inf') and self.duration < 30*60+1) or not ALLOW_INF:
-            self.duration -= dt
-            if self.duration_slider and self.duration_label:
-                self.duration_slider.value = max(0, min(self.duration, self.duration_slider.max - 1))
-                minutes, seconds = divmod(int(self.duration), 60)
-                if minutes:
-                    minutes = int((self.duration+30)//60)
-                self.duration_label.text = f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
-            if self.duration <= 0:
-                self.stop_animation_with_end_sound()
-                return
+    def build_canvas(self):
+        # The rings are created once and only resized afterwards; rebuilding the
+        # instruction list every frame was the bulk of the per-frame cost.
+        self.ellipses = []
+        self.ellipse_group = InstructionGroup()
+        for color in self.ring_colors:
+            self.ellipse_group.add(Color(*color))
+            ellipse = Ellipse(pos=self.center, size=(0, 0))
+            self.ellipse_group.add(ellipse)
+            self.ellipses.append(ellipse)
+        self.canvas.add(self.ellipse_group)
+        self.drawn_radii = [None] * len(self.ellipses)
+
+    def use_renderer(self, renderer):
+        """ Draw the rings with renderer (one of RENDERERS); False, and ellipses, if it is unavailable """
+        rings = None
+        if renderer == 'shader':
+            from shader_rings import ShaderRings
+            rings = ShaderRings(self, self.ring_colors)
+        elif renderer == 'particles':
+            from particle_rings import ParticleRings
+            rings = ParticleRings(self, self.ring_colors, self.particle_budget)
+        if rings is not None and not rings.ok:
+            print(f"The {renderer} renderer is not available here; drawing ellipses")
+            self.use_renderer('ellipses')
+            return False
+        if self.ring_renderer is not None:
+            self.ring_renderer.detach()
+        else:
+            self.canvas.remove(self.ellipse_group)
+        self.ring_renderer = rings
+        if rings is not None:
+            rings.attach()
+        else:
+            self.canvas.add(self.ellipse_group)
+        self.update_canvas(self, self.size)
+        self.request_frame()
+        return True
 
-        # Compute an interpolation factor from 0 to 1 over the session:
-        if self.selected_duration == float('inf') or self.selected_duration <= 0:
-            factor = 0
+    def update_canvas(self, *args):
+        # Called without arguments from animate_circle; with (instance, value)
+        # when the widget itself moved or resized, which invalidates every ring.
+        started = time.perf_counter() if instrumentation.enabled else None
+        if self.ring_renderer is not None:
+            session = self.session
+            self.ring_renderer.update(session.phase, session.progress, resized=bool(args),
+                                      cycle_progress=session.cycle_progress)
         else:
-            factor = (self.selected_duration - self.duration) / self.selected_duration
-        # Compute effective cycle times by linearly interpolating between start and end values.
-        effective_cycle_time = [
-            s + (e - s) * factor for s, e in zip(self.start_cycle_time, self.end_cycle_time)
-        ]
-        t1, t2, t3, t4 = effective_cycle_time
-        self.progress += dt
-
-        if self.phase == 0:
-            if t1 > 0:
-                self.radius_b = self.radius_c = 75 - 50 * (1 - cub_intp(self.progress / t1))
-                self.radius_d = self.radius_e = self.radius_b - 5
-            if self.progress > t1:
-                self.phase = 1 
-                self.progress -= t1
-        if self.phase == 1:
-            if t2 > 0:
-                self.radius_b = 75 + 15 * cub_intp(self.progress / t2 * 2)
-                self.radius_c = 75
-                self.radius_d = self.radius_e = 75 - 5
-            if self.progress > t2:
-                self.phase = 2
-                self.progress -= t2
-        if self.phase == 2:
-            if t3 > 0:
-                self.radius_b = self.radius_c = 75 - 50 * cub_intp(self.progress / t3)
-                self.radius_d = self.radius_e = self.radius_b - 5
-            if self.progress > t3:
-                self.phase = 3
-                self.progress -= t3
-        if self.phase == 3:
-            if t4 > 0:
-                self.radius_b = self.radius_c = 25
-                self.radius_d = self.radius_b - 5
-                self.radius_e = 20 - 10 * cub_intp(self.progress / t4 * 2)
-            if self.progress > t4:
-                self.phase = 0
-                self.progress -= t4
-
-        if self.phase != self.last_phase:
-            sound = self.sounds.get(self.phase)
-            if sound:
-                sound.play()
-            self.last_phase = self.phase
+            self.update_ellipses(bool(args))
+        if started is not None:
+            instrumentation.span(CANVAS, started)
+
+    def update_ellipses(self, invalidate):
+        if invalidate:
+            self.drawn_radii = [None] * len(self.ellipses)
+        scale = min(self.width, self.height) / 200.0
+        radii = (self.radius_a, self.radius_b, self.radius_c, self.radius_d, self.radius_e)
+        for i, radius in enumerate(radii):
+            radius_px = radius * scale
+            if radius_px == self.drawn_radii[i]:
+                continue
+            self.drawn_radii[i] = radius_px
+            ellipse = self.ellipses[i]
+            segments = ellipse_segments(radius_px)
+            if ellipse.segments != segments:
+                ellipse.segments = segments
+            ellipse.pos = (self.center_x - radius_px, self.center_y - radius_px)
+            ellipse.size = (radius_px * 2, radius_px * 2)
+
+    def animate_circle(self, dt):
+        started = None
+        if instrumentation.enabled:
+            started = time.perf_counter()
+            instrumentation.frame(dt, self.animation_event.timeout, 1 / self.max_fps)
+        session = self.session
+        state = self.local_clock.frame(dt, self.session_clock)
+        # The countdown is shown in whole seconds; only a new second is news.
+        if session.counts_down():
+            shown_duration = int(session.duration)
+            if shown_duration != self.shown_duration:
+                self.shown_duration = shown_duration
+                self.model.counted_down()
+        if state is None:
+            self.stop_animation_with_end_sound()
+            if started is not None:
+                instrumentation.span(ANIMATE, started)
+            return
+        self.radius_a, self.radius_b, self.radius_c, self.radius_d, self.radius_e = state.radii
 
         self.update_canvas()
+        self.request_frame(self.next_frame_delay(session.session_time(), state))
+        if started is not None:
+            instrumentation.span(ANIMATE, started)
 
-    def stop_animation_with_end_sound(self):
+    def end_session(self, completed):
+        # Only builds the record; session_ended queues it for a background write.
+        if self.session_started_at is None:
+            return
+        if self.session_ended:
+            self.session_ended(self.session.record(completed))
+        self.session_started_at = None
+
+    def cue_clock(self):
+        # Session time for the cue scheduler; read from its thread.
+        if self.session_clock is not None:
+            t = self.session_clock()
+            if t is not None:
+                return t
+        return self.local_clock()
+
+    def start_cues(self):
+        # The scheduler must not be the one to load a sound.
+        for key in SOUND_NAMES:
+            self.sounds.get(key)
+        self.local_clock.anchor()
+        self.cues.start(self.get_timeline, self.cue_clock, self.session.end(), -1, self.cue_latency)
+
+    def start_breath_input(self):
+        if self.breath_input == 'off':
+            return
+        from breath_input import BreathMonitor, MicrophoneSource, SyntheticSource
+        from timeline import BreathTimeline
+        if self.breath_input == 'microphone':
+            source = MicrophoneSource()
+        else:
+            source = SyntheticSource(BreathTimeline(self.start_cycle_time, self.start_cycle_time, float('inf')),
+                                     realtime=True)
+        if not source.ok:
+            print(f"The {self.breath_input} breath input is not available here")
+            return
+        if self.breath_monitor is None:
+            self.breath_monitor = BreathMonitor(self.breath_pace_changed)
+        # A group session's ramp is the host's; it is not adapted here.
+        adapt = self.adapt_ramp and self.session_clock is None
+        self.breath_monitor.start(source, self.get_timeline, self.cue_clock, adapt)
+
+    def stop_breath_input(self):
+        if self.breath_monitor is not None:
+            self.breath_monitor.stop()
+
+    def breath_pace_changed(self, pace):
+        # Runs on the monitor's thread; the ramp is changed between frames.
+        Clock.schedule_once(lambda dt: self.set_ramp_pace(pace))
+
+    def set_ramp_pace(self, pace):
+        # The ramp changes from now on, so the session must be at now first.
+        self.catch_up_session()
+        self.model.set_ramp_pace(pace)
+
+    def catch_up_session(self):
+        # In low power no frames move the session on; the cue clock has run on
+        # from the last one, and is what the session time should be.
+        if self.low_power:
+            self.local_clock.catch_up()
+
+    def settings_changed(self, changed):
+        if self.animation_active:
+            self.request_frame()
+            self.session_time_changed()
+
+    def session_time_changed(self):
+        # The remaining time or the cycle was changed mid-session.
+        self.catch_up_session()
+        self.local_clock.anchor()
+        self.cues.resync()
+
+    def set_cue_latency(self, latency):
+        self.cue_latency = latency
+        self.cues.latency = latency
+        self.cues.resync()
+
+    def enter_low_power(self):
+        # Stop drawing; the cue scheduler carries on by the clock alone.
+        if not self.animation_active or self.low_power:
+            return
         self.animation_event.cancel()
-        sound = self.sounds.get(4)
+        self.low_power = True
+        hold_wake_lock(PARTIAL_WAKE_LOCK)
+
+    def leave_low_power(self):
+        # Catch the countdown up with the monotonic clock.
+        if not self.low_power:
+            return
+        self.low_power = False
+        self.local_clock.catch_up()
+
+    def exit_low_power(self):
+        if not self.low_power:
+            return
+        self.leave_low_power()
+        hold_wake_lock(SCREEN_WAKE_LOCK)
+        self.request_frame()
+
+    def finish_in_low_power(self, dt):
+        # The end cue has played; one last frame ends the session as usual,
+        # without turning the screen back on.
+        self.leave_low_power()
+        self.request_frame()
+
+    def play_cue(self, phase, due):
+        # Runs on the cue scheduler's thread; due is the session time at
+        # which the cue should be heard.
+        sound = self.sounds.get(phase)
         if sound:
+            started = time.perf_counter()
             sound.play()
+            if instrumentation.enabled:
+                instrumentation.span(SOUND, started)
+                instrumentation.sound(phase, self.cue_clock() + self.cue_latency - due)
+        self.local_clock.cue_played(phase, self.low_power)
+        if phase == END_CUE and self.low_power:
+            Clock.schedule_once(self.finish_in_low_power)
+
+    def stop_animation_with_end_sound(self):
+        # The end cue is the scheduler's too; it is at most a moment away.
+        self.animation_event.cancel()
+        self.stop_breath_input()
+        self.end_session(completed=True)
 
         def release_wake_lock_callback(dt):
             self.animation_active = False
-            if wake_lock and wake_lock.isHeld():
-                wake_lock.release()
+            hold_wake_lock(None)
             if self.update_button_label:
                 self.update_button_label('Start')
-            self.duration = self.selected_duration
-            if (self.duration == float('inf') or self.duration >= 30*60+1) and ALLOW_INF:
-                self.duration_slider.value = 30*60+1
-                self.duration_label.text = f'Time: ∞'
-            else:
-                self.duration_slider.value = self.selected_duration
-                minutes, seconds = divmod(int(self.selected_duration), 60)
-                if minutes:
-                    minutes = int((self.duration+30)//60)
-                self.duration_label.text = f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
+            self.model.restore_duration()
         Clock.schedule_once(release_wake_lock_callback, 2)
 
 # ============================================================================
-# EditPresetsPopup
+# Curtain
 # ----------------------------------------------------------------------------
-# Now each preset row lets you edit a name, the duration (in minutes), the
-# start cycle times and the end cycle times (each entered as a string such as
-# "4-8-8-0").
+# Black cover over the whole window for eyes-closed mode. Nothing under it
+# changes while it is up, so nothing is redrawn; any tap lifts it.
 # ============================================================================
-class EditPresetsPopup(Popup):
-    def __init__(self, presets, on_save=None, **kwargs):
+class Curtain(Widget):
+    def __init__(self, on_tap, **kwargs):
         super().__init__(**kwargs)
-        self.presets = presets
-        self.on_save = on_save  # Callback when presets are saved
-        self.layout = BoxLayout(orientation='vertical')
-        self.scrollable = ScrollView(size_hint=(1, 1), do_scroll_x=False, do_scroll_y=True, bar_width=10)
-        self.rows = BoxLayout(orientation='vertical', size_hint=(1, None), height=150 * len(presets))
-        self.scrollable.add_widget(self.rows)
-        self.layout.add_widget(self.scrollable)
-        self.add_row_button = Button(text='Add Row', size_hint_y=None, height=40)
-        self.add_row_button.bind(on_press=self.add_row)
-        self.layout.add_widget(self.add_row_button)
-        self.save_button = Button(text='Save', size_hint_y=None, height=40)
-        self.save_button.bind(on_press=self.save_presets)
-        self.layout.add_widget(self.save_button)
-        self.title = 'Edit Presets'
-        self.content = self.layout
-        self.size_hint = (0.9, 0.6)
-        self.pos_hint = {'top': 1}
-        self.populate_initial_rows()
-
-    def populate_initial_rows(self):
-        for preset_name, preset_values in self.presets.items():
-            self.add_row(preset_name=preset_name, preset_values=preset_values)
-
-    def add_row(self, instance=None, preset_name='New preset', preset_values=([4, 8, 8, 0], [4, 8, 8, 0], 10*60)):
-        row = BoxLayout(orientation='vertical', size_hint_y=None, height=150)
-        # Row 1: Name and Duration
-        row1 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
-        row1.add_widget(Label(text='Name:', size_hint_x=None, width=100))
-        name_input = TextInput(text=preset_name, multiline=False)
-        row1.add_widget(name_input)
-        row1.add_widget(Label(text='Time (min):', size_hint_x=None, width=100))
-        duration_input = TextInput(text=str(int(preset_values[2] // 60)), multiline=False)
-        row1.add_widget(duration_input)
-        row.add_widget(row1)
-        # Row 2: Start Values
-        row2 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
-        row2.add_widget(Label(text='Start Values (Inhale-Hold1-Exhale-Hold2):', size_hint_x=None, width=250))
-        start_input = TextInput(text='-'.join(map(str, preset_values[0])), multiline=False)
-        row2.add_widget(start_input)
-        row.add_widget(row2)
-        # Row 3: End Values
-        row3 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
-        row3.add_widget(Label(text='End Values (Inhale-Hold1-Exhale-Hold2):', size_hint_x=None, width=250))
-        end_input = TextInput(text='-'.join(map(str, preset_values[1])), multiline=False)
-        row3.add_widget(end_input)
-        row.add_widget(row3)
-        # Row 4: Delete button
-        row4 = BoxLayout(orientation='horizontal', size_hint_y=None, height=30)
-        delete_button = Button(text='Delete', size_hint_x=None, width=100)
-        delete_button.bind(on_press=lambda x: self.delete_row(row))
-        row4.add_widget(delete_button)
-        row.add_widget(row4)
-        # Save references to the text inputs on the row
-        row.preset_widgets = {
-            'name': name_input,
-            'duration': duration_input,
-            'start': start_input,
-            'end': end_input,
-        }
-        self.rows.add_widget(row)
-        self.rows.height = 150 * len(self.rows.children)
-
-    def delete_row(self, row):
-        self.rows.remove_widget(row)
-        self.rows.height = 150 * len(self.rows.children)
-
-    def save_presets(self, instance):
-        new_presets = {}
-        for row in self.rows.children:
-            widgets = row.preset_widgets
-            preset_name = widgets['name'].text.strip()
-            start_values_str = widgets['start'].text.strip()
-            end_values_str = widgets['end'].text.strip()
-            duration_str = widgets['duration'].text.strip()
-            try:
-                start_values = [int(v) for v in start_values_str.split('-')]
-                end_values = [int(v) for v in end_values_str.split('-')]
-                if len(start_values) != 4 or len(end_values) != 4 or any(v < 0 for v in start_values + end_values):
-                    raise ValueError('Invalid cycle values')
-                duration = int(duration_str) * 60  # Convert minutes to seconds
-                if duration < 0:
-                    raise ValueError('Invalid duration')
-                original_name = preset_name
-                suffix = 1
-                while preset_name in new_presets:
-                    preset_name = f"{original_name} ({suffix})"
-                    suffix += 1
-                new_presets[preset_name] = (start_values, end_values, duration)
-            except Exception as e:
-                print(f"Error saving preset: {e}")
-                continue
-        from kivy.app import App
-        presets_path = os.path.join(App.get_running_app().user_data_dir, 'presets.json')
-        with open(presets_path, 'w') as f:
-            json.dump(new_presets, f)
-        self.presets.update(new_presets)
-        if self.on_save:
-            self.on_save(new_presets)
-        self.dismiss()
+        self.on_tap = on_tap
+        with self.canvas:
+            Color(0, 0, 0, 1)
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.update_rect, size=self.update_rect)
+
+    def update_rect(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    def on_touch_down(self, touch):
+        self.on_tap()
+        return True
+
+# ============================================================================
+# BackgroundTexture
+# ----------------------------------------------------------------------------
+# Loads the background at the size it is shown at. The first time a size is
+# needed the full image is decoded (by Kivy's threaded Loader), drawn once into
+# an Fbo of that size and written to the cache dir, keyed by a hash of the
+# source and the size; later launches decode only the small cached copy.
+# ============================================================================
+class BackgroundTexture:
+    # Sizes are rounded up to this many pixels so that small layout changes
+    # reuse the same cached copy.
+    size_step = 32
+
+    def __init__(self, source, cache_dir, color, rect):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.color = color
+        self.rect = rect
+        self.source_key = None
+        self.target = None
+        self.proxy = None
+        self.fbo = None
+
+    def request(self, size):
+        step = self.size_step
+        target = (max(step, -(-int(size[0]) // step) * step), max(step, -(-int(size[1]) // step) * step))
+        if target == self.target:
+            return
+        self.target = target
+        threading.Thread(target=self.locate, args=(target,), name='BackgroundTexture', daemon=True).start()
+
+    def locate(self, target):
+        if self.source_key is None:
+            self.source_key = file_digest(self.source)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            prune_cache(self.cache_dir, 'background', self.source_key)
+        path = cached_image_path(self.cache_dir, 'background', self.source_key, target)
+        cached = os.path.exists(path)
+        Clock.schedule_once(lambda dt: self.load(target, path, cached))
+
+    def load(self, target, path, cached):
+        if target != self.target:
+            return
+        from kivy.loader import Loader
+        self.proxy = Loader.image(path if cached else self.source)
+        if self.proxy.loaded:
+            self.loaded(target, path, cached, self.proxy)
+        else:
+            self.proxy.bind(on_load=lambda proxy: self.loaded(target, path, cached, proxy))
+
+    def loaded(self, target, path, cached, proxy):
+        if target != self.target:
+            return
+        texture = proxy.image.texture
+        if not cached:
+            texture = self.downscale(texture, target)
+            pixels = texture.pixels
+            threading.Thread(target=write_png, args=(path, target[0], target[1], pixels, True),
+                             name='BackgroundTexture', daemon=True).start()
+            from kivy.cache import Cache
+            Cache.remove('kv.loader', self.source)
+        self.proxy = None
+        self.rect.texture = texture
+        self.color.rgba = (1, 1, 1, 1)
+
+    def downscale(self, texture, target):
+        from kivy.graphics import Fbo, ClearColor, ClearBuffers
+        self.fbo = Fbo(size=target)
+        with self.fbo:
+            ClearColor(0, 0, 0, 0)
+            ClearBuffers()
+            Rectangle(texture=texture, size=target)
+        self.fbo.draw()
+        return self.fbo.texture
 
 # ============================================================================
 # MainAppLayout
@@ -414,121 +764,490 @@ class MainAppLayout(BoxLayout):
         self.rect.pos = instance.pos
 
     def apply_preset(self, preset_name):
-        start_values, end_values, duration_seconds = self.presets[preset_name]
-        for i, slider in enumerate(self.sliders[:-1]):  # cycle time sliders
-            slider.value = start_values[i]
-        self.sliders[-1].value = duration_seconds
-        self.animated_circle.start_cycle_time = start_values[:]
-        self.animated_circle.end_cycle_time = end_values[:]
-        self.animated_circle.selected_duration = duration_seconds
-        self.animated_circle.duration = duration_seconds
-
-    def update_presets(self, new_presets):
-        self.presets = new_presets
-        self.create_preset_buttons()
+        preset = self.preset_store.get(preset_name)
+        if preset is None:
+            return
+        start_values, end_values, duration_seconds = preset
+        model = self.animated_circle.model
+        model.set_cycle_times(start_values, end_values)
+        model.select_duration(duration_seconds)
+        self.applied_preset = (preset_name, (list(start_values), list(end_values), duration_seconds))
 
-    def load_or_init_presets(self):
-        # Default presets now include both start and end cycle times.
-        default_presets = {
-            'Chill': ([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60),
-            'Sleep': ([3, 7, 7, 0], [5, 9, 9, 0], 20 * 60),
-            'Slerp': ([4, 8, 8, 0], [4, 8, 8, 0], 15 * 60),
-        }
+    def unchanged_preset_name(self):
+        # The applied preset, unless its values were changed since.
+        if self.applied_preset is None:
+            return None
+        preset_name, preset_values = self.applied_preset
+        circle = self.animated_circle
+        if (list(circle.start_cycle_time), list(circle.end_cycle_time), circle.selected_duration) == preset_values:
+            return preset_name
+        return None
+
+    def session_ended(self, record):
+        self.record_session(record)
+        if self.group_server is not None and not record.completed:
+            # Stopped early. A completed session is left for the clients to
+            # finish on the shared clock; stopping them would cut short any
+            # whose last frame is still to come.
+            self.group_server.stop_session()
+
+    def record_session(self, record):
+        if self.history is None:
+            return
+        # The preset counts only if its values were not changed before starting.
+        preset_name = self.unchanged_preset_name()
+        if preset_name is not None:
+            record = record._replace(preset=preset_name)
+        self.history.append(record)
+
+    def open_history(self):
+        from kivy.app import App
+        self.history = SessionHistory(App.get_running_app().user_data_dir)
+        self.history.open()
+
+    def open_stats_popup(self, instance):
+        from stats_popup import StatsPopup
+        StatsPopup(history=self.history).open()
+
+    def set_instrumentation(self, enabled):
+        instrumentation.set_enabled(enabled)
+        if enabled:
+            if self.frame_overlay is None:
+                from frame_overlay import FrameTimingOverlay
+                self.frame_overlay = FrameTimingOverlay()
+            self.frame_overlay.show()
+        elif self.frame_overlay is not None:
+            self.frame_overlay.hide()
+        if self.settings_layout is not None:
+            self.instrumentation_button.text = 'Recording' if enabled else 'Off'
+
+    def toggle_instrumentation(self, instance):
+        self.set_instrumentation(not instrumentation.enabled)
+
+    def export_trace(self, instance):
+        from kivy.app import App
+        path = os.path.join(App.get_running_app().user_data_dir, time.strftime('trace-%Y%m%d-%H%M%S.json'))
+        try:
+            instrumentation.export(path)
+        except OSError as e:
+            print(f"Error writing {path}: {e}")
+            return
+        print(f"Trace written to {path}")
+        self.export_trace_button.text = f'Exported {os.path.basename(path)}'
+
+    def export_session(self, instance):
+        # Renders the current settings as an audio track on a background
+        # thread; pressed again while running, it cancels.
+        if self.export_thread is not None:
+            self.export_cancelled = True
+            return
         from kivy.app import App
-        presets_path = os.path.join(App.get_running_app().user_data_dir, 'presets.json')
+        import export
+        circle = self.animated_circle
+        if not has_end(circle.selected_duration):
+            self.export_track_button.text = 'Needs a finite duration'
+            return
+        name = ''.join(c if c.isalnum() else '-' for c in self.unchanged_preset_name() or 'session')
+        export_dir = os.path.join(App.get_running_app().user_data_dir, 'exports')
+        os.makedirs(export_dir, exist_ok=True)
+        path = os.path.join(export_dir, time.strftime(f'{name}-%Y%m%d-%H%M%S') + export.default_extension())
+        self.export_cancelled = False
+        self.export_thread = threading.Thread(
+            target=self.run_export,
+            args=(path, list(circle.start_cycle_time), list(circle.end_cycle_time), circle.selected_duration),
+            name='Export', daemon=True)
+        self.export_thread.start()
+        self.export_track_button.text = 'Exporting…'
+
+    def run_export(self, path, start_cycle_time, end_cycle_time, duration):
+        import export
+
+        shown = [None]
+
+        def progress(fraction):
+            # Called for every block; the label only changes once per percent.
+            percent = int(fraction * 100)
+            if percent != shown[0]:
+                shown[0] = percent
+                Clock.schedule_once(lambda dt: set_text(self.export_track_button, f'Exporting… {percent}%'))
+
         try:
-            with open(presets_path, 'r') as f:
-                presets = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError, ValueError):
-            presets = default_presets
-            with open(presets_path, 'w') as f:
-                json.dump(presets, f)
-        return presets
+            result = export.export_track(path, start_cycle_time, end_cycle_time, duration,
+                                         progress=progress, cancelled=lambda: self.export_cancelled)
+            text = f'Exported {os.path.basename(result)}' if result else 'Export cancelled'
+        except export.ExportError as e:
+            text = str(e)
+        except OSError as e:
+            print(f"Error exporting {path}: {e}")
+            text = 'Export failed'
+        else:
+            if result:
+                print(f"Session exported to {result}")
+
+        def finished(dt):
+            self.export_thread = None
+            self.export_track_button.text = text
+        Clock.schedule_once(finished)
+
+    def toggle_group_host(self, instance):
+        # Hosting publishes this device's sessions to the devices that join it.
+        if self.group_server is not None:
+            self.group_server.stop()
+            self.group_server = None
+            self.animated_circle.session_clock = None
+            self.group_host_button.text = 'Host'
+            return
+        from group_session import GroupServer
+        self.leave_group()
+        server = GroupServer(port=self.group_port())
+        try:
+            server.start_in_thread()
+        except OSError as e:
+            print(f"Error starting the group server: {e}")
+            self.group_host_button.text = 'Host failed'
+            return
+        self.group_server = server
+        self.animated_circle.session_clock = server.session_time
+        self.group_host_button.text = f'Hosting :{server.port}'
+        if self.start_stop_button.text == 'Stop':
+            # A session already running is not shared; the next one is.
+            self.animated_circle.session_clock = None
+
+    def group_port(self):
+        from group_session import parse_address
+        return parse_address(self.group_address_input.text)[1]
+
+    def toggle_group_join(self, instance):
+        if self.group_client is not None:
+            self.leave_group()
+            return
+        from group_session import GroupClient, parse_address
+        if self.group_server is not None:
+            self.toggle_group_host(self.group_host_button)
+        host, port = parse_address(self.group_address_input.text.strip())
+        self.group_client = GroupClient(host, port, on_session=self.group_state_changed)
+        self.group_client.start_in_thread()
+        self.animated_circle.session_clock = self.group_client.session_time
+        self.group_join_button.text = 'Leave'
+
+    def leave_group(self):
+        if self.group_client is None:
+            return
+        self.group_client.stop()
+        self.group_client = None
+        self.group_session = None
+        self.animated_circle.session_clock = None
+        self.group_join_button.text = 'Join'
+
+    def group_state_changed(self, state):
+        # Runs on the client's thread.
+        Clock.schedule_once(lambda dt: self.follow_group(state))
+
+    def follow_group(self, state):
+        # Starts and stops sessions as the host does. A pause needs nothing
+        # here: the group's clock stands still, and so do the rings.
+        if self.group_client is None:
+            return
+        running = self.start_stop_button.text == 'Stop'
+        if state is None:
+            self.group_session = None
+            if running:
+                self.toggle_animation(self.start_stop_button)
+            return
+        if state.session == self.group_session:
+            return
+        self.group_session = state.session
+        from group_session import session_time_at
+        if has_end(state.duration) and session_time_at(state, self.group_client.server_time()) >= state.duration:
+            return  # Joined after the host's session had run its course
+        if running:
+            self.toggle_animation(self.start_stop_button)
+        circle = self.animated_circle
+        circle.model.set_cycle_times(state.start_cycle_time, state.end_cycle_time)
+        circle.model.select_duration(state.duration)
+        self.applied_preset = None
+        self.start_stop_button.text = 'Stop'
+        self.update_countdown_label(0)
+        hold_wake_lock(SCREEN_WAKE_LOCK)
+        circle.toggle_animation(True)
+        if self.eyes_closed:
+            circle.enter_low_power()
+
+    def close_eyes(self, instance):
+        # Blank the screen and carry on with sound only; a tap brings it back.
+        # Pressed before a session, this starts one.
+        self.eyes_closed = True
+        if self.start_stop_button.text == 'Start':
+            self.toggle_animation(self.start_stop_button)
+        self.animated_circle.enter_low_power()
+        if self.curtain is None:
+            self.curtain = Curtain(on_tap=self.open_eyes)
+        if self.curtain.parent is None:
+            Window.add_widget(self.curtain)
+
+    def open_eyes(self):
+        self.eyes_closed = False
+        if self.curtain is not None and self.curtain.parent is not None:
+            self.curtain.parent.remove_widget(self.curtain)
+        self.animated_circle.exit_low_power()
+
+    def on_app_pause(self):
+        # The session goes on without frames while the app is in the background.
+        self.animated_circle.enter_low_power()
+        if self.history is not None:
+            self.history.flush()
+
+    def on_app_resume(self):
+        if not self.eyes_closed:
+            self.animated_circle.exit_low_power()
+
+    def on_app_stop(self):
+        self.animated_circle.toggle_animation(False)
+        self.leave_group()
+        if self.group_server is not None:
+            self.group_server.stop()
+        if self.history is not None:
+            self.history.flush()
+
+    def update_presets(self):
+        self.create_preset_buttons()
+
+    def open_preset_store(self):
+        from kivy.app import App
+        from presets_store import PresetStore
+        user_data_dir = App.get_running_app().user_data_dir
+        with profiler.section('read', 'presets.db'):
+            return PresetStore(os.path.join(user_data_dir, 'presets.db'),
+                               legacy_json_path=os.path.join(user_data_dir, 'presets.json'))
 
     def create_preset_buttons(self):
-        self.preset_buttons_layout.clear_widgets()
-        min_button_width = 350
-        num_buttons = len(self.presets) + 1  # +1 for the "Edit" button
-        self.preset_buttons_layout.width = max(self.width, min_button_width * num_buttons)
-        for preset_name, preset_values in self.presets.items():
-            start_values, end_values, duration_seconds = preset_values
-            duration_minutes = int((duration_seconds + 30) // 60)
-            button_text = f"{preset_name}\n{'-'.join(map(str, start_values))}→{'-'.join(map(str, end_values))}/{duration_minutes}"
-            btn = Button(text=button_text, halign="center", bold=True, size_hint_x=None, width=min_button_width)
-            btn.bind(on_press=lambda instance, name=preset_name: self.apply_preset(name))
-            btn.background_color = (0.1, 0.1, 0.1, 0.75)
-            self.preset_buttons_layout.add_widget(btn)
-        self.edit_presets_btn = Button(text="Edit", bold=True, size_hint_x=None, width=min_button_width)
-        self.edit_presets_btn.bind(on_press=lambda instance: self.open_edit_presets_popup())
-        self.edit_presets_btn.background_color = (0.1, 0.1, 0.1, 0.75)
-        self.preset_buttons_layout.add_widget(self.edit_presets_btn)
+        # Only the presets that were added, removed or edited touch the bar.
+        self.preset_bar.refresh()
 
     def open_edit_presets_popup(self):
-        popup = EditPresetsPopup(presets=self.presets, on_save=self.update_presets)
+        from presets_editor import EditPresetsPopup
+        popup = EditPresetsPopup(store=self.preset_store, on_save=self.update_presets)
         popup.open()
 
     def __init__(self, **kwargs):
         super(MainAppLayout, self).__init__(**kwargs)
+        # Only the circle, the countdown and the Start button are built before
+        # the first frame; the background texture, the settings panel and the
+        # wake lock follow once it is on screen.
         with self.canvas.before:
-            self.bg = CoreImage(resource_path('assets/background.png')).texture
-            self.rect = Rectangle(texture=self.bg, size=self.size, pos=self.pos)
+            # Plain presplash colour until the background texture is loaded.
+            self.bg_color = Color(0, 0.031, 0.02, 1)
+            self.rect = Rectangle(size=self.size, pos=self.pos)
         self.bind(size=self._update_rect, pos=self._update_rect)
         self.orientation = 'vertical'
-        self.presets = self.load_or_init_presets()
-        self.duration_label = Label(text='Time: 5 minutes', bold=True, width=350, size_hint_x=None)
-        self.duration_slider = Slider(min=0, max=30 * 60 + 1, value=5 * 60, size_hint_x=1.5)
-        self.animated_circle = AnimatedCircle(size_hint=(1, 0.8), duration_slider=self.duration_slider,
-                                              duration_label=self.duration_label,
-                                              update_button_label=self.update_start_stop_button_label)
-        self.add_widget(self.animated_circle)
-        self.bottom_layout = BoxLayout(size_hint=(1, 0.6), orientation='vertical')
-        self.timer_label = Label(text='', bold=True, size_hint_y=None, height=75, font_size=72)
-        self.bottom_layout.add_widget(self.timer_label)
-        self.sequence_label = Label(text='0-0-0-0', bold=True, size_hint_y=None, height=75)
-        self.bottom_layout.add_widget(self.sequence_label)
-        start_button_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=150)
-        settings_button = Button(text='Settings', bold=True, size_hint_x=0.2)
-        settings_button.background_color = (0.1, 0.1, 0.1, 0.75)
-        settings_button.bind(on_press=self.toggle_settings)
-        start_button_layout.add_widget(settings_button)
-        self.start_stop_button = Button(text='Start', bold=True)
-        self.start_stop_button.bind(on_press=self.toggle_animation)
-        self.start_stop_button.background_color = (0.1, 0.1, 0.1, 0.75)
-        start_button_layout.add_widget(self.start_stop_button)
-        test_ding_button = Button(text='Test\nsound', bold=True, size_hint_x=0.2, halign="center")
-        test_ding_button.bind(on_press=self.test_ding)
-        test_ding_button.background_color = (0.1, 0.1, 0.1, 0.75)
-        start_button_layout.add_widget(test_ding_button)
-        self.bottom_layout.add_widget(start_button_layout)
-        self.settings_layout = BoxLayout(orientation='vertical')
+        self.preset_store = None
+        self.applied_preset = None
+        self.history = None
+        self.frame_overlay = None
+        self.export_thread = None
+        self.export_cancelled = False
+        self.group_server = None
+        self.group_client = None
+        self.group_session = None
+        self.eyes_closed = False
+        self.curtain = None
+        with profiler.section('build', 'AnimatedCircle'):
+            self.duration_label = Label(text='Time: 5 minutes', bold=True, width=350, size_hint_x=None)
+            self.duration_slider = Slider(min=0, max=UNBOUNDED, value=5 * 60, size_hint_x=1.5)
+            self.animated_circle = AnimatedCircle(size_hint=(1, 0.8),
+                                                  update_button_label=self.update_start_stop_button_label,
+                                                  session_ended=self.session_ended)
+            self.add_widget(self.animated_circle)
+        with profiler.section('build', 'bottom layout'):
+            self.bottom_layout = BoxLayout(size_hint=(1, 0.6), orientation='vertical')
+            self.timer_label = GlyphLabel(text='', bold=True, size_hint_y=None, height=75, font_size=72)
+            self.bottom_layout.add_widget(self.timer_label)
+            self.sequence_label = Label(text='0-0-0-0', bold=True, size_hint_y=None, height=75)
+            self.bottom_layout.add_widget(self.sequence_label)
+            # Under the sequence while a breath input is selected.
+            self.breath_label = Label(text='', size_hint_y=None, height=50)
+            self.breath_label_event = None
+            start_button_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=150)
+            settings_button = Button(text='Settings', bold=True, size_hint_x=0.2)
+            settings_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            settings_button.bind(on_press=self.toggle_settings)
+            start_button_layout.add_widget(settings_button)
+            eyes_closed_button = Button(text='Eyes\nclosed', bold=True, size_hint_x=0.2, halign="center")
+            eyes_closed_button.bind(on_press=self.close_eyes)
+            eyes_closed_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            start_button_layout.add_widget(eyes_closed_button)
+            self.start_stop_button = Button(text='Start', bold=True)
+            self.start_stop_button.bind(on_press=self.toggle_animation)
+            self.start_stop_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            start_button_layout.add_widget(self.start_stop_button)
+            test_ding_button = Button(text='Test\nsound', bold=True, size_hint_x=0.2, halign="center")
+            test_ding_button.bind(on_press=self.test_ding)
+            test_ding_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            start_button_layout.add_widget(test_ding_button)
+            self.bottom_layout.add_widget(start_button_layout)
+            self.add_widget(self.bottom_layout)
+        self.settings_layout = None
         self.settings_visible = False
-        preset_buttons_scrollview = ScrollView(size_hint=(1, None), height=150, do_scroll_x=True, do_scroll_y=False, bar_width=10)
-        self.preset_buttons_layout = BoxLayout(size_hint=(None, None), height=150)
-        preset_buttons_scrollview.add_widget(self.preset_buttons_layout)
-        self.settings_layout.add_widget(preset_buttons_scrollview)
-        self.create_preset_buttons()
         self.sliders = []
-        # Create one slider per cycle phase – these control the "start" values.
-        for i, label in enumerate(['Inhale', 'Hold 1', 'Exhale', 'Hold 2']):
-            slider_layout = BoxLayout(orientation='horizontal')
-            slider_label = Label(text=f'{label}: 0 seconds', bold=True, width=350, size_hint_x=None)
-            slider = Slider(min=0 if label in ['Hold 1', 'Hold 2'] else 2, max=20, value=0)
-            slider.bind(value=self.update_slider_label(slider_label, label, i))
-            slider_layout.add_widget(slider_label)
-            slider_layout.add_widget(slider)
-            self.sliders.append(slider)
-            self.settings_layout.add_widget(slider_layout)
-        duration_slider_layout = BoxLayout(orientation='horizontal')
-        self.duration_slider.bind(value=self.update_duration_slider_label(self.duration_label))
-        duration_slider_layout.add_widget(self.duration_label)
-        duration_slider_layout.add_widget(self.duration_slider)
-        self.sliders.append(self.duration_slider)
-        self.settings_layout.add_widget(duration_slider_layout)
-        self.add_widget(self.bottom_layout)
-        self.load_saved()
+        self.cycle_slider_labels = []
+        # Set while the widgets are brought in line with the model, so that
+        # moving a slider there is not taken for the user moving it.
+        self.refreshing = False
+        self.duration_slider.bind(value=self.duration_slider_moved)
+        model = self.animated_circle.model
+        model.subscribe(self.refresh_settings)
+        with profiler.section('read', 'previous_state.json'):
+            self.load_saved()
+        model.subscribe(lambda changed: self.save_state(), PERSISTED)
+        model.subscribe(self.breath_session_changed, (RUNNING,))
 
         self.countdown_schedule = None
         self.countdown_from = 5
+        after_first_frame(self.on_first_frame)
+
+    def on_first_frame(self, dt):
+        if profiler.enabled:
+            within_budget = profiler.first_frame()
+            print(profiler.report())
+            from kivy.app import App
+            app = App.get_running_app()
+            profiler.save(os.path.join(app.user_data_dir, 'startup_report.json'))
+            if not within_budget:
+                print(f"Startup budget of {profiler.budget_ms:.0f} ms exceeded")
+            if profiler.mode == 'exit':
+                app.stop()
+                return
+        self.load_background()
+        self.open_history()
+        if instrumentation.enabled:
+            self.set_instrumentation(True)
+        get_wake_lock(SCREEN_WAKE_LOCK)
+        get_wake_lock(PARTIAL_WAKE_LOCK)
+        if self.renderer != RENDERERS[0]:
+            self.set_renderer(self.renderer)
+        Clock.schedule_once(lambda dt: self.build_settings())
+
+    def load_background(self):
+        from kivy.app import App
+        self.background = BackgroundTexture(resource_path('assets/background.png'),
+                                            os.path.join(App.get_running_app().user_data_dir, 'image_cache'),
+                                            self.bg_color, self.rect)
+        self.background.request(self.size)
+        # Rotation and window resizes load (or build) a copy for the new size
+        # once the size has settled.
+        request_background = Clock.create_trigger(lambda dt: self.background.request(self.size), 0.5)
+        self.bind(size=lambda instance, value: request_background())
+
+    def build_settings(self):
+        if self.settings_layout is not None:
+            return
+        from kivy.app import App
+        from preset_bar import BAR_HEIGHT, PresetBar
+        from preset_thumbnails import PresetThumbnails
+        with profiler.section('build', 'settings panel'):
+            self.settings_layout = BoxLayout(orientation='vertical')
+            thumbnails = PresetThumbnails(os.path.join(App.get_running_app().user_data_dir, 'image_cache'))
+            self.preset_bar = PresetBar(self.apply_preset, self.open_edit_presets_popup, thumbnails,
+                                        size_hint=(1, None), height=BAR_HEIGHT)
+            self.settings_layout.add_widget(self.preset_bar)
+            self.preset_store = self.open_preset_store()
+            self.preset_bar.show(self.preset_store)
+            # Create one slider per cycle phase – these control the "start" values.
+            # They start from the loaded state and are bound afterwards, so that
+            # building them does not flatten a start→end ramp.
+            for i, label in enumerate(CYCLE_SLIDER_NAMES):
+                slider_layout = BoxLayout(orientation='horizontal')
+                value = self.animated_circle.start_cycle_time[i]
+                slider_label = Label(text=f'{label}: {int(value)} seconds', bold=True, width=350, size_hint_x=None)
+                slider = Slider(min=0 if label in ['Hold 1', 'Hold 2'] else 2, max=20, value=value)
+                slider.bind(value=self.cycle_slider_moved(i))
+                slider_layout.add_widget(slider_label)
+                slider_layout.add_widget(slider)
+                self.sliders.append(slider)
+                self.cycle_slider_labels.append(slider_label)
+                self.settings_layout.add_widget(slider_layout)
+            duration_slider_layout = BoxLayout(orientation='horizontal')
+            duration_slider_layout.add_widget(self.duration_label)
+            duration_slider_layout.add_widget(self.duration_slider)
+            self.sliders.append(self.duration_slider)
+            self.settings_layout.add_widget(duration_slider_layout)
+            fps_layout = BoxLayout(orientation='horizontal')
+            fps_layout.add_widget(Label(text='Frame rate cap', bold=True, width=350, size_hint_x=None))
+            self.fps_button = Button(text='', bold=True)
+            self.fps_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.fps_button.bind(on_press=self.cycle_frame_rate_cap)
+            fps_layout.add_widget(self.fps_button)
+            self.settings_layout.add_widget(fps_layout)
+            self.set_frame_rate_cap(self.animated_circle.max_fps)
+            renderer_layout = BoxLayout(orientation='horizontal')
+            renderer_layout.add_widget(Label(text='Rings', bold=True, width=350, size_hint_x=None))
+            self.renderer_button = Button(text='', bold=True)
+            self.renderer_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.renderer_button.bind(on_press=self.cycle_renderer)
+            renderer_layout.add_widget(self.renderer_button)
+            self.settings_layout.add_widget(renderer_layout)
+            self.renderer_button.text = self.renderer
+            particles_layout = BoxLayout(orientation='horizontal')
+            particles_layout.add_widget(Label(text='Particles', bold=True, width=350, size_hint_x=None))
+            self.particle_budget_button = Button(text=str(self.animated_circle.particle_budget), bold=True)
+            self.particle_budget_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.particle_budget_button.bind(on_press=self.cycle_particle_budget)
+            particles_layout.add_widget(self.particle_budget_button)
+            self.settings_layout.add_widget(particles_layout)
+            breath_layout = BoxLayout(orientation='horizontal')
+            breath_layout.add_widget(Label(text='Breath input', bold=True, width=350, size_hint_x=None))
+            self.breath_input_button = Button(text=self.animated_circle.breath_input.capitalize(), bold=True)
+            self.breath_input_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.breath_input_button.bind(on_press=self.cycle_breath_input)
+            breath_layout.add_widget(self.breath_input_button)
+            self.adapt_ramp_button = Button(text=self.adapt_ramp_text(), bold=True)
+            self.adapt_ramp_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.adapt_ramp_button.bind(on_press=self.toggle_adapt_ramp)
+            breath_layout.add_widget(self.adapt_ramp_button)
+            self.settings_layout.add_widget(breath_layout)
+            history_layout = BoxLayout(orientation='horizontal')
+            history_layout.add_widget(Label(text='History', bold=True, width=350, size_hint_x=None))
+            stats_button = Button(text='Statistics', bold=True)
+            stats_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            stats_button.bind(on_press=self.open_stats_popup)
+            history_layout.add_widget(stats_button)
+            self.settings_layout.add_widget(history_layout)
+            from importlib.util import find_spec
+            if find_spec('numpy') is not None:
+                # The export mixes with NumPy; without it there is nothing to offer.
+                export_layout = BoxLayout(orientation='horizontal')
+                export_layout.add_widget(Label(text='Audio track', bold=True, width=350, size_hint_x=None))
+                self.export_track_button = Button(text='Export session', bold=True)
+                self.export_track_button.background_color = (0.1, 0.1, 0.1, 0.75)
+                self.export_track_button.bind(on_press=self.export_session)
+                export_layout.add_widget(self.export_track_button)
+                self.settings_layout.add_widget(export_layout)
+            from kivy.uix.textinput import TextInput
+            group_layout = BoxLayout(orientation='horizontal')
+            group_layout.add_widget(Label(text='Group class', bold=True, width=350, size_hint_x=None))
+            self.group_address_input = TextInput(hint_text='host:port', multiline=False)
+            group_layout.add_widget(self.group_address_input)
+            self.group_host_button = Button(text='Host', bold=True)
+            self.group_host_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.group_host_button.bind(on_press=self.toggle_group_host)
+            group_layout.add_widget(self.group_host_button)
+            self.group_join_button = Button(text='Join', bold=True)
+            self.group_join_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.group_join_button.bind(on_press=self.toggle_group_join)
+            group_layout.add_widget(self.group_join_button)
+            self.settings_layout.add_widget(group_layout)
+            diagnostics_layout = BoxLayout(orientation='horizontal')
+            diagnostics_layout.add_widget(Label(text='Diagnostics', bold=True, width=350, size_hint_x=None))
+            self.instrumentation_button = Button(text='', bold=True)
+            self.instrumentation_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.instrumentation_button.bind(on_press=self.toggle_instrumentation)
+            diagnostics_layout.add_widget(self.instrumentation_button)
+            self.export_trace_button = Button(text='Export trace', bold=True)
+            self.export_trace_button.background_color = (0.1, 0.1, 0.1, 0.75)
+            self.export_trace_button.bind(on_press=self.export_trace)
+            diagnostics_layout.add_widget(self.export_trace_button)
+            self.settings_layout.add_widget(diagnostics_layout)
+            self.instrumentation_button.text = 'Recording' if instrumentation.enabled else 'Off'
 
     def load_saved(self):
         try:
@@ -537,36 +1256,51 @@ class MainAppLayout(BoxLayout):
             start_cycle_times = saved.get('start_cycle_times', [4, 8, 8, 0])
             end_cycle_times = saved.get('end_cycle_times', start_cycle_times)
             selected_duration = saved.get('selected_duration', 5 * 60)
+            max_fps = saved.get('max_fps', FRAME_RATE_CAPS[0])
+            renderer = saved.get('renderer', RENDERERS[0])
+            particle_budget = saved.get('particle_budget', PARTICLE_BUDGETS[0])
+            cue_latency = saved.get('cue_latency', 0.0)
+            breath_input = saved.get('breath_input', BREATH_INPUTS[0])
+            adapt_ramp = saved.get('adapt_ramp', False)
         except (FileNotFoundError, json.JSONDecodeError):
             start_cycle_times = [4, 8, 8, 0]
             end_cycle_times = [4, 8, 8, 0]
             selected_duration = 5 * 60
-        for i, slider in enumerate(self.sliders[:-1]):
-            slider.value = start_cycle_times[i]
-        if (selected_duration == float('inf') or selected_duration >= 30 * 60 + 1) and ALLOW_INF:
-            selected_duration = float('inf')
-            self.sliders[-1].value = 30 * 60 + 1
-            self.duration_label.text = f'Time: ∞'
-        else:
-            selected_duration = max(0, selected_duration)
-            self.sliders[-1].value = selected_duration
-            minutes, seconds = divmod(int(selected_duration), 60)
-            if minutes:
-                minutes = int((selected_duration + 30) // 60)
-            self.duration_label.text = f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
-        self.animated_circle.start_cycle_time = start_cycle_times
-        self.animated_circle.end_cycle_time = end_cycle_times
-        self.animated_circle.selected_duration = selected_duration
-        self.animated_circle.duration = selected_duration
+            max_fps = FRAME_RATE_CAPS[0]
+            renderer = RENDERERS[0]
+            particle_budget = PARTICLE_BUDGETS[0]
+            cue_latency = 0.0
+            breath_input = BREATH_INPUTS[0]
+            adapt_ramp = False
+        self.animated_circle.cue_latency = cue_latency
+        self.animated_circle.adapt_ramp = bool(adapt_ramp)
+        self.set_breath_input(breath_input if breath_input in available_breath_inputs() else BREATH_INPUTS[0])
+        # The shader is compiled after the first frame (see on_first_frame).
+        self.renderer = renderer if renderer in RENDERERS else RENDERERS[0]
+        if particle_budget in PARTICLE_BUDGETS:
+            self.animated_circle.particle_budget = particle_budget
+        self.animated_circle.max_fps = max_fps if max_fps in FRAME_RATE_CAPS else FRAME_RATE_CAPS[0]
+        model = self.animated_circle.model
+        model.set_cycle_times(start_cycle_times, end_cycle_times)
+        model.select_duration(float('inf') if shows_infinity(selected_duration) else max(0, selected_duration))
+        # Shown in the first frame already, and not saved back.
+        model.notify()
 
     def save_state(self):
+        # Called at most once per frame while settings change; the store
+        # coalesces these into one background write once the value settles.
         state = {
-            'start_cycle_times': [slider.value for slider in self.sliders[:-1]],
-            'end_cycle_times': self.animated_circle.end_cycle_time,
+            'start_cycle_times': list(self.animated_circle.start_cycle_time),
+            'end_cycle_times': list(self.animated_circle.end_cycle_time),
             'selected_duration': self.animated_circle.selected_duration,
+            'max_fps': self.animated_circle.max_fps,
+            'renderer': self.renderer,
+            'particle_budget': self.animated_circle.particle_budget,
+            'cue_latency': self.animated_circle.cue_latency,
+            'breath_input': self.animated_circle.breath_input,
+            'adapt_ramp': self.animated_circle.adapt_ramp,
         }
-        with open(self.save_file_path(), 'w') as f:
-            json.dump(state, f)
+        state_store.write(self.save_file_path(), state)
 
     def save_file_path(self):
         from kivy.app import App
@@ -574,13 +1308,15 @@ class MainAppLayout(BoxLayout):
 
     def update_start_stop_button_label(self, new_label):
         self.start_stop_button.text = new_label
+        if new_label == 'Start' and self.eyes_closed:
+            self.open_eyes()  # The session is over
 
     def toggle_animation(self, instance):
         if instance.text == 'Start':
-            self.animated_circle.phase = 0
-            self.animated_circle.last_phase = -1
-            self.animated_circle.progress = 0
             instance.text = 'Stop'
+            # Compiling once during the countdown loads NumPy (if present) before
+            # the session's first frame needs it.
+            self.animated_circle.get_timeline()
             self.countdown_from = 5
             self.update_countdown_label(self.countdown_from)
             self.perform_countdown(instance)
@@ -588,19 +1324,18 @@ class MainAppLayout(BoxLayout):
             self.animated_circle.toggle_animation(False)
             if self.countdown_schedule:
                 self.countdown_schedule.cancel()
-                if (self.animated_circle.duration == float('inf') or self.animated_circle.duration > 30 * 60 + 1) and ALLOW_INF:
+                if shows_infinity(self.animated_circle.duration):
                     self.timer_label.text = '∞'
                 else:
                     self.timer_label.text = f'{int((self.animated_circle.duration + 30) // 60)}:00'
             instance.text = 'Start'
-            if wake_lock and wake_lock.isHeld():
-                wake_lock.release()
+            hold_wake_lock(None)
 
     def update_countdown_label(self, number):
         if number > 0:
             self.timer_label.text = str(number)
         else:
-            if (self.animated_circle.duration == float('inf') or self.animated_circle.duration >= 30 * 60 + 1) and ALLOW_INF:
+            if shows_infinity(self.animated_circle.duration):
                 self.timer_label.text = '∞'
             else:
                 self.timer_label.text = ''
@@ -616,11 +1351,18 @@ class MainAppLayout(BoxLayout):
             self.perform_countdown(instance)
         else:
             self.update_countdown_label(self.countdown_from)
-            if wake_lock:
-                wake_lock.acquire()
+            hold_wake_lock(SCREEN_WAKE_LOCK)
+            if self.group_server is not None:
+                circle = self.animated_circle
+                circle.session_clock = self.group_server.session_time
+                self.group_server.start_session(circle.start_cycle_time, circle.end_cycle_time,
+                                                circle.selected_duration)
             self.animated_circle.toggle_animation(True)
+            if self.eyes_closed:
+                self.animated_circle.enter_low_power()
 
     def toggle_settings(self, instance):
+        self.build_settings()
         if self.settings_visible:
             self.bottom_layout.remove_widget(self.settings_layout)
             self.settings_visible = False
@@ -630,46 +1372,158 @@ class MainAppLayout(BoxLayout):
             self.settings_visible = True
             self.animated_circle.size_hint_y = 0.2
 
-    def update_slider_label(self, slider_label, label, index):
-        def update_label(instance, value):
-            slider_label.text = f'{label}: {int(value)} seconds'
-            # When manually adjusting the slider, assume a static cycle:
-            self.animated_circle.start_cycle_time[index] = value
-            self.animated_circle.end_cycle_time[index] = value
-            self.save_state()
-            parts = self.sequence_label.text.split("-")
-            if len(parts) == 4:
-                parts[index] = str(int(value))
-                self.sequence_label.text = "-".join(parts)
-        return update_label
-
-    def update_duration_slider_label(self, slider_label):
-        def update_label(instance, value):
-            if (value == float('inf') or value >= 30 * 60 + 1) and ALLOW_INF:
-                slider_label.text = 'Time: ∞'
-                self.animated_circle.duration = float('inf')
-                self.timer_label.text = '∞'
+    def set_frame_rate_cap(self, max_fps):
+        self.animated_circle.max_fps = max_fps
+        self.animated_circle.request_frame()
+        self.fps_button.text = f'{max_fps} fps' if max_fps == FRAME_RATE_CAPS[0] else f'{max_fps} fps (power saver)'
+
+    def cycle_frame_rate_cap(self, instance):
+        index = FRAME_RATE_CAPS.index(self.animated_circle.max_fps)
+        self.set_frame_rate_cap(FRAME_RATE_CAPS[(index + 1) % len(FRAME_RATE_CAPS)])
+        self.save_state()
+
+    def set_renderer(self, renderer):
+        if not self.animated_circle.use_renderer(renderer):
+            renderer = 'ellipses'
+        self.renderer = renderer
+        if self.settings_layout is not None:
+            self.renderer_button.text = renderer
+
+    def cycle_renderer(self, instance):
+        index = RENDERERS.index(self.renderer)
+        # Renderers that are not available here are skipped.
+        for step in range(1, len(RENDERERS) + 1):
+            renderer = RENDERERS[(index + step) % len(RENDERERS)]
+            self.set_renderer(renderer)
+            if self.renderer == renderer:
+                break
+        self.save_state()
+
+    def cycle_particle_budget(self, instance):
+        circle = self.animated_circle
+        index = PARTICLE_BUDGETS.index(circle.particle_budget)
+        circle.particle_budget = PARTICLE_BUDGETS[(index + 1) % len(PARTICLE_BUDGETS)]
+        self.particle_budget_button.text = str(circle.particle_budget)
+        if self.renderer == 'particles':
+            self.set_renderer('particles')  # Rebuilt with the new budget
+        self.save_state()
+
+    def set_breath_input(self, breath_input):
+        # Takes effect from the next session on.
+        self.animated_circle.breath_input = breath_input
+        shown = self.breath_label.parent is not None
+        if breath_input != 'off' and not shown:
+            # Between the sequence label and the buttons.
+            index = self.bottom_layout.children.index(self.sequence_label)
+            self.bottom_layout.add_widget(self.breath_label, index=index)
+        elif breath_input == 'off' and shown:
+            self.bottom_layout.remove_widget(self.breath_label)
+        if self.settings_layout is not None:
+            self.breath_input_button.text = breath_input.capitalize()
+
+    def cycle_breath_input(self, instance):
+        inputs = available_breath_inputs()
+        index = inputs.index(self.animated_circle.breath_input)
+        self.set_breath_input(inputs[(index + 1) % len(inputs)])
+        self.save_state()
+
+    def adapt_ramp_text(self):
+        return 'Adapt ramp' if self.animated_circle.adapt_ramp else 'Fixed ramp'
+
+    def toggle_adapt_ramp(self, instance):
+        self.animated_circle.adapt_ramp = not self.animated_circle.adapt_ramp
+        self.adapt_ramp_button.text = self.adapt_ramp_text()
+        self.save_state()
+
+    def breath_session_changed(self, changed):
+        # The breath label follows the monitor's readings while a session
+        # runs, a couple of times a second; the frames are left alone.
+        if self.breath_label_event is not None:
+            self.breath_label_event.cancel()
+            self.breath_label_event = None
+        if self.animated_circle.animation_active and self.animated_circle.breath_input != 'off':
+            self.breath_label_event = Clock.schedule_interval(self.refresh_breath_label, BREATH_LABEL_INTERVAL)
+        set_text(self.breath_label, '')
+
+    def refresh_breath_label(self, dt):
+        from breath_input import reading_text
+        monitor = self.animated_circle.breath_monitor
+        if monitor is None or not monitor.running:
+            set_text(self.breath_label, 'No breath input')  # Not available, or the recorder stopped
+        else:
+            set_text(self.breath_label, reading_text(monitor.reading))
+
+    def cycle_slider_moved(self, index):
+        def moved(instance, value):
+            if not self.refreshing:
+                self.animated_circle.model.set_cycle_time(index, value)
+        return moved
+
+    def duration_slider_moved(self, instance, value):
+        if not self.refreshing:
+            self.animated_circle.model.set_duration(value)
+
+    def refresh_settings(self, changed):
+        # Called by the session model, at most once per frame, with what
+        # changed since; the only place the settings reach the widgets.
+        started = time.perf_counter() if instrumentation.enabled else None
+        self.refreshing = True
+        session = self.animated_circle.session
+        if CYCLE_TIME in changed:
+            # The slider moves continuously but the labels show whole seconds.
+            set_text(self.sequence_label, '-'.join(str(int(v)) for v in session.start_cycle_time))
+            for slider, slider_label, label, value in zip(self.sliders, self.cycle_slider_labels,
+                                                          CYCLE_SLIDER_NAMES, session.start_cycle_time):
+                slider.value = value
+                set_text(slider_label, f'{label}: {int(value)} seconds')
+        if not changed.isdisjoint((DURATION, COUNTDOWN, RUNNING)):
+            duration = session.duration
+            if shows_infinity(duration):
+                self.duration_slider.value = UNBOUNDED
+                set_text(self.timer_label, '∞')
             else:
-                minutes, seconds = divmod(int(value), 60)
-                slider_label.text = f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
+                self.duration_slider.value = UNBOUNDED if is_unbounded(duration) else max(0, min(duration, MAX_DURATION))
+                minutes, seconds = divmod(int(duration), 60)
                 if not self.animated_circle.animation_active:
                     seconds = 0
-                    minutes = int((value + 30) // 60)
-                self.timer_label.text = f'{minutes}:{seconds:02d}'
-                self.animated_circle.duration = value
-            if not self.animated_circle.animation_active:
-                self.animated_circle.selected_duration = value
-            self.save_state()
-        return update_label
+                    minutes = int((duration + 30) // 60)
+                set_text(self.timer_label, f'{minutes}:{seconds:02d}')
+            set_text(self.duration_label, duration_text(duration))
+        self.refreshing = False
+        if started is not None:
+            instrumentation.span(LABELS, started)
 
     def test_ding(self, instance):
-        self.animated_circle.sounds[4].play()
+        from calibration import CalibrationPopup
+        circle = self.animated_circle
+        CalibrationPopup(sounds=circle.sounds, latency=circle.cue_latency,
+                         on_calibrated=self.set_cue_latency).open()
+
+    def set_cue_latency(self, latency):
+        self.animated_circle.set_cue_latency(latency)
+        self.save_state()
 
 if __name__ == '__main__':
     if not os.environ.get('CI'):
         print("Shibboleth - Breathe3")
-        from kivy.app import App
+        with profiler.section('import', 'kivy.app'):
+            from kivy.app import App
         class MainApp(App):
             def build(self):
-                return MainAppLayout()
-        MainApp().run()
\ No newline at end of file
+                with profiler.section('build', 'MainAppLayout'):
+                    return MainAppLayout()
+
+            def on_pause(self):
+                state_store.flush()
+                self.root.on_app_pause()
+                return True
+
+            def on_resume(self):
+                self.root.on_app_resume()
+
+            def on_stop(self):
+                state_store.flush()
+                self.root.on_app_stop()
+        MainApp().run()
+        if profiler.mode == 'exit' and not profiler.first_frame():
+            sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import math
+
+from kivy.graphics import Color, InstructionGroup, Mesh
+from kivy.graphics.texture import Texture
+
+from timeline import get_numpy, ring_radii
+
+# Kivy indexes mesh vertices with unsigned shorts, and every particle is a
+# quad of four vertices.
+MAX_PARTICLES = 65535 // 4
+# Half the side of a particle, in percent of half the widget's shorter side
+# (the unit of the ring radii).
+PARTICLE_SIZE = 0.9
+RINGS = 5
+
+# ============================================================================
+# ParticleRings
+# ----------------------------------------------------------------------------
+# Alternative renderer for AnimatedCircle: `budget` particles spread over the
+# five rings, all in a single Mesh. Each ring's particles fill the band
+# between it and the next ring inwards (the last one its whole disc), so
+# they breathe with the rings, and they circle the centre, one turn per
+# breathing cycle, alternately clockwise and anticlockwise by ring.
+#
+# Everything that does not change is made once: the particles' places within
+# their band and starting directions, the indices and the texture
+# coordinates. A frame recomputes the quad corners in place, in the NumPy
+# array the mesh reads its vertices from: a dozen vectorised passes over
+# preallocated float32 arrays, with no per-particle trigonometry (each ring
+# turns by one angle) and no allocations. The stock shader has no per-vertex
+# colour, so each particle's texture coordinate points at its ring's colour
+# in a 5x1 palette texture.
+#
+# `ok` is False without NumPy, in which case the caller keeps drawing the
+# ellipses.
+# ============================================================================
+class ParticleRings:
+    # The particles move between ring changes, so frames are not spaced out.
+    always_moving = True
+
+    def __init__(self, widget, colors, budget, seed=3):
+        self.widget = widget
+        np = self.np = get_numpy()
+        self.ok = np is not None
+        self.group = InstructionGroup()
+        self.drawn = None
+        if not self.ok:
+            return
+        per_ring = max(1, min(budget, MAX_PARTICLES) // RINGS)
+        count = per_ring * RINGS
+        # Ring by ring, so that the inner rings are drawn over the outer ones
+        # and each ring's particles are one slice.
+        self.rings = [slice(i * per_ring, (i + 1) * per_ring) for i in range(RINGS)]
+        ring = np.repeat(np.arange(RINGS), per_ring)
+        rng = np.random.default_rng(seed)
+        angle = rng.uniform(0, 2 * math.pi, count)
+        # A particle's place within its band, as a share of the band's area.
+        self.spread = rng.uniform(0, 1, count).astype(np.float32)
+        # Starting directions, turned by one angle per frame: alternate rings
+        # turn the other way.
+        turns = np.where(ring % 2, -1.0, 1.0)
+        self.cos_a = np.cos(angle).astype(np.float32)
+        self.sin_a = np.sin(angle).astype(np.float32)
+        self.turned_cos_a = (turns * self.cos_a).astype(np.float32)
+        self.turned_sin_a = (turns * self.sin_a).astype(np.float32)
+        self.r = np.empty(count, dtype=np.float32)
+        self.x = np.empty(count, dtype=np.float32)
+        self.y = np.empty(count, dtype=np.float32)
+        self.scratch = np.empty(count, dtype=np.float32)
+        # x, y, u, v of the four corners of every particle; the texture
+        # coordinates pick the ring's colour and never change.
+        self.vertices = np.zeros((count, 4, 4), dtype=np.float32)
+        self.vertices[:, :, 2] = ((ring + 0.5) / RINGS)[:, None]
+        self.vertices[:, :, 3] = 0.5
+        # Writing each corner's x and y as a column is far quicker than one
+        # broadcast over the (count, 4, 2) corner block.
+        self.corners = [(self.vertices[:, k, 0], self.vertices[:, k, 1], dx, dy)
+                        for k, (dx, dy) in enumerate(((-1, -1), (1, -1), (1, 1), (-1, 1)))]
+        quads = np.arange(count)[:, None] * 4
+        indices = (quads + np.array([0, 1, 2, 2, 3, 0])).ravel().astype(np.uint16)
+        self.flat_vertices = self.vertices.reshape(-1)
+        self.group.add(Color(1, 1, 1, 1))
+        self.mesh = Mesh(vertices=self.flat_vertices, indices=indices, mode='triangles',
+                         texture=self.palette(colors))
+        self.group.add(self.mesh)
+
+    def palette(self, colors):
+        texture = Texture.create(size=(RINGS, 1), colorfmt='rgba')
+        texture.mag_filter = 'nearest'
+        texture.min_filter = 'nearest'
+        pixels = bytes(min(255, int(round(v * 255))) for color in colors for v in color)
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        return texture
+
+    def attach(self):
+        self.widget.canvas.add(self.group)
+        self.drawn = None
+
+    def detach(self):
+        self.widget.canvas.remove(self.group)
+
+    def update(self, phase, progress, resized=False, cycle_progress=0):
+        if resized:
+            self.drawn = None
+        if (phase, progress, cycle_progress) == self.drawn:
+            return
+        self.drawn = (phase, progress, cycle_progress)
+        np = self.np
+        widget = self.widget
+        scale = min(widget.width, widget.height) / 200.0
+        radii = [radius * scale for radius in ring_radii(phase, progress)] + [0.0]
+        r, x, y, scratch = self.r, self.x, self.y, self.scratch
+        for i, ring in enumerate(self.rings):
+            outer, inner = radii[i], radii[i + 1]
+            np.multiply(self.spread[ring], outer * outer - inner * inner, out=r[ring])
+            r[ring] += inner * inner
+        np.sqrt(r, out=r)
+        # By the time into the cycle rather than the phase index, so that a
+        # zero-length phase (the usual second hold) does not skip a quarter turn.
+        turn = 2 * math.pi * cycle_progress
+        cos_t, sin_t = math.cos(turn), math.sin(turn)
+        # (x, y) = r (cos(a + t), sin(a + t)), with t negated on alternate rings.
+        np.multiply(self.cos_a, cos_t, out=x)
+        np.multiply(self.turned_sin_a, sin_t, out=scratch)
+        np.subtract(x, scratch, out=x)
+        np.multiply(x, r, out=x)
+        np.multiply(self.sin_a, cos_t, out=y)
+        np.multiply(self.turned_cos_a, sin_t, out=scratch)
+        np.add(y, scratch, out=y)
+        np.multiply(y, r, out=y)
+        half = PARTICLE_SIZE * scale
+        cx, cy = widget.center_x, widget.center_y
+        for column_x, column_y, dx, dy in self.corners:
+            np.add(x, cx + dx * half, out=column_x)
+            np.add(y, cy + dy * half, out=column_y)
+        self.mesh.vertices = self.flat_vertices
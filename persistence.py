@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+import time
+
+def write_json_atomic(path, data):
+    """ Write JSON next to path and rename it into place, so a crash never leaves a truncated file """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# ============================================================================
+# WriteBehindStore
+# ----------------------------------------------------------------------------
+# Settings are saved from slider callbacks, i.e. dozens of times per second
+# during a drag. write() only remembers the latest document per path; a
+# background thread writes it once nothing has changed for quiet_period
+# seconds. flush() writes whatever is pending right away (on pause/stop).
+#
+# Documents are serialised on the writer thread, so callers must hand over
+# objects they will not mutate afterwards.
+# ============================================================================
+class WriteBehindStore:
+    def __init__(self, quiet_period=0.5):
+        self.quiet_period = quiet_period
+        self.pending = {}
+        self.deadline = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        # Held while pending documents are taken and written, so that writes
+        # hit the disk in the order they were requested.
+        self.io_lock = threading.Lock()
+        self.thread = None
+
+    def write(self, path, data):
+        with self.lock:
+            self.pending[path] = data
+            self.deadline = time.monotonic() + self.quiet_period
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='WriteBehindStore', daemon=True)
+                self.thread.start()
+            self.changed.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.changed.wait()
+                delay = self.deadline - time.monotonic()
+                if delay > 0:
+                    self.changed.wait(delay)
+                    continue
+            self.flush()
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for path, data in pending.items():
+                try:
+                    write_json_atomic(path, data)
+                except OSError as e:
+                    print(f"Error writing {path}: {e}")
+
+# Used by save_state for the settings; the app flushes it on pause/stop. (The
+# preset editor writes to SQLite through PresetStore instead.)
+state_store = WriteBehindStore()
@@ -0,0 +1,149 @@
+from kivy.graphics import Color, Rectangle
+from kivy.uix.button import Button
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+from preset_thumbnails import THUMBNAIL_SIZE, thumbnail_key
+
+BUTTON_WIDTH = 350
+BAR_HEIGHT = 150
+# Space around the text, and between a preview and the button's edges.
+PADDING = 12
+# Presets are read from the store this many at a time, as the bar scrolls.
+PAGE_SIZE = 50
+
+def preset_key(preset_values):
+    # Presets read from JSON hold lists, edited ones tuples; compare by value.
+    start_values, end_values, duration_seconds = preset_values
+    return tuple(start_values), tuple(end_values), duration_seconds
+
+def preset_button_text(preset_name, preset_values):
+    start_values, end_values, duration_seconds = preset_values
+    duration_minutes = int((duration_seconds + 30) // 60)
+    return f"{preset_name}\n{'-'.join(map(str, start_values))}→{'-'.join(map(str, end_values))}/{duration_minutes}"
+
+def preset_item(preset_name, preset_values):
+    """ The bar's data entry for a preset; preset_name None for the "Edit" button """
+    if preset_name is None:
+        return {'preset_name': None, 'text': 'Edit', 'preset_values': None}
+    return {'preset_name': preset_name, 'text': preset_button_text(preset_name, preset_values),
+            'preset_values': preset_values}
+
+# ============================================================================
+# PresetButton
+# ----------------------------------------------------------------------------
+# A recycled preset button. preset_name None is the trailing "Edit" button.
+# With the bar's thumbnails, the text sits at the top and the preset's preview
+# below it, once its texture is ready.
+# ============================================================================
+class PresetButton(RecycleDataViewBehavior, Button):
+    def __init__(self, **kwargs):
+        super().__init__(halign='center', bold=True, **kwargs)
+        self.background_color = (0.1, 0.1, 0.1, 0.75)
+        self.bar = None
+        self.preset_name = None
+        self.thumbnail_key = None
+        with self.canvas.after:
+            self.thumbnail_color = Color(1, 1, 1, 0)
+            self.thumbnail = Rectangle()
+        self.bind(pos=self.place_thumbnail, size=self.place_thumbnail)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.bar = rv
+        self.preset_name = data['preset_name']
+        self.text = data['text']
+        thumbnails = rv.thumbnails
+        if thumbnails is None:
+            return
+        thumbnails.forget(self.show_thumbnail)
+        self.thumbnail_key = None
+        self.show_thumbnail(None, None)
+        self.place_thumbnail()
+        if data['preset_values'] is None:
+            self.valign = 'middle'
+            return
+        self.valign = 'top'
+        self.thumbnail_key = thumbnail_key(data['preset_values'])
+        texture = thumbnails.get(data['preset_values'], self.show_thumbnail)
+        if texture is not None:
+            self.show_thumbnail(self.thumbnail_key, texture)
+
+    def show_thumbnail(self, key, texture):
+        if key != self.thumbnail_key:
+            return
+        self.thumbnail.texture = texture
+        self.thumbnail_color.a = 1 if texture is not None else 0
+
+    def place_thumbnail(self, *args):
+        if self.bar is None or self.bar.thumbnails is None:
+            return
+        self.text_size = (self.width - 2 * PADDING, self.height - 2 * PADDING)
+        self.thumbnail.pos = (self.x + PADDING, self.y + PADDING)
+        self.thumbnail.size = (self.width - 2 * PADDING, THUMBNAIL_SIZE[1])
+
+    def on_press(self):
+        if self.preset_name is None:
+            self.bar.edit_presets()
+        else:
+            self.bar.apply_preset(self.preset_name)
+
+# ============================================================================
+# PresetBar
+# ----------------------------------------------------------------------------
+# The horizontal preset strip. Only the buttons in view are widgets; sync()
+# diffs a new presets dict against what is shown and removes, relabels or
+# inserts just the entries that changed. Presets come from a PresetStore one
+# page at a time; the next page is read when the strip is scrolled near its end.
+# `thumbnails` (a PresetThumbnails, or None) supplies the buttons' previews.
+# ============================================================================
+class PresetBar(RecycleView):
+    def __init__(self, apply_preset, edit_presets, thumbnails=None, **kwargs):
+        super().__init__(do_scroll_x=True, do_scroll_y=False, bar_width=10, **kwargs)
+        self.apply_preset = apply_preset
+        self.edit_presets = edit_presets
+        self.thumbnails = thumbnails
+        layout = RecycleBoxLayout(orientation='horizontal', size_hint=(None, 1),
+                                  default_size=(BUTTON_WIDTH, BAR_HEIGHT), default_size_hint=(None, None))
+        layout.bind(minimum_width=layout.setter('width'))
+        self.add_widget(layout)
+        self.viewclass = PresetButton
+        self.shown = {}
+        self.data = [preset_item(None, None)]
+        self.store = None
+        self.total = 0
+
+    def show(self, store):
+        self.store = store
+        self.refresh()
+
+    def refresh(self, count=None):
+        """ Re-read the presets shown so far (at least one page) and apply the differences """
+        self.total = self.store.count()
+        self.sync(self.store.page_dict(0, max(count or len(self.shown), PAGE_SIZE)))
+
+    def on_scroll_x(self, instance, value):
+        if self.store is not None and value > 0.9 and len(self.shown) < self.total:
+            self.refresh(len(self.shown) + PAGE_SIZE)
+
+    def sync(self, presets):
+        data = self.data
+        names = [item['preset_name'] for item in data[:-1]]
+        for i in range(len(names) - 1, -1, -1):
+            if names[i] not in presets:
+                del data[i]
+                del self.shown[names.pop(i)]
+        for i, name in enumerate(names):
+            key = preset_key(presets[name])
+            if self.shown[name] != key:
+                self.shown[name] = key
+                data[i] = preset_item(name, presets[name])
+        for name, preset_values in presets.items():
+            if name not in self.shown:
+                self.shown[name] = preset_key(preset_values)
+                data.insert(len(data) - 1, preset_item(name, preset_values))
+                names.append(name)
+        if names != list(presets):
+            # Reordered presets: the entries are all reused, only their order changes.
+            by_name = {item['preset_name']: item for item in data[:-1]}
+            self.data = [by_name[name] for name in presets] + [data[-1]]
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+from kivy.clock import Clock
+
+from imagecache import cached_image_path, read_png, write_png
+from session import has_end
+from timeline import PHASES, get_numpy
+
+# Size of a preview in pixels; it is drawn at this size under the button text.
+THUMBNAIL_SIZE = (320, 56)
+# Uploaded previews kept in memory, for the buttons scrolled past most recently.
+MAX_TEXTURES = 48
+# Inhale, first hold, exhale, second hold (8-bit RGBA).
+PHASE_COLORS = (
+    (252, 170, 253, 255),
+    (242, 242, 242, 220),
+    (150, 90, 190, 255),
+    (170, 170, 170, 200),
+)
+
+def thumbnail_key(preset_values):
+    """ Short hash of a preset's values; presets with equal values share a preview """
+    start_values, end_values, duration_seconds = preset_values
+    values = [[float(v) for v in start_values], [float(v) for v in end_values], float(duration_seconds)]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()[:16]
+
+def render_thumbnail(np, preset_values, size=THUMBNAIL_SIZE):
+    """ 8-bit RGBA pixels (top-down rows) of a preset's preview; np may be None """
+    # Time runs left to right over the session. Each column stacks the four
+    # phases of the cycle in progress at that time, bottom up, at their
+    # length in seconds, so the ramp shows as the bands widening or narrowing.
+    # A session's cycles are far too many to draw one by one at this width.
+    if np is None:
+        return render_thumbnail_python(preset_values, size)
+    start_values, end_values, duration_seconds = preset_values
+    width, height = size
+    start = np.array(start_values, dtype=float)
+    end = np.array(end_values, dtype=float)
+    if has_end(duration_seconds):
+        factor = (np.arange(width) + 0.5) / width
+    else:
+        factor = np.zeros(width)  # No ramp: the start cycle throughout
+    lengths = start + (end - start) * factor[:, None]
+    bounds = np.cumsum(lengths, axis=1)
+    longest = max(bounds[:, -1].max(), 1e-9)
+    # Seconds into the cycle at the middle of each row, top row highest.
+    seconds = (height - np.arange(height) - 0.5) / height * longest
+    phase = (seconds[:, None, None] >= bounds[None, :, :]).sum(axis=2)
+    palette = np.zeros((PHASES + 1, 4), dtype=np.uint8)
+    palette[:PHASES] = PHASE_COLORS
+    return palette[phase].tobytes()
+
+def render_thumbnail_python(preset_values, size=THUMBNAIL_SIZE):
+    """ render_thumbnail without NumPy: the same pixels, a row of columns at a time """
+    start_values, end_values, duration_seconds = preset_values
+    width, height = size
+    columns = []
+    for x in range(width):
+        factor = (x + 0.5) / width if has_end(duration_seconds) else 0.0
+        t = 0.0
+        bounds = []
+        for s, e in zip(start_values, end_values):
+            t += s + (e - s) * factor
+            bounds.append(t)
+        columns.append(bounds)
+    longest = max(max(bounds[-1] for bounds in columns), 1e-9)
+    colors = [bytes(color) for color in PHASE_COLORS] + [bytes(4)]
+    rows = []
+    for y in range(height):
+        seconds = (height - y - 0.5) / height * longest
+        rows.append(b''.join(colors[sum(seconds >= bound for bound in bounds)] for bounds in columns))
+    return b''.join(rows)
+
+# ============================================================================
+# PresetThumbnails
+# ----------------------------------------------------------------------------
+# Previews of presets' breathing patterns for the preset bar. get() answers
+# from the uploaded textures or else queues the preview for a worker thread,
+# so asking never blocks the UI: the worker reads the PNG cached in cache_dir
+# (keyed by a hash of the preset values) or renders it with NumPy and writes
+# it there, and the pixels come back on the UI thread. They are uploaded only
+# if a button in view still waits for them; the bar's recycled buttons ask
+# only while they are in view.
+#
+# Without NumPy the previews are rendered in plain Python, which is slower
+# but runs on the worker all the same.
+# ============================================================================
+class PresetThumbnails:
+    def __init__(self, cache_dir, size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir
+        self.size = size
+        # NumPy, if any, is imported by the worker, when the first preview is rendered.
+        self.textures = OrderedDict()
+        self.waiting = {}
+        # The most recent requests first: those are the buttons in view.
+        self.requests = queue.LifoQueue()
+        self.worker = None
+
+    def get(self, preset_values, callback):
+        """ The texture of a preset's preview, or None, and callback(key, texture) once it is uploaded """
+        key = thumbnail_key(preset_values)
+        texture = self.textures.get(key)
+        if texture is not None:
+            self.textures.move_to_end(key)
+            return texture
+        if key not in self.waiting:
+            self.waiting[key] = []
+            self.requests.put((key, tuple(preset_values)))
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.work, name='PresetThumbnails', daemon=True)
+                self.worker.start()
+        self.waiting[key].append(callback)
+        return None
+
+    def forget(self, callback):
+        """ Stop waiting on behalf of callback (its button shows another preset) """
+        for callbacks in self.waiting.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def work(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        while True:
+            key, preset_values = self.requests.get()
+            pixels = self.load(key, preset_values)
+            Clock.schedule_once(lambda dt, key=key, pixels=pixels: self.loaded(key, pixels))
+
+    def load(self, key, preset_values):
+        width, height = self.size
+        path = cached_image_path(self.cache_dir, 'preset', key, self.size)
+        try:
+            cached = read_png(path)
+            if cached is not None and cached[:2] == (width, height):
+                return cached[2]
+        except (OSError, ValueError):
+            pass  # Missing or unreadable: render it again
+        pixels = render_thumbnail(get_numpy(), preset_values, self.size)
+        try:
+            write_png(path, width, height, pixels)
+        except OSError:
+            pass
+        return pixels
+
+    def loaded(self, key, pixels):
+        callbacks = self.waiting.pop(key, [])
+        if not callbacks:
+            return  # Scrolled out of view meanwhile; asked for again when back
+        from kivy.graphics.texture import Texture
+        texture = Texture.create(size=self.size, colorfmt='rgba')
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        texture.flip_vertical()  # The pixels are top-down, textures bottom-up
+        self.textures[key] = texture
+        if len(self.textures) > MAX_TEXTURES:
+            self.textures.popitem(last=False)
+        for callback in callbacks:
+            callback(key, texture)
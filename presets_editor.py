@@ -0,0 +1,232 @@
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.popup import Popup
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.textinput import TextInput
+
+ROW_HEIGHT = 150
+# Rows are read from the store this many at a time, as the list scrolls.
+PAGE_SIZE = 50
+
+def preset_row(preset_name='New preset', preset_values=([4, 8, 8, 0], [4, 8, 8, 0], 10*60), preset_id=None, key=None):
+    """ Editor model for one preset: the texts being edited plus their parsed values """
+    start_values, end_values, duration = preset_values
+    return {
+        'id': preset_id,
+        'key': preset_id if key is None else key,
+        'name': preset_name,
+        'duration': str(int(duration // 60)),
+        'start': '-'.join(map(str, start_values)),
+        'end': '-'.join(map(str, end_values)),
+        'values': (list(start_values), list(end_values), duration),
+        'error': '',
+    }
+
+def validate_row(row):
+    """ Parse the texts of a row into row['values'], or describe what is wrong in row['error'] """
+    try:
+        start_values = [int(v) for v in row['start'].strip().split('-')]
+        end_values = [int(v) for v in row['end'].strip().split('-')]
+        if len(start_values) != 4 or len(end_values) != 4 or any(v < 0 for v in start_values + end_values):
+            raise ValueError('Invalid cycle values')
+        duration = int(row['duration'].strip()) * 60  # Convert minutes to seconds
+        if duration < 0:
+            raise ValueError('Invalid duration')
+    except ValueError as e:
+        row['values'] = None
+        row['error'] = str(e)
+        return False
+    row['values'] = (start_values, end_values, duration)
+    row['error'] = ''
+    return True
+
+# ============================================================================
+# PresetRow
+# ----------------------------------------------------------------------------
+# One recycled editor row. Only the rows on screen exist as widgets; when a
+# row scrolls into view it is filled from the editor's model, and every edit
+# is written back to the model and validated right away.
+# ============================================================================
+class PresetRow(RecycleDataViewBehavior, BoxLayout):
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', **kwargs)
+        self.editor = None
+        self.index = None
+        self.row = None
+        self.refreshing = False
+        # Row 1: Name and Duration
+        row1 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        row1.add_widget(Label(text='Name:', size_hint_x=None, width=100))
+        self.name_input = TextInput(multiline=False)
+        row1.add_widget(self.name_input)
+        row1.add_widget(Label(text='Time (min):', size_hint_x=None, width=100))
+        self.duration_input = TextInput(multiline=False)
+        row1.add_widget(self.duration_input)
+        self.add_widget(row1)
+        # Row 2: Start Values
+        row2 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        row2.add_widget(Label(text='Start Values (Inhale-Hold1-Exhale-Hold2):', size_hint_x=None, width=250))
+        self.start_input = TextInput(multiline=False)
+        row2.add_widget(self.start_input)
+        self.add_widget(row2)
+        # Row 3: End Values
+        row3 = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        row3.add_widget(Label(text='End Values (Inhale-Hold1-Exhale-Hold2):', size_hint_x=None, width=250))
+        self.end_input = TextInput(multiline=False)
+        row3.add_widget(self.end_input)
+        self.add_widget(row3)
+        # Row 4: Delete button and validation message
+        row4 = BoxLayout(orientation='horizontal', size_hint_y=None, height=30)
+        delete_button = Button(text='Delete', size_hint_x=None, width=100)
+        delete_button.bind(on_press=lambda x: self.editor.delete_row(self.index))
+        row4.add_widget(delete_button)
+        self.error_label = Label(text='', color=(1, 0.4, 0.4, 1))
+        row4.add_widget(self.error_label)
+        self.add_widget(row4)
+        self.inputs = {
+            'name': self.name_input,
+            'duration': self.duration_input,
+            'start': self.start_input,
+            'end': self.end_input,
+        }
+        for key, text_input in self.inputs.items():
+            text_input.bind(text=lambda instance, value, key=key: self.edited(key, value))
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.editor = rv.editor
+        self.index = index
+        self.row = data
+        self.refreshing = True
+        for key, text_input in self.inputs.items():
+            text_input.text = data[key]
+        self.error_label.text = data['error']
+        self.refreshing = False
+
+    def edited(self, key, value):
+        if self.refreshing or self.row is None:
+            return
+        self.row[key] = value
+        validate_row(self.row)
+        self.error_label.text = self.row['error']
+        self.editor.edited_rows[self.row['key']] = self.row
+
+# ============================================================================
+# EditPresetsPopup
+# ----------------------------------------------------------------------------
+# Now each preset row lets you edit a name, the duration (in minutes), the
+# start cycle times and the end cycle times (each entered as a string such as
+# "4-8-8-0"). The rows are a list of plain dicts shown through a RecycleView,
+# filled from the PresetStore one page at a time as the list scrolls, so
+# opening the editor costs the same for three presets or three thousand.
+#
+# Edited and added rows are kept by key (the preset id, or a "new" key) so
+# they survive searching and re-sorting; Save writes only those rows and the
+# deleted ids. Save refuses while any edited row is invalid.
+# ============================================================================
+class EditPresetsPopup(Popup):
+    def __init__(self, store, on_save=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.on_save = on_save  # Callback when presets are saved
+        self.search = ''
+        self.order = 'position'
+        self.loaded = 0
+        self.total = 0
+        self.edited_rows = {}
+        self.new_keys = []
+        # Only ever counts up, so that a deleted row's key is never reused.
+        self.next_new_key = 0
+        self.deleted_ids = set()
+        self.layout = BoxLayout(orientation='vertical')
+        # Search and sort
+        self.filter_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        self.search_input = TextInput(multiline=False, hint_text='Search')
+        self.search_input.bind(text=self.set_search)
+        self.filter_layout.add_widget(self.search_input)
+        self.order_button = Button(text='Sort: position', size_hint_x=None, width=200)
+        self.order_button.bind(on_press=self.toggle_order)
+        self.filter_layout.add_widget(self.order_button)
+        self.layout.add_widget(self.filter_layout)
+        self.scrollable = RecycleView(size_hint=(1, 1), do_scroll_x=False, do_scroll_y=True, bar_width=10)
+        self.scrollable.editor = self
+        self.rows = RecycleBoxLayout(orientation='vertical', size_hint=(1, None),
+                                     default_size=(None, ROW_HEIGHT), default_size_hint=(1, None))
+        self.rows.bind(minimum_height=self.rows.setter('height'))
+        self.scrollable.add_widget(self.rows)
+        # viewclass lives on the layout manager, so it is set once that exists.
+        self.scrollable.viewclass = PresetRow
+        self.scrollable.bind(scroll_y=self.load_more_if_needed)
+        self.layout.add_widget(self.scrollable)
+        self.status_label = Label(text='', color=(1, 0.4, 0.4, 1), size_hint_y=None, height=30)
+        self.layout.add_widget(self.status_label)
+        self.add_row_button = Button(text='Add Row', size_hint_y=None, height=40)
+        self.add_row_button.bind(on_press=self.add_row)
+        self.layout.add_widget(self.add_row_button)
+        self.save_button = Button(text='Save', size_hint_y=None, height=40)
+        self.save_button.bind(on_press=self.save_presets)
+        self.layout.add_widget(self.save_button)
+        self.title = 'Edit Presets'
+        self.content = self.layout
+        self.size_hint = (0.9, 0.6)
+        self.pos_hint = {'top': 1}
+        self.populate_initial_rows()
+
+    def populate_initial_rows(self):
+        """ Show the rows added in this editor, then the first page of stored presets """
+        self.total = self.store.count(self.search)
+        self.loaded = 0
+        self.scrollable.data = [self.edited_rows[key] for key in self.new_keys]
+        self.load_more()
+        self.scrollable.scroll_y = 1
+
+    def load_more(self):
+        page = self.store.page(self.loaded, PAGE_SIZE, self.search, self.order)
+        self.loaded += len(page)
+        self.scrollable.data.extend(self.edited_rows.get(preset_id) or preset_row(preset_name, preset_values, preset_id)
+                                    for preset_id, preset_name, preset_values in page
+                                    if preset_id not in self.deleted_ids)
+
+    def load_more_if_needed(self, instance, scroll_y):
+        if scroll_y < 0.1 and self.loaded < self.total:
+            self.load_more()
+
+    def set_search(self, instance, text):
+        self.search = text.strip()
+        self.populate_initial_rows()
+
+    def toggle_order(self, instance):
+        self.order = 'name' if self.order == 'position' else 'position'
+        self.order_button.text = f'Sort: {self.order}'
+        self.populate_initial_rows()
+
+    def add_row(self, instance=None, preset_name='New preset', preset_values=([4, 8, 8, 0], [4, 8, 8, 0], 10*60)):
+        key = f'new{self.next_new_key}'
+        self.next_new_key += 1
+        row = preset_row(preset_name, preset_values, key=key)
+        self.new_keys.append(key)
+        self.edited_rows[key] = row
+        self.scrollable.data.insert(len(self.new_keys) - 1, row)
+        self.scrollable.scroll_y = 1
+
+    def delete_row(self, index):
+        row = self.scrollable.data.pop(index)
+        self.edited_rows.pop(row['key'], None)
+        if row['id'] is None:
+            self.new_keys.remove(row['key'])
+        else:
+            self.deleted_ids.add(row['id'])
+
+    def save_presets(self, instance):
+        invalid = [row for row in self.edited_rows.values() if row['values'] is None]
+        if invalid:
+            # Keep the editor open rather than silently dropping the row.
+            self.status_label.text = f"Cannot save {invalid[0]['name'].strip()!r}: {invalid[0]['error']}"
+            return
+        self.store.save(upserts=[(row['id'], row['name'].strip(), row['values']) for row in self.edited_rows.values()],
+                        deletes=self.deleted_ids)
+        if self.on_save:
+            self.on_save()
+        self.dismiss()
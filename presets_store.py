@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+
+# Default presets now include both start and end cycle times.
+DEFAULT_PRESETS = {
+    'Chill': ([4, 8, 8, 0], [6, 10, 10, 0], 30 * 60),
+    'Sleep': ([3, 7, 7, 0], [5, 9, 9, 0], 20 * 60),
+    'Slerp': ([4, 8, 8, 0], [4, 8, 8, 0], 15 * 60),
+}
+
+SCHEMA_VERSION = 1
+ORDERS = {
+    'position': 'position',
+    'name': 'name COLLATE NOCASE, position',
+}
+
+def encode_cycle(values):
+    return '-'.join(str(v) for v in values)
+
+def decode_cycle(text):
+    values = [float(v) for v in text.split('-')]
+    return [int(v) if v.is_integer() else v for v in values]
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def is_preset(values):
+    """ Whether values is a [start, end, duration] triple, as presets.json held them """
+    if not isinstance(values, (list, tuple)) or len(values) != 3:
+        return False
+    start_values, end_values, duration = values
+    return (all(isinstance(cycle, (list, tuple)) and len(cycle) == 4 and all(map(is_number, cycle))
+                for cycle in (start_values, end_values)) and is_number(duration))
+
+# ============================================================================
+# PresetStore
+# ----------------------------------------------------------------------------
+# Presets in an SQLite database instead of one presets.json that is read and
+# rewritten whole. Each preset is a row (name, start, end, duration, position);
+# callers page through them in display or name order, optionally filtered by
+# name, and save() applies only the rows that were edited or deleted.
+#
+# A new database imports presets.json once (or the defaults if there is none).
+# The JSON file is left untouched as a backup.
+# ============================================================================
+class PresetStore:
+    def __init__(self, path, legacy_json_path=None):
+        self.db = sqlite3.connect(path)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.migrate(legacy_json_path)
+
+    def migrate(self, legacy_json_path):
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS presets (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                duration REAL NOT NULL,
+                position INTEGER NOT NULL)''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS presets_position ON presets (position)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS presets_name ON presets (name COLLATE NOCASE)')
+            presets = DEFAULT_PRESETS
+            if legacy_json_path and os.path.exists(legacy_json_path):
+                try:
+                    with open(legacy_json_path, 'r') as f:
+                        presets = json.load(f)
+                except (json.JSONDecodeError, ValueError) as e:
+                    print(f"Error reading {legacy_json_path}: {e}")
+                if not isinstance(presets, dict):
+                    print(f"Error reading {legacy_json_path}: not a set of presets")
+                    presets = DEFAULT_PRESETS
+            position = 0
+            for name, values in presets.items():
+                if not is_preset(values):
+                    print(f"Skipping preset {name!r} in {legacy_json_path}: not [start, end, duration]")
+                    continue
+                start_values, end_values, duration = values
+                self.db.execute('INSERT OR IGNORE INTO presets (name, start, end, duration, position) VALUES (?, ?, ?, ?, ?)',
+                                (name, encode_cycle(start_values), encode_cycle(end_values), duration, position))
+                position += 1
+            self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    @staticmethod
+    def where(search):
+        if not search:
+            return '', ()
+        return "WHERE name LIKE ? ESCAPE '\\'", ('%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',)
+
+    def count(self, search=''):
+        where, args = self.where(search)
+        return self.db.execute(f'SELECT COUNT(*) FROM presets {where}', args).fetchone()[0]
+
+    def page(self, offset, limit, search='', order='position'):
+        """ List of (id, name, (start, end, duration)) """
+        where, args = self.where(search)
+        rows = self.db.execute(f'SELECT id, name, start, end, duration FROM presets {where} '
+                               f'ORDER BY {ORDERS[order]} LIMIT ? OFFSET ?', args + (limit, offset))
+        return [(preset_id, name, (decode_cycle(start), decode_cycle(end), duration))
+                for preset_id, name, start, end, duration in rows]
+
+    def page_dict(self, offset, limit, search='', order='position'):
+        return {name: values for preset_id, name, values in self.page(offset, limit, search, order)}
+
+    def get(self, name):
+        row = self.db.execute('SELECT start, end, duration FROM presets WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        start, end, duration = row
+        return decode_cycle(start), decode_cycle(end), duration
+
+    def unique_name(self, name, preset_id):
+        original_name = name
+        suffix = 1
+        while self.db.execute('SELECT 1 FROM presets WHERE name = ? AND id IS NOT ?', (name, preset_id)).fetchone():
+            name = f"{original_name} ({suffix})"
+            suffix += 1
+        return name
+
+    def save(self, upserts=(), deletes=()):
+        """ Apply edits in one transaction: upserts are (id or None, name, values), deletes are ids """
+        with self.db:
+            self.db.executemany('DELETE FROM presets WHERE id = ?', [(preset_id,) for preset_id in deletes])
+            # Park edited rows on placeholder names first, so that swapping two
+            # names does not collide half way.
+            self.db.executemany('UPDATE presets SET name = char(0) || id WHERE id = ?',
+                                [(preset_id,) for preset_id, name, values in upserts if preset_id is not None])
+            for preset_id, name, (start_values, end_values, duration) in upserts:
+                name = self.unique_name(name, preset_id)
+                if preset_id is None:
+                    position = self.db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM presets').fetchone()[0]
+                    self.db.execute('INSERT INTO presets (name, start, end, duration, position) VALUES (?, ?, ?, ?, ?)',
+                                    (name, encode_cycle(start_values), encode_cycle(end_values), duration, position))
+                else:
+                    self.db.execute('UPDATE presets SET name = ?, start = ?, end = ?, duration = ? WHERE id = ?',
+                                    (name, encode_cycle(start_values), encode_cycle(end_values), duration, preset_id))
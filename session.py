@@ -0,0 +1,376 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from cues import END_CUE, CueScheduler
+from timeline import BreathTimeline
+
+# ============================================================================
+# Session core
+# ----------------------------------------------------------------------------
+# Everything about a breathing session that does not involve drawing it: the
+# duration rules, the countdown and session clock, the compiled timeline and
+# the phase/breath bookkeeping. AnimatedCircle keeps one BreathSession and
+# only renders it; the terminal runner below uses the same core without
+# importing Kivy.
+#
+#   python session.py --preset Chill                  text cues
+#   python session.py --preset Chill --cues audio     sound cues only
+#   python session.py --start 4 7 8 0 --duration 300 --cues both
+# ============================================================================
+
+ALLOW_INF = False
+
+# The duration slider's range; its top value stands for "no end" (∞), or for
+# 30 minutes when ALLOW_INF is off.
+MAX_DURATION = 30 * 60
+UNBOUNDED = MAX_DURATION + 1
+
+PHASE_NAMES = ('Inhale', 'Hold', 'Exhale', 'Hold')
+
+def is_unbounded(duration):
+    return duration == float('inf') or duration >= UNBOUNDED
+
+def shows_infinity(duration):
+    """ True if a duration is shown (and run) as a session without an end """
+    return is_unbounded(duration) and ALLOW_INF
+
+def clamp_duration(duration):
+    duration = max(0, duration)
+    if duration >= UNBOUNDED:
+        return float('inf') if ALLOW_INF else UNBOUNDED
+    return duration
+
+def duration_text(duration):
+    """ The duration label: whole minutes (rounded) once there is one, else seconds """
+    if shows_infinity(duration):
+        return 'Time: ∞'
+    minutes, seconds = divmod(int(duration), 60)
+    if minutes:
+        minutes = int((duration + 30) // 60)
+    return f'Time: {minutes} minutes' if minutes else f'Time: {seconds} seconds'
+
+def has_end(duration):
+    return 0 < duration < float('inf')
+
+# ============================================================================
+# BreathSession
+# ----------------------------------------------------------------------------
+# `duration` counts down from `selected_duration` while the session runs
+# (unless it is shown as ∞, then only `elapsed` grows), and the session time
+# is whichever of the two applies. advance(dt) moves the clock and looks the
+# phase up in the timeline; enter_phase() records a cue and counts breaths.
+#
+# use_numpy=False compiles timelines in plain Python, which saves importing
+# NumPy where startup time matters more than compiling long sessions.
+# ============================================================================
+class BreathSession:
+    def __init__(self, start_cycle_time=(4, 8, 8, 0), end_cycle_time=None, duration=5 * 60, use_numpy=True):
+        self.start_cycle_time = list(start_cycle_time)
+        self.end_cycle_time = list(end_cycle_time if end_cycle_time is not None else start_cycle_time)
+        self.selected_duration = duration
+        self.duration = duration
+        self.use_numpy = use_numpy
+        self.timeline = None
+        self.timeline_origin = 0
+        # (time, factor) knots of an adapted start→end ramp; None keeps to plan.
+        self.ramp = None
+        self.phase = 0
+        self.last_phase = -1
+        self.progress = 0
+        self.cycle_progress = 0
+        self.elapsed = 0
+        # What the session history records about the running session.
+        self.session_started_at = None
+        self.breaths = 0
+        self.interruptions = 0
+
+    def rewind(self):
+        # A (re)started session begins with an inhale at the current point of
+        # the start→end ramp.
+        self.phase = 0
+        self.last_phase = -1
+        self.progress = 0
+        self.cycle_progress = 0
+        self.elapsed = 0
+        self.timeline_origin = self.session_time()
+        self.ramp = None
+        self.session_started_at = time.time()
+        self.breaths = 0
+        self.interruptions = 0
+
+    def session_time(self):
+        if self.selected_duration == float('inf') or self.selected_duration <= 0:
+            return self.elapsed
+        return self.selected_duration - self.duration
+
+    def end(self):
+        """ Session time at which the session ends (inf if it does not) """
+        return self.selected_duration if has_end(self.selected_duration) else float('inf')
+
+    def get_timeline(self):
+        # Cycle times are edited in place by the sliders, so compare by value.
+        key = BreathTimeline.make_key(self.start_cycle_time, self.end_cycle_time,
+                                      self.selected_duration, self.timeline_origin, self.ramp)
+        if self.timeline is None or self.timeline.key != key:
+            self.timeline = BreathTimeline(self.start_cycle_time, self.end_cycle_time,
+                                           self.selected_duration, self.timeline_origin,
+                                           use_numpy=self.use_numpy, ramp=self.ramp)
+        return self.timeline
+
+    def set_ramp_pace(self, pace, t):
+        """ From session time t on, cover this share (0 to 1) of what is left of the start→end ramp """
+        # The knots up to t stay, so the phases so far (and the one in
+        # progress) keep their lengths; only the ones after t change.
+        end = self.end()
+        if end == float('inf') or t >= end:
+            return
+        timeline = self.get_timeline()
+        factor = timeline.ramp_factor(t)
+        knots = tuple(knot for knot in (timeline.ramp or ((0.0, 0.0),)) if knot[0] < t)
+        self.ramp = knots + ((t, factor), (end, factor + (1 - factor) * pace))
+
+    def counts_down(self):
+        return not shows_infinity(self.duration)
+
+    def advance(self, dt):
+        """ Move the session on by dt; its TimelineState, or None once it has run out """
+        if self.counts_down():
+            self.duration -= dt
+            if self.duration <= 0:
+                return None
+        self.elapsed += dt
+        t = self.session_time()
+        timeline = self.get_timeline()
+        state = timeline.state(t)
+        self.phase = state.phase
+        self.progress = state.progress
+        self.cycle_progress = timeline.cycle_progress(t, state)
+        return state
+
+    def catch_up(self, gap):
+        """ Account for time that passed without advance() (no frames were drawn) """
+        if self.counts_down():
+            self.duration -= gap
+        self.elapsed += gap
+
+    def enter_phase(self, phase):
+        """ Record that phase has started (its cue is due); False if it already had """
+        if phase == self.last_phase:
+            return False
+        if self.last_phase == 2:
+            self.breaths += 1  # An exhale has ended
+        self.last_phase = phase
+        return True
+
+    def record(self, completed, preset=''):
+        """ The SessionRecord of the session so far """
+        from history import SessionRecord
+        timeline = self.get_timeline()
+        return SessionRecord(
+            started_at=self.session_started_at,
+            planned=self.selected_duration,
+            actual=self.elapsed,
+            breaths=self.breaths,
+            interruptions=self.interruptions,
+            completed=completed,
+            start_cycle=timeline.phase_durations(timeline.state(self.timeline_origin).cycle),
+            end_cycle=timeline.phase_durations(timeline.state(self.session_time()).cycle),
+            preset=preset)
+
+# ============================================================================
+# CueClock
+# ----------------------------------------------------------------------------
+# The session time between frames, as the cue scheduler reads it: the session
+# time of the last frame (see anchor()), run on by a monotonic clock. So the
+# cues follow the same time as the frames, at any frame rate.
+#
+# While no frames are drawn (low-power mode) the clock runs on by itself;
+# catch_up() then moves the session to it, and the first frame afterwards
+# takes its dt from the clock too, because the dt Kivy passes that frame may
+# or may not include the time without frames.
+#
+# frame() and cue_played() are what a frame and a played cue do to the
+# session, for AnimatedCircle and the replay in benchmarks/replay_check.py
+# alike. `monotonic` can be replaced, e.g. by a simulated clock in a replay.
+# ============================================================================
+class CueClock:
+    def __init__(self, session, monotonic=time.monotonic):
+        self.session = session
+        self.monotonic = monotonic
+        self.anchor_time = 0.0
+        self.anchor_at = monotonic()
+        self.dt_from_clock = False
+
+    def __call__(self):
+        return self.anchor_time + self.monotonic() - self.anchor_at
+
+    def anchor(self):
+        """ Run on from the session's time now (after a frame, or after the time was changed) """
+        self.anchor_time = self.session.session_time()
+        self.anchor_at = self.monotonic()
+
+    def catch_up(self):
+        """ Move the session on by the time since the last anchor, as no frame did """
+        self.session.catch_up(self.monotonic() - self.anchor_at)
+        self.anchor()
+        self.dt_from_clock = True
+
+    def frame_dt(self, dt):
+        """ The time to advance a frame by, given the dt it was called with """
+        if self.dt_from_clock:
+            self.dt_from_clock = False
+            return self.monotonic() - self.anchor_at
+        return dt
+
+    def frame(self, dt, session_clock=None):
+        """ Advance the session by a frame called with dt; its TimelineState, or None once it has run out """
+        dt = self.frame_dt(dt)
+        session = self.session
+        if session_clock is not None:
+            # Step to where the group's clock is. It may have been set back a
+            # little by a new offset estimate; the session waits for it then.
+            t = session_clock()
+            if t is not None:
+                dt = max(0.0, t - session.session_time())
+        state = session.advance(dt)
+        if state is not None:
+            self.anchor()
+            session.enter_phase(state.phase)  # Counts breaths; the cue is the scheduler's
+        return state
+
+    def cue_played(self, phase, low_power):
+        """ Account for the cue of phase having played; True if it started a phase no frame had """
+        if phase == END_CUE or not low_power:
+            return False
+        return self.session.enter_phase(phase)  # No frames to count the breaths
+
+def load_preset(name, path=None):
+    """ (start, end, duration) of a preset from presets.db or presets.json, or None """
+    from presets_store import DEFAULT_PRESETS
+    if path is None or not os.path.exists(path):
+        return DEFAULT_PRESETS.get(name)
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            preset = json.load(f).get(name)
+        return tuple(preset) if preset else None
+    from presets_store import PresetStore
+    return PresetStore(path).get(name)
+
+# ============================================================================
+# Terminal runner
+# ----------------------------------------------------------------------------
+# Runs a session without a window: the cue scheduler sleeps until each phase
+# boundary and prints the phase and/or plays its sound through a command-line
+# player (aplay, paplay or afplay). Imports stay limited to the standard
+# library and the Kivy-free modules, so it is ready in a few tens of ms.
+# ============================================================================
+class TerminalRunner:
+    def __init__(self, session, text=True, audio=False, latency=0.0, output=sys.stdout):
+        self.session = session
+        self.latency = latency
+        self.text = text
+        self.output = output
+        self.player = None
+        self.sounds = {}
+        if audio:
+            from audio import find_player
+            self.player = find_player()
+            if self.player is None:
+                print('No audio player found (aplay, paplay or afplay); showing text cues', file=sys.stderr)
+                self.text = True
+        self.done = threading.Event()
+        self.timer = CueScheduler(self.cue)
+        self.started = None
+
+    def sound_path(self, key):
+        if key not in self.sounds:
+            import tempfile
+            from audio import SOUND_NAMES, PcmCache, find_sound_asset
+            assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+            path = find_sound_asset(assets_dir, SOUND_NAMES[key])
+            if path and not path.endswith('.wav'):
+                # Command-line players take WAV; decode once into the temp dir.
+                cache = PcmCache(os.path.join(tempfile.gettempdir(), 'breathe3-audio'))
+                path = cache.prepare(path)
+            self.sounds[key] = path
+        return self.sounds[key]
+
+    def play(self, key):
+        import subprocess
+        path = self.sound_path(key)
+        if path:
+            subprocess.Popen([*self.player, path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def clock(self):
+        return time.monotonic() - self.started
+
+    def cue(self, phase, due):
+        # Runs on the cue scheduler's thread.
+        session = self.session
+        t = self.clock()
+        session.elapsed = t
+        if session.counts_down():
+            session.duration = session.selected_duration - t
+        if self.player is not None:
+            self.play(phase)
+        if phase == END_CUE:
+            if self.text:
+                self.print(t, f'Done: {session.breaths} breaths')
+            self.done.set()
+            return
+        session.enter_phase(phase)
+        if self.text:
+            state = session.get_timeline().state(due)
+            self.print(due, f'{PHASE_NAMES[phase]} {state.end - state.start:.1f} s')
+
+    def print(self, t, text):
+        minutes, seconds = divmod(int(t), 60)
+        print(f'{minutes:02d}:{seconds:02d}  {text}', file=self.output, flush=True)
+
+    def run(self):
+        session = self.session
+        session.rewind()
+        self.started = time.monotonic()
+        self.timer.start(session.get_timeline, self.clock, session.end(), -1, self.latency)
+        try:
+            while not self.done.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            self.timer.stop()
+            return session.record(completed=False)
+        self.timer.stop()
+        return session.record(completed=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a breathing session in the terminal.')
+    parser.add_argument('--preset', help='preset name (default presets unless --presets is given)')
+    parser.add_argument('--presets', help='presets.db or presets.json to look the preset up in')
+    parser.add_argument('--start', type=float, nargs=4, metavar='S', help='start cycle: inhale hold exhale hold')
+    parser.add_argument('--end', type=float, nargs=4, metavar='S', help='end cycle (default: the start cycle)')
+    parser.add_argument('--duration', type=float, help='session length in seconds')
+    parser.add_argument('--cues', choices=('text', 'audio', 'both'), default='text')
+    parser.add_argument('--latency', type=float, default=0.0, help='start audio cues this many seconds early')
+    args = parser.parse_args(argv)
+
+    if args.preset:
+        preset = load_preset(args.preset, args.presets)
+        if preset is None:
+            parser.error(f"no preset named '{args.preset}'")
+        start, end, duration = preset
+    elif args.start:
+        start, end, duration = args.start, args.end or args.start, 5 * 60
+    else:
+        parser.error('give either --preset or --start')
+    if args.duration is not None:
+        duration = args.duration
+    session = BreathSession(start, end, clamp_duration(duration), use_numpy=False)
+    runner = TerminalRunner(session, text=args.cues != 'audio', audio=args.cues != 'text', latency=args.latency)
+    runner.run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+from session import ALLOW_INF, MAX_DURATION, UNBOUNDED, clamp_duration, is_unbounded, shows_infinity
+
+# What changed, as passed to subscribers.
+CYCLE_TIME = 'cycle_time'                # start_cycle_time and/or end_cycle_time
+SELECTED_DURATION = 'selected_duration'
+DURATION = 'duration'                    # the remaining time was set or dragged
+COUNTDOWN = 'countdown'                  # the remaining time ran down to a new second
+RUNNING = 'running'
+RAMP = 'ramp'                            # the running session's ramp was adapted
+FIELDS = frozenset({CYCLE_TIME, SELECTED_DURATION, DURATION, COUNTDOWN, RUNNING, RAMP})
+# The fields that end up in previous_state.json.
+PERSISTED = frozenset({CYCLE_TIME, SELECTED_DURATION})
+
+# ============================================================================
+# SessionModel
+# ----------------------------------------------------------------------------
+# The session settings that widgets show and edit: the start and end cycle
+# times, the selected and remaining duration, and whether a session runs.
+# The values live on the BreathSession (frames read them from there); every
+# change goes through the model, which applies the duration rules and notes
+# which fields changed.
+#
+# Subscribers are never called from a setter. The first change schedules a
+# notification (schedule(notify), e.g. before the next frame), which calls
+# each subscriber once with every field changed since the last one, however
+# many changes came in between. So a fast drag costs one refresh and one save
+# per frame, and a subscriber that updates a widget cannot cascade into the
+# others: changes it makes wait for the next notification.
+# ============================================================================
+class SessionModel:
+    def __init__(self, session, schedule):
+        self.session = session
+        self.schedule = schedule
+        self.running = False
+        self.changed = set()
+        self.subscribers = []
+
+    def subscribe(self, callback, fields=FIELDS):
+        """ Call callback(changed) after changes to any of fields """
+        self.subscribers.append((callback, frozenset(fields)))
+
+    def mark(self, *fields):
+        if not self.changed:
+            self.schedule(self.notify)
+        self.changed.update(fields)
+
+    def notify(self, *args):
+        changed, self.changed = self.changed, set()
+        if not changed:
+            return
+        for callback, fields in self.subscribers:
+            if changed & fields:
+                callback(changed)
+
+    def set_cycle_time(self, index, value):
+        # Setting one phase by hand makes the cycle static.
+        self.session.start_cycle_time[index] = value
+        self.session.end_cycle_time[index] = value
+        self.mark(CYCLE_TIME)
+
+    def set_cycle_times(self, start_cycle_time, end_cycle_time):
+        self.session.start_cycle_time = list(start_cycle_time)
+        self.session.end_cycle_time = list(end_cycle_time)
+        self.mark(CYCLE_TIME)
+
+    def set_duration(self, duration):
+        """ Set the remaining time; before a session, also the selected duration """
+        session = self.session
+        session.duration = float('inf') if shows_infinity(duration) else duration
+        self.mark(DURATION)
+        if not self.running:
+            session.selected_duration = duration
+            self.mark(SELECTED_DURATION)
+
+    def drag_duration(self, change):
+        """ Move the remaining time by change seconds, as a drag around the circle does """
+        duration = self.session.duration
+        if is_unbounded(duration) and change < 0:
+            duration = UNBOUNDED + change
+        elif is_unbounded(duration) and change > 0:
+            duration = UNBOUNDED
+        else:
+            duration += change
+        duration = clamp_duration(duration)
+        if is_unbounded(duration) and not ALLOW_INF:
+            duration = MAX_DURATION  # A drag stops at the longest session
+        self.set_duration(UNBOUNDED if is_unbounded(duration) else duration)
+
+    def select_duration(self, duration):
+        """ Set the selected duration and the remaining time with it """
+        self.session.selected_duration = duration
+        self.session.duration = duration
+        self.mark(SELECTED_DURATION, DURATION)
+
+    def restore_duration(self):
+        # After a session: the remaining time is the selected duration again.
+        self.session.duration = self.session.selected_duration
+        self.mark(DURATION)
+
+    def set_ramp_pace(self, pace):
+        """ Slow down (or restore) the rest of the running session's start→end ramp """
+        if not self.running:
+            return
+        session = self.session
+        session.set_ramp_pace(pace, session.session_time())
+        self.mark(RAMP)
+
+    def counted_down(self):
+        self.mark(COUNTDOWN)
+
+    def set_running(self, running):
+        if running != self.running:
+            self.running = running
+            self.mark(RUNNING)
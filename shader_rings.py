@@ -0,0 +1,117 @@
+from kivy.graphics import Color, Rectangle, RenderContext
+
+# The five rings of timeline.ring_radii, drawn per pixel. Radii are in percent
+# of half the widget's shorter side, like the ellipses; each ring is blended
+# over the ones before it, with a one-pixel soft edge.
+RING_FRAGMENT_SHADER = '''
+$HEADER$
+
+uniform float phase;
+uniform float progress;
+uniform vec2 quad_size;
+uniform vec4 ring_color0;
+uniform vec4 ring_color1;
+uniform vec4 ring_color2;
+uniform vec4 ring_color3;
+uniform vec4 ring_color4;
+
+float cub_intp(float x) {
+    if (x > 1.0) {
+        x = 2.0 - x;
+    }
+    return -2.0 * x * x * x + 3.0 * x * x;
+}
+
+vec4 over(vec4 below, vec4 color, float radius, float dist) {
+    float alpha = color.a * clamp(radius - dist + 0.5, 0.0, 1.0);
+    float out_alpha = alpha + below.a * (1.0 - alpha);
+    if (out_alpha <= 0.0) {
+        return vec4(0.0);
+    }
+    vec3 rgb = (color.rgb * alpha + below.rgb * below.a * (1.0 - alpha)) / out_alpha;
+    return vec4(rgb, out_alpha);
+}
+
+void main(void) {
+    float a = 75.0;
+    float b;
+    float c;
+    float d;
+    float e;
+    if (phase < 0.5) {
+        b = 75.0 - 50.0 * (1.0 - cub_intp(progress));
+        c = b;
+        d = b - 5.0;
+        e = d;
+    } else if (phase < 1.5) {
+        b = 75.0 + 15.0 * cub_intp(progress * 2.0);
+        c = 75.0;
+        d = 70.0;
+        e = 70.0;
+    } else if (phase < 2.5) {
+        b = 75.0 - 50.0 * cub_intp(progress);
+        c = b;
+        d = b - 5.0;
+        e = d;
+    } else {
+        b = 25.0;
+        c = 25.0;
+        d = 20.0;
+        e = 20.0 - 10.0 * cub_intp(progress * 2.0);
+    }
+    float scale = min(quad_size.x, quad_size.y) / 200.0;
+    float dist = length((tex_coord0 - 0.5) * quad_size);
+    vec4 color = vec4(0.0);
+    color = over(color, ring_color0, a * scale, dist);
+    color = over(color, ring_color1, b * scale, dist);
+    color = over(color, ring_color2, c * scale, dist);
+    color = over(color, ring_color3, d * scale, dist);
+    color = over(color, ring_color4, e * scale, dist);
+    gl_FragColor = vec4(color.rgb, color.a * frag_color.a);
+}
+'''
+
+# ============================================================================
+# ShaderRings
+# ----------------------------------------------------------------------------
+# Alternative renderer for AnimatedCircle: one quad over the widget, shaded
+# by RING_FRAGMENT_SHADER. A frame only sets the phase and progress uniforms
+# (and the quad size when the widget moves), so its cost does not depend on
+# the ring sizes, their tessellation or the screen resolution.
+#
+# `ok` is False when the shader did not compile (e.g. no usable GL), in which
+# case the caller keeps drawing the ellipses.
+# ============================================================================
+class ShaderRings:
+    # Nothing moves between ring changes.
+    always_moving = False
+
+    def __init__(self, widget, colors):
+        self.widget = widget
+        self.context = RenderContext(use_parent_projection=True, use_parent_modelview=True,
+                                     use_parent_frag_modelview=True)
+        self.context.shader.fs = RING_FRAGMENT_SHADER
+        self.ok = bool(self.context.shader.success)
+        with self.context:
+            Color(1, 1, 1, 1)
+            self.quad = Rectangle(pos=widget.pos, size=widget.size)
+        for i, color in enumerate(colors):
+            self.context[f'ring_color{i}'] = [float(v) for v in color]
+        self.drawn = None
+
+    def attach(self):
+        self.widget.canvas.add(self.context)
+        self.drawn = None
+
+    def detach(self):
+        self.widget.canvas.remove(self.context)
+
+    def update(self, phase, progress, resized=False, cycle_progress=0):
+        if resized:
+            self.quad.pos = self.widget.pos
+            self.quad.size = self.widget.size
+            self.context['quad_size'] = [float(self.widget.width), float(self.widget.height)]
+        if (phase, progress) != self.drawn:
+            self.drawn = (phase, progress)
+            self.context['phase'] = float(phase)
+            self.context['progress'] = float(progress)
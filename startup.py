@@ -0,0 +1,89 @@
+import builtins
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# BREATHE3_STARTUP_PROFILE=1 prints a cold-start report once the first frame is
+# up; =exit also quits at that point, with status 1 if the budget was exceeded.
+# Unset, empty or 0 leaves profiling off.
+STARTUP_BUDGET_MS = 1500
+
+# ============================================================================
+# StartupProfiler
+# ----------------------------------------------------------------------------
+# Records how long each top-level import, widget build and file read takes
+# until the first frame. Imports are timed by wrapping __import__ from the
+# moment this module is imported until end_imports(); nested imports are
+# charged to the top-level import that triggered them.
+# ============================================================================
+class StartupProfiler:
+    def __init__(self, mode=None, budget_ms=STARTUP_BUDGET_MS):
+        self.mode = mode
+        self.enabled = mode not in (None, '', '0')
+        self.budget_ms = budget_ms
+        self.origin = time.perf_counter()
+        self.entries = []
+        self.total_ms = None
+        self.original_import = None
+        if self.enabled:
+            self.start_imports()
+
+    def record(self, kind, name, start):
+        self.entries.append((kind, name, (start - self.origin) * 1000, (time.perf_counter() - start) * 1000))
+
+    def start_imports(self):
+        original_import = self.original_import = builtins.__import__
+        depth = [0]
+
+        def traced_import(name, *args, **kwargs):
+            if depth[0]:
+                return original_import(name, *args, **kwargs)
+            depth[0] += 1
+            start = time.perf_counter()
+            try:
+                return original_import(name, *args, **kwargs)
+            finally:
+                depth[0] -= 1
+                self.record('import', name, start)
+        builtins.__import__ = traced_import
+
+    def end_imports(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    @contextmanager
+    def section(self, kind, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, start)
+
+    def first_frame(self):
+        """ Close the report; returns False if the startup budget was exceeded """
+        self.end_imports()
+        if self.total_ms is None:
+            self.total_ms = (time.perf_counter() - self.origin) * 1000
+        return self.total_ms <= self.budget_ms
+
+    def report(self):
+        lines = [f'{duration:8.1f} ms  {kind:<6}  {name}' for kind, name, start, duration in self.entries]
+        lines.append(f'{self.total_ms:8.1f} ms  total to first frame (budget {self.budget_ms} ms)')
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'total_ms': self.total_ms,
+                'budget_ms': self.budget_ms,
+                'entries': [{'kind': kind, 'name': name, 'start_ms': start, 'duration_ms': duration}
+                            for kind, name, start, duration in self.entries],
+            }, f, indent=1)
+
+profiler = StartupProfiler(os.environ.get('BREATHE3_STARTUP_PROFILE'),
+                           float(os.environ.get('BREATHE3_STARTUP_BUDGET_MS', STARTUP_BUDGET_MS)))
@@ -0,0 +1,61 @@
+import datetime
+import time
+
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.popup import Popup
+
+RECENT_SESSIONS = 10
+TOP_PRESETS = 5
+
+def format_minutes(seconds):
+    minutes = int((seconds + 30) // 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours} h {minutes} min' if hours else f'{minutes} min'
+
+def session_line(record):
+    started = time.strftime('%Y-%m-%d %H:%M', time.localtime(record.started_at))
+    planned = '∞' if record.planned == float('inf') else format_minutes(record.planned)
+    outcome = 'completed' if record.completed else 'stopped'
+    preset = record.preset or '-'.join(str(int(v)) for v in record.start_cycle)
+    return f'{started}  {preset}  {format_minutes(record.actual)} / {planned}  {record.breaths} breaths  {outcome}'
+
+# ============================================================================
+# StatsPopup
+# ----------------------------------------------------------------------------
+# Totals, streaks and per-preset minutes come straight from the aggregates the
+# history keeps up to date, and the recent sessions are the last few records
+# of the log, so opening this costs the same after a week or after years.
+# ============================================================================
+class StatsPopup(Popup):
+    def __init__(self, history, **kwargs):
+        super().__init__(**kwargs)
+        self.title = 'Statistics'
+        self.size_hint = (0.9, 0.8)
+        self.pos_hint = {'top': 1}
+        stats = history.snapshot()
+        today = datetime.date.today()
+        week = [today - datetime.timedelta(days=i) for i in range(6, -1, -1)]
+        self.layout = BoxLayout(orientation='vertical', spacing=5)
+        self.add_line(f'Sessions: {stats.sessions}    Total: {format_minutes(stats.seconds)}    Breaths: {stats.breaths}', bold=True)
+        self.add_line(f'Streak: {stats.current_streak(today)} days    Longest: {stats.longest_streak} days')
+        self.add_line(f'Today: {format_minutes(stats.day_seconds(today))}    '
+                      f'Last 7 days: {format_minutes(sum(stats.day_seconds(day) for day in week))}')
+        self.add_line('   '.join(f"{day.strftime('%a')} {int((stats.day_seconds(day) + 30) // 60)}" for day in week))
+        top_presets = sorted(stats.presets.items(), key=lambda item: -item[1])[:TOP_PRESETS]
+        if top_presets:
+            self.add_line('Presets', bold=True)
+            for name, seconds in top_presets:
+                self.add_line(f'{name}: {format_minutes(seconds)}')
+        recent = history.recent(RECENT_SESSIONS)
+        if recent:
+            self.add_line('Recent sessions', bold=True)
+            for record in recent:
+                self.add_line(session_line(record))
+        self.layout.add_widget(BoxLayout())  # Keeps the lines at the top
+        self.content = self.layout
+
+    def add_line(self, text, bold=False):
+        label = Label(text=text, bold=bold, size_hint_y=None, height=40, halign='left', valign='middle')
+        label.bind(size=label.setter('text_size'))
+        self.layout.add_widget(label)
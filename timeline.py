@@ -0,0 +1,216 @@
+import bisect
+import math
+from collections import namedtuple
+
+# NumPy is only used to vectorise the compilation of long sessions; the lookup
+# path is plain Python so that frames stay cheap with or without it. Importing
+# it takes longer than compiling a typical session, so that waits until a
+# session is compiled.
+np = None
+numpy_checked = False
+
+def get_numpy():
+    global np, numpy_checked
+    if not numpy_checked:
+        # Threads may ask at once (the preset previews are rendered by a
+        # worker): mark it checked only once np is set, the import system
+        # makes the others wait for the import meanwhile.
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        numpy_checked = True
+    return np
+
+PHASES = 4
+
+def sin_intp(x):
+    return (1-math.cos(x*math.pi))/2
+
+def cub_intp(x):
+    if x > 1:
+        x = 2-x
+    return -2*x**3+3*x**2
+
+def ring_radii(phase, x):
+    """ Radii (in percent of the half-extent) of the five rings at progress x of a phase """
+    if phase == 0:
+        radius_b = 75 - 50 * (1 - cub_intp(x))
+        return 75, radius_b, radius_b, radius_b - 5, radius_b - 5
+    if phase == 1:
+        return 75, 75 + 15 * cub_intp(x * 2), 75, 75 - 5, 75 - 5
+    if phase == 2:
+        radius_b = 75 - 50 * cub_intp(x)
+        return 75, radius_b, radius_b, radius_b - 5, radius_b - 5
+    return 75, 25, 25, 25 - 5, 20 - 10 * cub_intp(x * 2)
+
+TimelineState = namedtuple('TimelineState', 'phase progress cycle segment start end radii')
+
+# ============================================================================
+# BreathTimeline
+# ----------------------------------------------------------------------------
+# A whole session compiled into phase boundaries. Every phase of every cycle is
+# a segment; segment k is phase k % 4 of cycle k // 4 and its length is the
+# start→end interpolation evaluated at the moment the phase begins. Zero-length
+# phases are kept as empty segments so the phase index stays implicit.
+#
+# Before the origin the start cycle repeats, after the last compiled cycle the
+# end cycle repeats, so any session time (including a seek past the planned
+# duration) maps to a phase by binary search.
+#
+# The ramp goes from start (factor 0) to end (factor 1) in step with the
+# session time, unless `ramp` gives other (time, factor) knots to interpolate
+# between, e.g. to slow it down from some point on (see
+# BreathSession.set_ramp_pace).
+# ============================================================================
+class BreathTimeline:
+    def __init__(self, start_cycle_time, end_cycle_time, duration, origin=0, use_numpy=True, ramp=None):
+        self.start_cycle_time = [float(v) for v in start_cycle_time]
+        self.end_cycle_time = [float(v) for v in end_cycle_time]
+        self.duration = duration
+        self.origin = origin
+        self.ramp = ramp
+        self.ramp_times = [knot[0] for knot in ramp] if ramp else None
+        self.key = self.make_key(start_cycle_time, end_cycle_time, duration, origin, ramp)
+        if duration == float('inf') or duration <= 0:
+            # No ramp: the factor is always 0, so the start cycle repeats forever.
+            self.end_cycle_time = self.start_cycle_time
+            self.starts = [origin]
+        elif use_numpy and self.can_vectorise() and get_numpy() is not None:
+            self.starts = self.compile_numpy()
+        else:
+            self.starts = self.compile_python()
+        self.prefix_end = self.starts[-1]
+        self.breath_count = (len(self.starts) - 1) // PHASES
+        self.tail_length = sum(self.end_cycle_time)
+        self.head_length = sum(self.start_cycle_time)
+
+    @staticmethod
+    def make_key(start_cycle_time, end_cycle_time, duration, origin=0, ramp=None):
+        return tuple(start_cycle_time), tuple(end_cycle_time), duration, origin, ramp
+
+    def ramp_factor(self, t):
+        """ How far along the start→end ramp the cycle is at session time t, from 0 to 1 """
+        if self.ramp is None:
+            return min(1, max(0, t / self.duration))
+        k = bisect.bisect_right(self.ramp_times, t)
+        if k == 0:
+            return self.ramp[0][1]
+        if k == len(self.ramp):
+            return self.ramp[-1][1]
+        (t0, f0), (t1, f1) = self.ramp[k - 1], self.ramp[k]
+        return f0 + (f1 - f0) * (t - t0) / (t1 - t0)
+
+    def phase_time(self, phase, t):
+        factor = self.ramp_factor(t)
+        s = self.start_cycle_time[phase]
+        return s + (self.end_cycle_time[phase] - s) * factor
+
+    def can_vectorise(self):
+        # Closed form below needs every phase map t -> a + (1 + b)t to be
+        # increasing, and a positive lower bound on the cycle length; a
+        # ramp with knots is compiled phase by phase.
+        if self.ramp is not None:
+            return False
+        duration = self.duration
+        if any(e - s <= -duration for s, e in zip(self.start_cycle_time, self.end_cycle_time)):
+            return False
+        return self.min_cycle_length() > 0 and 0 <= self.origin < duration
+
+    def min_cycle_length(self):
+        return sum(min(s, e) for s, e in zip(self.start_cycle_time, self.end_cycle_time))
+
+    def compile_python(self):
+        starts = [self.origin]
+        t = self.origin
+        # Guard against ramps towards an all-zero cycle, which would otherwise
+        # never reach the end of the session.
+        max_segments = PHASES * int(self.duration * 60 + 1)
+        while t < self.duration and len(starts) <= max_segments:
+            for phase in range(PHASES):
+                t += self.phase_time(phase, t)
+                starts.append(t)
+        return starts
+
+    def compile_numpy(self):
+        # During the ramp each phase maps its start time t to a + (1 + b)t, so a
+        # cycle is the affine map t -> A t + B and the n-th cycle starts at
+        # A^n origin + B (A^n - 1) / (A - 1).
+        duration = self.duration
+        start = np.array(self.start_cycle_time)
+        slope = 1 + (np.array(self.end_cycle_time) - start) / duration
+        A, B = 1.0, 0.0
+        for a, b in zip(start, slope):
+            A, B = b * A, b * B + a
+        cycles = int(math.ceil((duration - self.origin) / self.min_cycle_length())) + 1
+        n = np.arange(max(cycles, 1), dtype=float)
+        if abs(A - 1) < 1e-12:
+            cycle_starts = self.origin + B * n
+        else:
+            powers = A ** n
+            cycle_starts = powers * self.origin + B * (powers - 1) / (A - 1)
+        # Only cycles that begin before the end of the session are part of it.
+        cycle_starts = cycle_starts[:max(1, int(np.searchsorted(cycle_starts, duration)))]
+        segments = np.empty((len(cycle_starts), PHASES + 1))
+        segments[:, 0] = t = cycle_starts
+        for phase in range(PHASES):
+            t = np.where(t < duration, start[phase] + slope[phase] * t, t + self.end_cycle_time[phase])
+            segments[:, phase + 1] = t
+        starts = segments[:, :PHASES].ravel().tolist()
+        starts.append(float(segments[-1, PHASES]))
+        return starts
+
+    def locate(self, t):
+        """ Return (segment, start, end) for session time t """
+        starts = self.starts
+        if t < self.origin:
+            return self.locate_periodic(t, self.origin, self.start_cycle_time, self.head_length, 0)
+        if t >= self.prefix_end:
+            return self.locate_periodic(t, self.prefix_end, self.end_cycle_time, self.tail_length,
+                                        len(starts) - 1)
+        k = bisect.bisect_right(starts, t) - 1
+        return k, starts[k], starts[k + 1]
+
+    @staticmethod
+    def locate_periodic(t, anchor, cycle_time, cycle_length, first_segment):
+        if cycle_length <= 0:
+            return first_segment, anchor, anchor
+        cycle, offset = divmod(t - anchor, cycle_length)
+        start = anchor + cycle * cycle_length
+        for phase, length in enumerate(cycle_time):
+            if offset < length:
+                break
+            offset -= length
+            start += length
+        return first_segment + int(cycle) * PHASES + phase, start, start + length
+
+    def state(self, t):
+        k, start, end = self.locate(t)
+        phase = k % PHASES
+        progress = (t - start) / (end - start) if end > start else 0
+        return TimelineState(phase, progress, k // PHASES, k, start, end, ring_radii(phase, progress))
+
+    def cycle_progress(self, t, state):
+        """ How far (0 to 1) session time t is into the cycle of its TimelineState """
+        phase = state.phase
+        base = state.segment - phase
+        starts = self.starts
+        if 0 <= base and base + PHASES < len(starts):
+            cycle_start, cycle_end = starts[base], starts[base + PHASES]
+        else:
+            # A repeat of the start or end cycle, before the origin or after the compiled ones
+            lengths = self.start_cycle_time if base < 0 else self.end_cycle_time
+            cycle_start = state.start - sum(lengths[:phase])
+            cycle_end = cycle_start + sum(lengths)
+        return (t - cycle_start) / (cycle_end - cycle_start) if cycle_end > cycle_start else 0
+
+    def next_boundary(self, t):
+        return self.locate(t)[2]
+
+    def phase_durations(self, cycle):
+        """ Lengths of the four phases of a compiled cycle """
+        starts = self.starts
+        base = cycle * PHASES
+        if base + PHASES < len(starts):
+            return [starts[base + p + 1] - starts[base + p] for p in range(PHASES)]
+        return list(self.end_cycle_time)